@@ -0,0 +1,330 @@
+"""Async HTTP/JSON service for ingest, search and answer
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+Against local stub models instead of Ollama:
+
+    python -m utils.stub_backends --port 11435 &
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 uvicorn api:app --port 8000
+
+Uses the same vector store, retrieval, context and RAG chain components as
+the Streamlit app, shared by every request in the process.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from utils.vectorstore import get_embeddings, init_vectorstore, refresh_vectorstore
+from utils.rag_chain import setup_rag_chain
+from utils.memory_store import UserMemoryStore
+from utils.retrieval import RetrievalCoordinator, QueryEmbeddingCache, search_documents_by_vector
+from utils.query_batcher import QueryBatcher
+from utils.context_builder import build_context
+from utils.answer_cache import get_answer_cache, retrieval_key, GLOBAL_SCOPE, ANSWER_CACHE_ENABLED
+from utils.doc_registry import fingerprint_bytes, get_registry
+from utils.ingest import ingest_registered_pdf
+from utils.metrics import registry as metrics_registry, observe_stage, timed
+from utils.llm_scheduler import get_scheduler, ClientDisconnected, SchedulerOverloaded, LLM_GENERATION_TIMEOUT
+from app.db import save_chat
+
+logger = logging.getLogger("api")
+
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", 8000))
+API_MAX_CONCURRENT_SEARCHES = int(os.getenv("API_MAX_CONCURRENT_SEARCHES", 32))
+API_MAX_CONCURRENT_INGESTS = int(os.getenv("API_MAX_CONCURRENT_INGESTS", 1))
+# Seconds a request may wait for a free slot before it is turned away with 503
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", 2.0))
+API_REFRESH_INTERVAL = float(os.getenv("API_REFRESH_INTERVAL", 10))
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+SEARCH_TYPES = ("similarity", "mmr", "similarity_score_threshold", "hybrid")
+
+rejected = metrics_registry.counter("rag_api_rejected_total", "Requests turned away because a limit was reached")
+
+
+class Limiter:
+    """Bounded concurrency with a short wait, then fast rejection"""
+
+    def __init__(self, name: str, limit: int, timeout: float = API_QUEUE_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> None:
+        if not self._semaphore.locked():
+            # A slot is free, so this returns without waiting
+            await self._semaphore.acquire()
+            return
+        if self.timeout > 0:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+                return
+            except asyncio.TimeoutError:
+                pass
+        rejected.inc(limit=self.name)
+        raise HTTPException(status_code=503, detail=f"Too many concurrent {self.name} requests",
+                            headers={"Retry-After": "1"})
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class Service:
+    """Process-wide components shared by all requests"""
+
+    def __init__(self):
+        self.embeddings = get_embeddings()
+        self.vector_store = init_vectorstore(embeddings=self.embeddings)
+        self.rag_chain = setup_rag_chain()
+        self.memory_store = UserMemoryStore(self.embeddings)
+        self.memory_store.start_maintenance()
+        self.query_cache = QueryEmbeddingCache()
+        self.batcher = QueryBatcher(self.embeddings)
+        self.searches = Limiter("search", API_MAX_CONCURRENT_SEARCHES)
+        # Generations are admitted by the process-wide scheduler shared with the UI
+        self.scheduler = get_scheduler()
+        self.ingests = Limiter("ingest", API_MAX_CONCURRENT_INGESTS, timeout=0)
+        self._background = set()
+
+    @property
+    def coordinator(self) -> RetrievalCoordinator:
+        return RetrievalCoordinator(self.vector_store, self.memory_store, query_cache=self.query_cache)
+
+    async def embed_query(self, question: str) -> List[float]:
+        vector = self.query_cache.get(question)
+        if vector is None:
+            with timed("query_embed"):
+                vector = await self.batcher.embed(question)
+            self.query_cache.put(question, vector)
+        return vector
+
+    def run_in_background(self, fn, *args, **kwargs) -> None:
+        """Fire-and-forget blocking work (chat log, memory, answer cache) after the response"""
+        task = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        task.add_done_callback(lambda t: t.cancelled() or not t.exception() or logger.error(
+            f"Background task {getattr(fn, '__name__', fn)} failed: {t.exception()}"
+        ))
+
+    async def refresh_loop(self) -> None:
+        """Pick up snapshots published by bulk ingest or another process"""
+        while True:
+            await asyncio.sleep(API_REFRESH_INTERVAL)
+            try:
+                refreshed = await asyncio.to_thread(refresh_vectorstore, self.vector_store)
+                if refreshed is not self.vector_store:
+                    logger.info(f"Serving new index snapshot {refreshed.snapshot}")
+                    self.vector_store = refreshed
+            except Exception as e:
+                logger.warning(f"Index refresh failed: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    service = await asyncio.to_thread(Service)
+    app.state.service = service
+    refresher = asyncio.ensure_future(service.refresh_loop())
+    logger.info(f"API ready in {time.perf_counter() - started:.2f}s ({service.vector_store.index.ntotal} vectors)")
+    try:
+        yield
+    finally:
+        refresher.cancel()
+
+
+app = FastAPI(title="Multimodal PDF Assistant API", lifespan=lifespan)
+
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    k: int = Field(4, ge=1, le=50)
+    search_type: str = "similarity"
+
+
+class AnswerRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    user_id: str = "anonymous"
+    k: int = Field(2, ge=1, le=20)
+    search_type: str = "similarity"
+    stream: bool = True
+
+
+def _check_search_type(search_type: str) -> None:
+    if search_type not in SEARCH_TYPES:
+        raise HTTPException(status_code=422, detail=f"search_type must be one of {', '.join(SEARCH_TYPES)}")
+
+
+def _document_json(doc) -> dict:
+    return {"content": doc.page_content, "metadata": doc.metadata}
+
+
+@app.get("/health")
+async def health(request: Request):
+    service = request.app.state.service
+    return {
+        "status": "ok",
+        "vectors": service.vector_store.index.ntotal,
+        "snapshot": getattr(service.vector_store, "snapshot", None),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return metrics_registry.render()
+
+
+@app.post("/ingest")
+async def ingest(request: Request, filename: str = Query(..., description="Original file name, used as the source")):
+    """Index the PDF sent as the raw request body"""
+    service = request.app.state.service
+    if not filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=415, detail="Only PDFs are supported")
+    data = await request.body()
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty request body")
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large. Max size: 50MB")
+
+    doc_hash = fingerprint_bytes(data)
+    async with service.ingests:
+        started = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix="api-ingest-") as tmp_dir:
+            path = os.path.join(tmp_dir, os.path.basename(filename))
+            with open(path, "wb") as f:
+                f.write(data)
+            try:
+                chunk_ids, skipped = await asyncio.to_thread(
+                    ingest_registered_pdf, service.vector_store, path, source=filename, doc_hash=doc_hash
+                )
+            except Exception as e:
+                logger.error(f"Ingest of {filename} failed: {str(e)}")
+                raise HTTPException(status_code=422, detail=f"Processing failed: {str(e)}")
+        elapsed = time.perf_counter() - started
+    if not skipped:
+        observe_stage("upload", elapsed, document=filename)
+    return {"doc_hash": doc_hash, "chunks": len(chunk_ids), "skipped": skipped, "seconds": round(elapsed, 3)}
+
+
+@app.post("/search")
+async def search(body: SearchRequest, request: Request):
+    service = request.app.state.service
+    _check_search_type(body.search_type)
+    async with service.searches:
+        vector = await service.embed_query(body.query)
+        with timed("search", search_type=body.search_type):
+            docs = await asyncio.to_thread(
+                search_documents_by_vector, service.vector_store, body.query, vector, body.search_type, body.k
+            )
+    return {"results": [_document_json(doc) for doc in docs]}
+
+
+@app.post("/answer")
+async def answer(body: AnswerRequest, request: Request):
+    service = request.app.state.service
+    _check_search_type(body.search_type)
+    question = body.question
+
+    async with service.searches:
+        vector = await service.embed_query(question)
+        if ANSWER_CACHE_ENABLED:
+            answer_cache = get_answer_cache()
+            doc_fingerprint = get_registry().fingerprint()
+            retrieval = retrieval_key(body.search_type, body.k)
+            cached = answer_cache.lookup(vector, doc_fingerprint, scope=body.user_id, retrieval=retrieval)
+            if cached:
+                service.run_in_background(
+                    save_chat, body.user_id, question, cached["answer"], cached["context"], "api"
+                )
+                if body.stream:
+                    return StreamingResponse(iter([cached["answer"]]), media_type="text/plain",
+                                             headers={"X-Answer-Cache": "hit"})
+                return {"answer": cached["answer"], "cached": True, "sources": []}
+        memory_docs, doc_chunks = await asyncio.to_thread(
+            service.coordinator.retrieve, question, body.user_id, body.search_type, body.k, vector=vector
+        )
+    combined_docs = memory_docs + doc_chunks
+    context, context_docs, _ = build_context(combined_docs, question)
+    inputs = {"question": question, "context": context}
+
+    def remember(answer_text: str) -> None:
+        save_chat(body.user_id, question, answer_text, context, "api")
+        if ANSWER_CACHE_ENABLED:
+            # Answers that used someone's chat memory stay private to them
+            personal = any("user_id" in doc.metadata for doc in combined_docs)
+            answer_cache.store(question, vector, doc_fingerprint, answer_text, context,
+                               scope=body.user_id if personal else GLOBAL_SCOPE, retrieval=retrieval)
+        service.memory_store.add(body.user_id, question, answer_text)
+
+    # Take the generation slot before responding so overload is a clean 503
+    try:
+        ticket = await service.scheduler.acquire(body.user_id, is_disconnected=request.is_disconnected)
+    except SchedulerOverloaded as e:
+        rejected.inc(limit="answer")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except ClientDisconnected:
+        # Nobody is listening; 499 is nginx's "client closed request"
+        return PlainTextResponse("Client closed request", status_code=499)
+    if not body.stream:
+        try:
+            started = time.perf_counter()
+            answer_text = await asyncio.wait_for(service.rag_chain.ainvoke(inputs), LLM_GENERATION_TIMEOUT)
+            observe_stage("generation", time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Answer generation timed out")
+        finally:
+            service.scheduler.release(ticket)
+        service.run_in_background(remember, answer_text)
+        return {"answer": answer_text, "cached": False, "sources": [_document_json(doc) for doc in context_docs]}
+
+    async def tokens():
+        started = time.perf_counter()
+        deadline = started + LLM_GENERATION_TIMEOUT
+        stream = service.rag_chain.astream(inputs).__aiter__()
+        parts = []
+        completed = False
+        timed_out = False
+        try:
+            while True:
+                try:
+                    token = await asyncio.wait_for(stream.__anext__(), deadline - time.perf_counter())
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    logger.error(f"Generation exceeded {LLM_GENERATION_TIMEOUT:.0f}s, truncating the stream")
+                    timed_out = True
+                    break
+                if not parts:
+                    observe_stage("generation_first_token", time.perf_counter() - started)
+                parts.append(token)
+                yield token
+            completed = not timed_out
+        finally:
+            # Also reached when the client disconnects mid-stream
+            service.scheduler.release(ticket)
+            if completed:
+                observe_stage("generation", time.perf_counter() - started)
+                service.run_in_background(remember, "".join(parts))
+
+    return StreamingResponse(tokens(), media_type="text/plain")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    uvicorn.run(app, host=API_HOST, port=API_PORT)
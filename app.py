@@ -1,6 +1,11 @@
 import os
-import asyncio
 import time
+from utils.import_profile import start_import_profile, stop_import_profile, mark, write_import_profile
+
+# Time every import from here on; heavy stacks load lazily on first use
+start_import_profile()
+
+import asyncio
 import nest_asyncio
 import streamlit as st
 
@@ -8,13 +13,12 @@ import streamlit as st
 st.set_page_config(page_title="Multimodal PDF Assistant", page_icon="📄", layout="centered")
 
 # Import app modules
-from app.helper import logger, monitor, get_or_create_user_id
-from app.core import initialize_system
+from app.helper import logger, monitor, get_or_create_user_id, configure_logging
+from app.core import initialize_system, get_system_registry
 from app.cleanup import cleanup_resources
 from app.ui import sidebar_controls, show_chat_history
 from app.file_handler import handle_pdf_upload
 from app.chat import handle_chat
-from app.memory import embed_chat_to_vector_db
 
 # Async patching
 nest_asyncio.apply()
@@ -31,6 +35,7 @@ def main():
         st.session_state.debug_mode = True
 
     st.title("📄 Multimodal PDF Assistant")
+    mark("first_render")
 
     # Session user ID
     user_id = get_or_create_user_id()
@@ -39,13 +44,24 @@ def main():
         st.write(f"Debug Mode ON | User ID: {user_id}")
 
     # Sidebar settings
-    temperature, num_results, search_type = sidebar_controls()
+    temperature, num_results, search_type, stream_answers = sidebar_controls()
 
-    # Initialize RAG + vector store
-    system_objects = initialize_system()
+    # Show previous chat history (database only, so it renders before the models load)
+    show_chat_history()
+
+    # Shared RAG + vector store, created once per process
+    with st.spinner("Loading models..."):
+        system_objects = initialize_system()
     if not system_objects:
         st.error("❌ System initialization failed")
         return
+    mark("system_ready")
+    # Startup is over; later imports should not pay for the timing hook
+    stop_import_profile()
+    if get_system_registry().ready:
+        st.sidebar.caption("✅ Models ready")
+    else:
+        st.sidebar.caption("⏳ Models warming up, the first answer may be slower")
 
     retriever, rag_chain, vector_store = system_objects
     st.session_state.update({
@@ -54,31 +70,23 @@ def main():
         "vector_store": vector_store
     })
 
-    # Show previous chat history
-    show_chat_history()
-
     # File upload + chunking
     uploaded_file = handle_pdf_upload(vector_store, num_results, search_type)
 
-    # Handle chat (Q&A logic)
-    question, answer = handle_chat(
+    # Handle chat (Q&A logic, including the memory write)
+    handle_chat(
         retriever=retriever,
         rag_chain=rag_chain,
         uploaded_file=uploaded_file,
-        vector_store=vector_store  # ✅ embed into vectorstore here
+        vector_store=vector_store,
+        stream=stream_answers,
+        search_type=search_type,
+        num_results=num_results
     )
 
-    # ✅ Save Q&A pair into vector store to enable recall
-    if question and answer:
-        embed_chat_to_vector_db(
-            vector_store=vector_store,
-            question=question,
-            answer=answer,
-            user_id=user_id
-        )
-
 
 if __name__ == "__main__":
+    configure_logging()
     monitor.start_time = time.time()
     try:
         if os.name == 'nt':
@@ -95,6 +103,7 @@ if __name__ == "__main__":
     finally:
         try:
             cleanup_resources()
+            write_import_profile()
             logger.info(f"🧹 Session completed in {time.time() - monitor.start_time:.2f}s")
         except Exception as e:
             logger.error(f"Cleanup error: {str(e)}")
\ No newline at end of file
@@ -4,55 +4,142 @@ import asyncio
 import streamlit as st
 from app.helper import logger
 from app.db import save_chat
-from app.memory import embed_chat_to_vector_db
+from app.memory import embed_chat_to_vector_db, get_memory_store
+from utils.answer_cache import get_answer_cache, retrieval_key, GLOBAL_SCOPE, ANSWER_CACHE_ENABLED
+from utils.metrics import observe_stage
+from utils.llm_scheduler import get_scheduler, SchedulerOverloaded, LLM_GENERATION_TIMEOUT
 
 
-def handle_chat(retriever, rag_chain, uploaded_file, vector_store=None):
+async def stream_answer(rag_chain, inputs, placeholder):
+    """Render tokens into the placeholder as they arrive and return the full answer"""
+    start_time = time.perf_counter()
+    first_token_time = None
+    answer = ""
+    async for token in rag_chain.astream(inputs):
+        if first_token_time is None:
+            first_token_time = time.perf_counter() - start_time
+            observe_stage("generation_first_token", first_token_time)
+            logger.info(f"Time to first token: {first_token_time:.2f}s")
+        answer += token
+        placeholder.markdown(answer + "▌")
+    placeholder.markdown(answer)
+    elapsed = time.perf_counter() - start_time
+    observe_stage("generation", elapsed)
+    logger.info(f"Generation completed in {elapsed:.2f}s (streamed)")
+    return answer
+
+
+def handle_chat(retriever, rag_chain, uploaded_file, vector_store=None, stream=True,
+                search_type="similarity", num_results=2):
     if 'retriever' not in st.session_state:
         return None, None
 
     question = st.chat_input("Ask about the document...")
     if question:
+        from utils.doc_registry import get_registry
+        from utils.context_builder import build_context
+        from utils.retrieval import RetrievalCoordinator
+
         with st.spinner("🧠 Generating answer..."):
             try:
                 start_time = time.time()
+                user_id = st.session_state.get("user_id", "anonymous")
+                source_file = uploaded_file.name if uploaded_file else "N/A"
+                coordinator = RetrievalCoordinator(vector_store, get_memory_store())
 
-                # 1. Search chat memory (similar previous Q&A)
-                memory_docs = vector_store.similarity_search(question, k=2) if vector_store else []
+                # 0. Serve near-duplicate questions from the semantic answer cache
+                if ANSWER_CACHE_ENABLED and vector_store:
+                    answer_cache = get_answer_cache()
+                    doc_fingerprint = get_registry().fingerprint()
+                    question_vector = coordinator.embed_query(question)
+                    retrieval = retrieval_key(search_type, num_results)
+                    cached = answer_cache.lookup(question_vector, doc_fingerprint, scope=user_id, retrieval=retrieval)
+                    if cached:
+                        logger.info(f"Answer cache hit (similarity {cached['similarity']:.3f})")
+                        st.chat_message("assistant").write(cached["answer"])
+                        st.caption("⚡ Answered from cache")
+                        save_chat(
+                            user_id=user_id,
+                            question=question,
+                            answer=cached["answer"],
+                            context=cached["context"],
+                            source_file=source_file
+                        )
+                        return question, cached["answer"]
 
-                # 2. Search document chunks (e.g., from PDF)
-                doc_chunks = st.session_state.retriever.invoke(question)
+                # 1-2. Embed once, then search this user's chat memory and the
+                # document chunks concurrently with the shared query vector
+                memory_docs, doc_chunks = coordinator.retrieve(
+                    question, user_id, search_type=search_type, k=num_results
+                )
                 combined_docs = memory_docs + doc_chunks
 
-                # 3. Create context for LLM
-                context = "\n\n".join([doc.page_content for doc in combined_docs])
+                # 3. Create context for LLM: merge overlaps, dedupe, fit the token budget
+                context, context_docs, context_stats = build_context(combined_docs, question)
+
+                # 4. Generate answer via RAG, waiting our turn behind other sessions
+                inputs = {"question": question, "context": context}
+                placeholder = st.chat_message("assistant").empty()
 
-                # 4. Generate answer via RAG
-                answer = asyncio.run(rag_chain.ainvoke({"question": question, "context": context}))
-                st.chat_message("assistant").write(answer)
+                def show_queue(queued, waited):
+                    # Raises once the browser session is gone, which drops us from the queue
+                    placeholder.caption(f"⏳ Waiting for the model ({queued} queued, {waited:.0f}s)")
+
+                with get_scheduler().slot(user_id, on_wait=show_queue):
+                    if stream:
+                        answer = asyncio.run(asyncio.wait_for(
+                            stream_answer(rag_chain, inputs, placeholder), LLM_GENERATION_TIMEOUT
+                        ))
+                    else:
+                        generation_start = time.perf_counter()
+                        answer = asyncio.run(asyncio.wait_for(rag_chain.ainvoke(inputs), LLM_GENERATION_TIMEOUT))
+                        generation_time = time.perf_counter() - generation_start
+                        observe_stage("generation", generation_time)
+                        logger.info(f"Generation completed in {generation_time:.2f}s")
+                        placeholder.markdown(answer)
 
                 # 5. Save to DB
-                user_id = st.session_state.get("user_id", "anonymous")
                 save_chat(
                     user_id=user_id,
                     question=question,
                     answer=answer,
                     context=context,
-                    source_file=uploaded_file.name if uploaded_file else "N/A"
+                    source_file=source_file
                 )
 
-                # 6. Embed to vectorstore for memory
-                if vector_store:
-                    embed_chat_to_vector_db(vector_store, question, answer, user_id=user_id)
+                # Answers that used someone's chat memory stay private to them
+                if ANSWER_CACHE_ENABLED and vector_store:
+                    personal = any("user_id" in doc.metadata for doc in combined_docs)
+                    answer_cache.store(
+                        question, question_vector, doc_fingerprint, answer, context,
+                        scope=user_id if personal else GLOBAL_SCOPE, retrieval=retrieval
+                    )
+
+                # 6. Embed to the user's memory index
+                embed_chat_to_vector_db(question, answer, user_id=user_id)
 
                 # 7. Show context
                 with st.expander("🔍 See retrieved context"):
-                    for i, doc in enumerate(combined_docs, 1):
+                    if st.session_state.get("debug_mode"):
+                        st.caption(
+                            f"{context_stats['context_tokens']}/{context_stats['budget_tokens']} tokens · "
+                            f"{context_stats['saved_tokens']} saved · {context_stats['merged']} merged · "
+                            f"{context_stats['duplicates']} duplicates · {context_stats['dropped']} dropped"
+                        )
+                    for i, doc in enumerate(context_docs, 1):
                         st.markdown(f"**Chunk {i}**")
                         st.text(doc.page_content[:300] + "...")
 
                 return question, answer
 
+            except SchedulerOverloaded as e:
+                logger.warning(f"Generation refused for {user_id}: {str(e)}")
+                st.warning("The assistant is busy right now, please try again in a moment.")
+                return question, None
+            except asyncio.TimeoutError:
+                logger.error(f"Generation exceeded {LLM_GENERATION_TIMEOUT:.0f}s")
+                st.error("Answer generation timed out.")
+                return question, None
             except Exception as e:
                 logger.error(f"Q&A failed: {str(e)}", exc_info=True)
                 st.error("Answer generation failed.")
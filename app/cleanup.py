@@ -1,23 +1,36 @@
 import os
-import shutil
+import time
 from app.helper import logger, monitor
 
-def cleanup_resources():
+# Uploads and figure crops are removed by the ingest that created them; this
+# only sweeps what crashed sessions left behind, never files still in use
+TEMP_MAX_AGE = float(os.getenv("TEMP_MAX_AGE", 3600))
+
+def cleanup_resources(max_age: float = TEMP_MAX_AGE):
     total_freed = 0
+    cutoff = time.time() - max_age
     for folder in ["temp", "figures"]:
         if os.path.exists(folder):
-            for root, _, files in os.walk(folder):
+            for root, dirs, files in os.walk(folder, topdown=False):
                 for file in files:
                     filepath = os.path.join(root, file)
                     try:
-                        total_freed += os.path.getsize(filepath)
+                        if os.path.getmtime(filepath) >= cutoff:
+                            continue
+                        size = os.path.getsize(filepath)
                         os.remove(filepath)
+                        total_freed += size
+                    except FileNotFoundError:
+                        continue
                     except Exception as e:
                         logger.warning(f"Failed to remove {filepath}: {str(e)}")
-            try:
-                shutil.rmtree(folder)
-                os.makedirs(folder, exist_ok=True)
-            except Exception as e:
-                logger.error(f"Cleanup error: {str(e)}")
+                for name in dirs:
+                    dirpath = os.path.join(root, name)
+                    try:
+                        if os.path.getmtime(dirpath) < cutoff:
+                            os.rmdir(dirpath)
+                    except OSError:
+                        # Not empty (still in use) or already gone
+                        continue
     monitor.log_cleanup(total_freed)
     return total_freed
@@ -1,13 +1,105 @@
+import os
+import time
+import threading
 from app.helper import logger
-from utils.vectorstore import init_vectorstore
-from utils.rag_chain import setup_rag_chain
+from utils.metrics import start_metrics_exporter
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+
+
+class SystemRegistry:
+    """Process-wide embeddings, vector store and RAG chain shared by every session
+
+    Streamlit reruns the script on every interaction; the registry builds the
+    heavy objects once and hands the same thread-safe handles to all users.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.embeddings = None
+        self.vector_store = None
+        self.rag_chain = None
+        self.status = "not started"
+        self.error = None
+        self._ready = threading.Event()
+
+    def start(self, warm_up: bool = WARMUP_ENABLED) -> "SystemRegistry":
+        """Build the shared objects once, then warm the models in the background"""
+        with self._lock:
+            if self.rag_chain is not None:
+                return self
+            started = time.time()
+            # The langchain/FAISS/Ollama stack loads here, after the page has started rendering
+            from utils.vectorstore import get_embeddings, init_vectorstore
+            from utils.rag_chain import setup_rag_chain
+
+            start_metrics_exporter()
+            self.embeddings = get_embeddings()
+            self.vector_store = init_vectorstore(embeddings=self.embeddings)
+            self.rag_chain = setup_rag_chain()
+            logger.info(f"System objects created in {time.time() - started:.2f}s")
+            if warm_up:
+                self.status = "warming up"
+                threading.Thread(target=self._warm_up, name="model-warmup", daemon=True).start()
+            else:
+                self._mark_ready()
+            return self
+
+    def refresh(self) -> None:
+        """Swap in a newer snapshot published by another process (e.g. bulk ingest)"""
+        with self._lock:
+            if self.vector_store is None:
+                return
+            from utils.vectorstore import refresh_vectorstore
+            refreshed = refresh_vectorstore(self.vector_store)
+            if refreshed is not self.vector_store:
+                logger.info(f"Serving new index snapshot {refreshed.snapshot} ({refreshed.index.ntotal} vectors)")
+                self.vector_store = refreshed
+
+    def _warm_up(self):
+        """Load both models into Ollama so the first question doesn't pay for it"""
+        started = time.time()
+        try:
+            # Bypass the embedding cache, otherwise a cached probe loads nothing
+            self.embeddings.underlying.embed_query("warm up")
+            # An empty prompt only loads the model; keep_alive then holds it resident
+            self.rag_chain.last.invoke("")
+            logger.info(f"Models warmed up in {time.time() - started:.2f}s")
+        except Exception as e:
+            self.error = str(e)
+            logger.warning(f"Model warm-up failed, first request will load them: {str(e)}")
+        self._mark_ready()
+
+    def _mark_ready(self):
+        self.status = "ready"
+        self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        return self._ready.wait(timeout)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_system_registry() -> SystemRegistry:
+    """The process-wide registry; shared objects are created on first use"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SystemRegistry()
+    return _registry.start()
+
 
 def initialize_system():
     try:
-        vector_store = init_vectorstore()
-        rag_chain = setup_rag_chain()
-        logger.info("System initialized successfully")
-        return None, rag_chain, vector_store  # retriever will be set later after PDF
+        registry = get_system_registry()
+        registry.refresh()
+        return None, registry.rag_chain, registry.vector_store  # retriever will be set later after PDF
     except Exception as e:
         logger.error(f"System initialization failed: {str(e)}")
         return None
@@ -1,14 +1,20 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime
-from dotenv import load_dotenv
 import os
+import time
+import queue
+import atexit
+import sqlite3
 import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from utils.metrics import timed
 
 # Load environment
 load_dotenv()
 
 # Database configuration
+DB_BACKEND = os.getenv("DB_BACKEND", "postgres")  # "postgres" or "sqlite" (local stand-in)
 DB_CONFIG = {
     "host": os.getenv("DB_HOST"),
     "port": int(os.getenv("DB_PORT", 5432)),
@@ -16,86 +22,463 @@ DB_CONFIG = {
     "password": os.getenv("DB_PASSWORD"),
     "dbname": os.getenv("DB_NAME")
 }
+DB_SQLITE_PATH = os.getenv("DB_SQLITE_PATH", "chat_history.db")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 5))
+DB_HEALTH_CHECK_AFTER = float(os.getenv("DB_HEALTH_CHECK_AFTER", 30))  # idle seconds before a ping
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "true").lower() == "true"
+CHAT_WRITE_BATCH = int(os.getenv("CHAT_WRITE_BATCH", 50))
+CHAT_FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_INTERVAL", 0.5))
+CHAT_QUEUE_MAX = int(os.getenv("CHAT_QUEUE_MAX", 10000))
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", 20))
+CHAT_HISTORY_CACHE_USERS = int(os.getenv("CHAT_HISTORY_CACHE_USERS", 256))
+# Bounds staleness from writes made by other processes (e.g. the API)
+CHAT_HISTORY_CACHE_TTL = float(os.getenv("CHAT_HISTORY_CACHE_TTL", 60))
 
 logger = logging.getLogger(__name__)
 
+INSERT_COLUMNS = "(user_id, question, answer, context, source_file)"
+
+SCHEMA = {
+    "postgres": """
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id SERIAL PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            context TEXT,
+            source_file TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_user_timestamp ON chat_history(user_id, timestamp, id);
+        DROP INDEX IF EXISTS idx_user_id;
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            context TEXT,
+            source_file TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_user_timestamp ON chat_history(user_id, timestamp, id);
+        DROP INDEX IF EXISTS idx_user_id;
+    """,
+}
+
+TIMESTAMP_FORMAT = {
+    "postgres": "to_char(timestamp, 'YYYY-MM-DD HH24:MI:SS')",
+    "sqlite": "strftime('%Y-%m-%d %H:%M:%S', timestamp)",
+}
+
+
+HISTORY_COLUMNS = """
+    id, question, answer, source_file, context IS NOT NULL AS has_context,
+    {timestamp} AS timestamp
+"""
+
+
+def _sql(query):
+    """Adapt %s placeholders to the active backend"""
+    return query.replace("%s", "?") if DB_BACKEND == "sqlite" else query
+
+
 def get_db_connection():
     """Establishes database connection"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        if DB_BACKEND == "sqlite":
+            conn = sqlite3.connect(DB_SQLITE_PATH, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+        else:
+            import psycopg2
+            conn = psycopg2.connect(**DB_CONFIG)
         logger.debug("Database connection established")
         return conn
     except Exception as e:
         logger.error(f"Database connection failed: {str(e)}")
         raise
 
-def create_chat_table():
+
+class ConnectionPool:
+    """Thread-safe connection pool that pings idle connections before reuse"""
+
+    def __init__(self, factory, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX):
+        self.factory = factory
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._idle = []  # (connection, returned_at)
+        self._in_use = 0
+        self._cond = threading.Condition()
+        for _ in range(minconn):
+            try:
+                self._idle.append((factory(), time.monotonic()))
+            except Exception:
+                break  # Database down at startup; connect lazily later
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.rollback()  # Clear any aborted transaction before pinging
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self, timeout=10):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._idle and self._in_use >= self.maxconn:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Timed out waiting for a database connection")
+                self._cond.wait(remaining)
+            if self._idle:
+                conn, returned_at = self._idle.pop()
+            else:
+                conn, returned_at = None, None
+            self._in_use += 1
+
+        try:
+            if conn is not None and time.monotonic() - returned_at > DB_HEALTH_CHECK_AFTER:
+                if not self._is_healthy(conn):
+                    logger.warning("Discarding stale database connection")
+                    self._close(conn)
+                    conn = None
+            return conn if conn is not None else self.factory()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, discard=False):
+        if not discard:
+            try:
+                conn.rollback()  # Never hand out a connection mid-transaction
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard or len(self._idle) >= self.maxconn:
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = not self._is_healthy(conn)
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def closeall(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                self._close(conn)
+            self._idle.clear()
+
+
+_pool = None
+_schema_ready = False
+_pool_lock = threading.RLock()
+
+
+def get_pool():
+    """Process-wide connection pool, created on first use"""
+    global _pool, _schema_ready
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(get_db_connection)
+        if not _schema_ready:
+            try:
+                # Use the pool directly: going through get_pool() here would recurse
+                create_chat_table(_pool)
+                _schema_ready = True
+            except Exception:
+                pass  # Logged by create_chat_table; retried on next use
+        return _pool
+
+
+def _dict_cursor(conn):
+    if DB_BACKEND == "sqlite":
+        return conn.cursor()
+    from psycopg2.extras import RealDictCursor
+    return conn.cursor(cursor_factory=RealDictCursor)
+
+
+def _insert_rows(conn, rows):
+    """Insert chat rows in one round-trip (multi-row VALUES on Postgres)"""
+    cur = conn.cursor()
+    try:
+        if DB_BACKEND == "sqlite":
+            cur.executemany(
+                f"INSERT INTO chat_history {INSERT_COLUMNS} VALUES (?, ?, ?, ?, ?)", rows
+            )
+        else:
+            from psycopg2.extras import execute_values
+            execute_values(cur, f"INSERT INTO chat_history {INSERT_COLUMNS} VALUES %s", rows)
+        conn.commit()
+    finally:
+        cur.close()
+
+
+def create_chat_table(pool=None):
     """Ensures chat table exists"""
-    conn = None
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS chat_history (
-                    id SERIAL PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    question TEXT NOT NULL,
-                    answer TEXT NOT NULL,
-                    context TEXT,
-                    source_file TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                CREATE INDEX IF NOT EXISTS idx_user_id ON chat_history(user_id);
-            """)
+        with (pool or get_pool()).connection() as conn:
+            cur = conn.cursor()
+            if DB_BACKEND == "sqlite":
+                cur.executescript(SCHEMA["sqlite"])
+            else:
+                cur.execute(SCHEMA["postgres"])
             conn.commit()
+            cur.close()
             logger.info("Chat table verified/created")
     except Exception as e:
         logger.error(f"Table creation failed: {str(e)}")
         raise
-    finally:
-        if conn:
-            conn.close()
 
-def save_chat(user_id, question, answer, context=None, source_file=None):
-    """Saves chat to database"""
-    conn = None
+
+class ChatWriter:
+    """Write-behind queue that batches chat inserts on a background thread
+
+    Rows are retried with backoff while the database is unavailable and
+    flushed at interpreter shutdown.
+    """
+
+    def __init__(self, batch_size=CHAT_WRITE_BATCH, flush_interval=CHAT_FLUSH_INTERVAL,
+                 max_queue=CHAT_QUEUE_MAX, shutdown_timeout=10.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.shutdown_timeout = shutdown_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        self._queue.put(row)
+
+    def _take_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        delay = 0.5
+        deadline = None
+        while True:
+            try:
+                with timed("db_write"), get_pool().connection() as conn:
+                    _insert_rows(conn, batch)
+                for user_id in {row[0] for row in batch}:
+                    history_cache.invalidate(user_id)
+                logger.debug(f"Wrote {len(batch)} chat rows")
+                return
+            except Exception as e:
+                if self._stopping.is_set():
+                    deadline = deadline or time.monotonic() + self.shutdown_timeout
+                    if time.monotonic() >= deadline:
+                        logger.error(f"Dropping {len(batch)} chat rows at shutdown: {str(e)}")
+                        return
+                logger.warning(f"Chat write failed ({str(e)}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued row has been written (or dropped)"""
+        self._queue.join()
+
+    def close(self):
+        self._stopping.set()
+        self._thread.join(timeout=self.shutdown_timeout + self.flush_interval + 1)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_chat_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ChatWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def save_chat(user_id, question, answer, context=None, source_file=None, sync=False):
+    """Saves chat to database (queued for a background batch write by default)"""
+    row = (user_id, question, answer, context, source_file)
+    if CHAT_WRITE_BEHIND and not sync:
+        get_chat_writer().submit(row)
+        logger.debug(f"Chat queued for user {user_id}")
+        return
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO chat_history 
-                (user_id, question, answer, context, source_file)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (user_id, question, answer, context, source_file))
-            conn.commit()
+        with timed("db_write"), get_pool().connection() as conn:
+            _insert_rows(conn, [row])
             logger.debug(f"Chat saved for user {user_id}")
+        history_cache.invalidate(user_id)
     except Exception as e:
         logger.error(f"Save chat failed: {str(e)}")
         raise
-    finally:
-        if conn:
-            conn.close()
 
-def get_chat_history(user_id, limit=20):
-    """Retrieves chat history for user"""
-    conn = None
+
+class HistoryCache:
+    """Pages of chat history per user, dropped whenever that user's chats are written
+
+    Streamlit reruns the script on every interaction; with the cache a rerun
+    only reaches the database after a new chat was saved. Each user has a
+    generation number so a page read before a write can't be cached after it.
+    """
+
+    def __init__(self, max_users=CHAT_HISTORY_CACHE_USERS, ttl=CHAT_HISTORY_CACHE_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users = OrderedDict()  # user_id -> {before_id: (rows, cached_at)}
+        # user_id -> [generation, reads in flight]; only kept for users that are
+        # cached or being read, so it stays as small as _users
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def begin_read(self, user_id):
+        """Register a database read; returns the generation to hand to put()"""
+        with self._lock:
+            state = self._generations.setdefault(user_id, [0, 0])
+            state[1] += 1
+            return state[0]
+
+    def end_read(self, user_id):
+        with self._lock:
+            self._generations[user_id][1] -= 1
+            self._forget_if_idle(user_id)
+
+    def _forget_if_idle(self, user_id):
+        state = self._generations.get(user_id)
+        if state and not state[1] and user_id not in self._users:
+            del self._generations[user_id]
+
+    def get(self, user_id, before_id):
+        with self._lock:
+            pages = self._users.get(user_id)
+            entry = pages.get(before_id) if pages else None
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                return None
+            self._users.move_to_end(user_id)
+            return entry[0]
+
+    def put(self, user_id, before_id, rows, generation):
+        """Cache a page read since begin_read(), unless the user's chats were written meanwhile"""
+        with self._lock:
+            state = self._generations.get(user_id)
+            if state is None or state[0] != generation:
+                return
+            self._users.setdefault(user_id, {})[before_id] = (rows, time.monotonic())
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                evicted, _ = self._users.popitem(last=False)
+                self._forget_if_idle(evicted)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+            state = self._generations.get(user_id)
+            if state:
+                state[0] += 1
+                self._forget_if_idle(user_id)
+
+
+history_cache = HistoryCache()
+
+
+def get_chat_history(user_id, limit=CHAT_HISTORY_PAGE_SIZE, before_id=None):
+    """Retrieves one page of the user's chat history, newest first, without the context text
+
+    Pass the id of the oldest chat already shown as before_id to get the next
+    older page (keyset pagination on the (user_id, timestamp, id) index).
+    """
+    cached = history_cache.get(user_id, (before_id, limit))
+    if cached is not None:
+        return cached
+    generation = history_cache.begin_read(user_id)
     try:
-        conn = get_db_connection()
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("""
-                SELECT question, answer, context, source_file, 
-                       to_char(timestamp, 'YYYY-MM-DD HH24:MI:SS') as timestamp
-                FROM chat_history
-                WHERE user_id = %s
-                ORDER BY timestamp DESC
-                LIMIT %s
-            """, (user_id, limit))
-            results = cur.fetchall()
+        with get_pool().connection() as conn:
+            cur = _dict_cursor(conn)
+            columns = HISTORY_COLUMNS.format(timestamp=TIMESTAMP_FORMAT[DB_BACKEND])
+            if before_id is None:
+                cur.execute(_sql(f"""
+                    SELECT {columns}
+                    FROM chat_history
+                    WHERE user_id = %s
+                    ORDER BY chat_history.timestamp DESC, id DESC
+                    LIMIT %s
+                """), (user_id, limit))
+            else:
+                cur.execute(_sql(f"""
+                    SELECT {columns}
+                    FROM chat_history
+                    WHERE user_id = %s
+                      AND (chat_history.timestamp, id) < (SELECT timestamp, id FROM chat_history WHERE id = %s)
+                    ORDER BY chat_history.timestamp DESC, id DESC
+                    LIMIT %s
+                """), (user_id, before_id, limit))
+            results = [dict(row) for row in cur.fetchall()]
+            cur.close()
             logger.debug(f"Retrieved {len(results)} records for user {user_id}")
-            return results
+        history_cache.put(user_id, (before_id, limit), results, generation)
+        return results
     except Exception as e:
         logger.error(f"Get history failed: {str(e)}")
         return []
     finally:
-        if conn:
-            conn.close()
\ No newline at end of file
+        history_cache.end_read(user_id)
+
+
+def get_chat_context(chat_id, user_id):
+    """The retrieved context stored with one chat (loaded only when someone asks to see it)"""
+    try:
+        with get_pool().connection() as conn:
+            cur = conn.cursor()
+            cur.execute(_sql("SELECT context FROM chat_history WHERE id = %s AND user_id = %s"), (chat_id, user_id))
+            row = cur.fetchone()
+            cur.close()
+            return row[0] if row else None
+    except Exception as e:
+        logger.error(f"Get chat context failed: {str(e)}")
+        return None
@@ -1,36 +1,60 @@
 import os
-import time
 import gc
+import time
+import tempfile
 import streamlit as st
-from utils.parse_pdf import process_pdf, validate_pdf
-from utils.vectorstore import add_to_vectorstore, get_retriever
 from app.helper import logger, monitor
 
 def handle_pdf_upload(vector_store, num_results, search_type):
     uploaded_file = st.file_uploader("Upload PDF (max 50MB)", type="pdf")
     if uploaded_file:
+        # The PDF parsing stack is only needed once a file is attached
+        from utils.parse_pdf import validate_pdf
+        from utils.ingest import ingest_registered_pdf, current_parse_params
+        from utils.doc_registry import fingerprint_bytes, get_registry
+        from utils.vectorstore import get_retriever
+
+        temp_path = None
         try:
             validate_pdf(uploaded_file)
             file_size = uploaded_file.size / (1024 * 1024)
+            data = uploaded_file.getbuffer()
+            doc_hash = fingerprint_bytes(data)
+
+            # Reruns while the file is still attached land here: reuse the index
+            if get_registry().is_indexed(doc_hash, current_parse_params(), vector_store):
+                st.session_state['retriever'] = get_retriever(
+                    vector_store, search_type=search_type, search_kwargs={"k": num_results}
+                )
+                return uploaded_file
+
             with st.status("Processing document...", expanded=True) as status:
+                started = time.perf_counter()
                 os.makedirs("temp", exist_ok=True)
-                temp_path = f"temp/{int(time.time())}_{uploaded_file.name}"
-                with open(temp_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-                content = process_pdf(temp_path)
-                if content:
-                    vector_store = add_to_vectorstore(vector_store, content)
+                # Unique per upload: two sessions may be sending the same file
+                fd, temp_path = tempfile.mkstemp(prefix=f"{doc_hash[:16]}_", suffix=f"_{uploaded_file.name}", dir="temp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                chunk_ids, _ = ingest_registered_pdf(
+                    vector_store,
+                    temp_path,
+                    source=uploaded_file.name,
+                    doc_hash=doc_hash,
+                    on_progress=lambda count: status.update(label=f"Indexed {count} chunks...")
+                )
+                if chunk_ids:
                     retriever = get_retriever(vector_store, search_type=search_type, search_kwargs={"k": num_results})
                     st.session_state['retriever'] = retriever
                     status.update(label="✅ Processing complete", state="complete")
-                    monitor.log_processing_time(uploaded_file.name, file_size)
+                    monitor.log_processing_time(uploaded_file.name, file_size, time.perf_counter() - started)
                 else:
                     st.error("No extractable content found.")
-                os.remove(temp_path)
         except Exception as e:
             logger.error(f"PDF processing failed: {str(e)}")
             st.error(f"Processing failed: {str(e)}")
         finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
             gc.collect()
         return uploaded_file
     return None
@@ -9,6 +9,7 @@ import sqlite3
 from types import SimpleNamespace
 import time
 from datetime import datetime
+from utils.metrics import registry, observe_stage
 
 load_dotenv()
 
@@ -17,10 +18,14 @@ class SystemMonitor:
         self.start_time = time.time()
         self.file_processed = 0
         self.total_cleaned = 0
+        self._files = registry.counter("rag_files_processed_total", "PDF uploads indexed")
+        self._cleaned = registry.counter("rag_cleanup_bytes_total", "Bytes of temporary files removed")
         
-    def log_processing_time(self, filename, size_mb):
-        elapsed = time.time() - self.start_time
+    def log_processing_time(self, filename, size_mb, elapsed):
+        """Log how long one file took; elapsed is measured by the caller"""
         self.file_processed += 1
+        self._files.inc()
+        observe_stage("upload", elapsed, document=filename)
         logging.info(
             f"PROCESSED: {filename} ({size_mb:.1f}MB) in {elapsed:.2f}s | "
             f"Total files: {self.file_processed}"
@@ -28,6 +33,7 @@ class SystemMonitor:
         
     def log_cleanup(self, bytes_freed):
         self.total_cleaned += bytes_freed
+        self._cleaned.inc(bytes_freed)
         logging.info(
             f"CLEANUP: Freed {bytes_freed/1e6:.2f}MB | "
             f"Total freed: {self.total_cleaned/1e6:.2f}MB"
@@ -36,23 +42,32 @@ class SystemMonitor:
 # Initialize monitor
 monitor = SystemMonitor()
 
-# Configure logging
-if not os.path.exists("logs"):
-    os.makedirs("logs")
+_logging_configured = False
+
+
+def configure_logging():
+    """Daily file, rotating file and console handlers; call once from the entry point"""
+    global _logging_configured
+    if _logging_configured:
+        return
+    import logging.handlers
+
+    os.makedirs("logs", exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(f"logs/app_{datetime.now().strftime('%Y%m%d')}.log"),
+            logging.handlers.RotatingFileHandler(
+                "logs/app.log", 
+                maxBytes=1e6, 
+                backupCount=3
+            ),
+            logging.StreamHandler()
+        ]
+    )
+    _logging_configured = True
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f"logs/app_{datetime.now().strftime('%Y%m%d')}.log"),
-        logging.handlers.RotatingFileHandler(
-            "logs/app.log", 
-            maxBytes=1e6, 
-            backupCount=3
-        ),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 def get_cookie_manager():
@@ -1,14 +1,30 @@
 
-from langchain_core.documents import Document
-from utils.vectorstore import add_documents_to_vectorstore
+import threading
+from app.core import get_system_registry
 
+_memory_store = None
+_memory_lock = threading.Lock()
 
-def embed_chat_to_vector_db(vector_store, question, answer, user_id="anonymous"):
-    """Embeds a single Q&A pair into the vector store as a memory"""
+
+def get_memory_store():
+    """Process-wide per-user chat memory store"""
+    global _memory_store
+    with _memory_lock:
+        if _memory_store is None:
+            from utils.memory_store import UserMemoryStore
+            _memory_store = UserMemoryStore(get_system_registry().embeddings)
+            _memory_store.start_maintenance()
+        return _memory_store
+
+
+def embed_chat_to_vector_db(question, answer, user_id="anonymous"):
+    """Embeds a single Q&A pair into the user's memory index"""
     try:
-        content = f"Q: {question}\nA: {answer}"
-        metadata = {"user_id": user_id}
-        doc = Document(page_content=content, metadata=metadata)
-        add_documents_to_vectorstore(vector_store, [doc])
+        return get_memory_store().add(user_id, question, answer)
     except Exception as e:
         raise Exception(f"Failed to embed chat memory: {str(e)}")
+
+
+def search_chat_memory(question, user_id="anonymous", k=2):
+    """Finds the user's most similar previous Q&A pairs"""
+    return get_memory_store().search(user_id, question, k=k)
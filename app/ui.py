@@ -1,6 +1,6 @@
 import streamlit as st
 from app.helper import get_or_create_user_id
-from app.db import get_chat_history
+from app.db import get_chat_history, get_chat_context, history_cache, CHAT_HISTORY_PAGE_SIZE
 
 def sidebar_controls():
     """Creates sidebar controls for chat settings"""
@@ -10,20 +10,25 @@ def sidebar_controls():
         num_results = st.slider("Retrieved Chunks", 1, 5, 2, key="num_results_slider")
         search_type = st.selectbox(
             "Search Strategy", 
-            ["similarity", "mmr", "similarity_score_threshold"],
+            ["similarity", "mmr", "similarity_score_threshold", "hybrid"],
             key="search_type_select"
         )
+        stream_answers = st.toggle("Stream answers", value=True, key="stream_toggle")
         
         # Debug controls
         if st.session_state.get("debug_mode", False):
             st.divider()
             st.header("Debug")
             if st.button("Force Reload History"):
-                if "history" in st.session_state:
-                    del st.session_state["history"]
+                history_cache.invalidate(st.session_state.get("user_id"))
+                st.session_state.pop("history_context", None)
                 st.rerun()
         
-        return temperature, num_results, search_type
+        return temperature, num_results, search_type, stream_answers
+
+def _load_older_history():
+    st.session_state["history_pages"] = st.session_state.get("history_pages", 1) + 1
+
 
 def show_chat_history():
     """Displays complete chat history with guaranteed loading"""
@@ -37,21 +42,38 @@ def show_chat_history():
         if st.session_state.get("debug_mode"):
             st.write(f"Debug: Loading history for user {st.session_state['user_id']}")
         
-        # Load fresh history from DB
+        # Newest page plus any older pages the user asked for; served from the
+        # per-user cache unless a chat was saved since
         try:
-            history = get_chat_history(st.session_state["user_id"])
+            user_id = st.session_state["user_id"]
+            pages = st.session_state.setdefault("history_pages", 1)
+            history = []
+            more = True
+            for _ in range(pages):
+                page = get_chat_history(user_id, before_id=history[-1]["id"] if history else None)
+                history.extend(page)
+                if len(page) < CHAT_HISTORY_PAGE_SIZE:
+                    more = False
+                    break
             if st.session_state.get("debug_mode"):
                 st.write(f"Debug: Retrieved {len(history)} records")
             
             if history:
                 st.subheader("🗂️ Chat History")
-                for chat in reversed(history):  # Newest first
+                if more:
+                    st.button("⬆️ Load older conversations", key="load_older_history", on_click=_load_older_history)
+                contexts = st.session_state.setdefault("history_context", {})
+                for chat in reversed(history):  # Oldest first, latest just above the chat box
                     with st.container():
                         st.markdown(f"**Q:** {chat['question']}")
                         st.markdown(f"**A:** {chat['answer']}")
-                        if st.session_state.get("debug_mode") and chat.get('context'):
-                            with st.expander("View Context"):
-                                st.text(chat['context'][:500] + ("..." if len(chat['context']) > 500 else ""))
+                        if st.session_state.get("debug_mode") and chat.get('has_context'):
+                            # Context is only read from the database once this is switched on
+                            if st.toggle("View Context", key=f"context_{chat['id']}"):
+                                if chat['id'] not in contexts:
+                                    contexts[chat['id']] = get_chat_context(chat['id'], user_id) or ""
+                                context = contexts[chat['id']]
+                                st.text(context[:500] + ("..." if len(context) > 500 else ""))
                         st.caption(f"🕒 {chat['timestamp']} | Source: {chat['source_file']}")
                         st.divider()
             else:
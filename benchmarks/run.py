@@ -0,0 +1,336 @@
+"""Performance benchmarks against deterministic fake backends
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --output new.json --baseline results.json
+
+Every stage runs in-process with FakeEmbeddings/FakeLLM, so numbers reflect
+the pipeline's own overhead plus the configured model latency, and are
+comparable between runs on the same machine.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from typing import Callable, Dict, List, Optional
+from benchmarks.synthetic_pdf import synthetic_paragraphs, write_synthetic_pdf
+from utils.stub_backends import FakeEmbeddings, FakeLLM
+from utils.embedding_executor import EmbeddingExecutor
+
+# Metrics compared against a baseline. p99s over a few hundred samples are too
+# noisy to gate on, so only medians, throughput and peak memory are checked
+LOWER_IS_BETTER = ("p50_ms", "peak_rss_mb")
+HIGHER_IS_BETTER = ("_per_sec",)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """p50/p99/mean in milliseconds from samples in seconds"""
+    ms = [s * 1000 for s in samples]
+    return {
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+    }
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is a high-water mark (KiB on Linux, bytes on macOS), the best we can do here
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PeakRSS:
+    """Samples resident memory on a background thread while the block runs"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start = self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self):
+        self.start = self.peak = _rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def fake_embeddings(args) -> EmbeddingExecutor:
+    # Through the executor so request batching and concurrency are part of the measurement
+    return EmbeddingExecutor(FakeEmbeddings(dim=args.dim, latency=args.embed_latency))
+
+
+def bench_parse(args, work_dir: str) -> dict:
+    """Pages/sec through unstructured, serial and with the page-range process pool"""
+    from utils.parse_pdf import extract_elements_from_pdf, PDF_PARSE_WORKERS
+
+    path = write_synthetic_pdf(os.path.join(work_dir, "synthetic.pdf"), args.pages, seed=args.seed)
+    results = {"pages": args.pages}
+    for label, workers in (("serial", 1), ("parallel", PDF_PARSE_WORKERS)):
+        started = time.perf_counter()
+        elements = extract_elements_from_pdf(path, os.path.join(work_dir, f"figures-{label}"), workers=workers)
+        elapsed = time.perf_counter() - started
+        results[label] = {
+            "workers": workers,
+            "seconds": round(elapsed, 3),
+            "pages_per_sec": round(args.pages / elapsed, 2),
+            "elements": len(elements),
+        }
+    return results
+
+
+def bench_embed(args, work_dir: str) -> dict:
+    """Chunks embedded and indexed per second, and peak RSS while adding"""
+    from utils.parse_pdf import iter_chunks
+    from utils.vectorstore import add_to_vectorstore, create_empty_vectorstore
+
+    # ~560-character paragraphs split into 800/100 chunks give about 0.8 chunks each
+    paragraphs = synthetic_paragraphs(args.chunks * 5 // 4, seed=args.seed)
+    elements = [{"text": text, "metadata": {"page_number": i // 6 + 1}} for i, text in enumerate(paragraphs)]
+    started = time.perf_counter()
+    chunks = [text for text, _ in iter_chunks(elements)]
+    split_seconds = time.perf_counter() - started
+
+    vector_store = create_empty_vectorstore(fake_embeddings(args))
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        add_to_vectorstore(vector_store, chunks)
+        elapsed = time.perf_counter() - started
+    return {
+        "chunks": len(chunks),
+        "split_chunks_per_sec": round(len(chunks) / split_seconds, 2),
+        "embed_seconds": round(elapsed, 3),
+        "chunks_per_sec": round(len(chunks) / elapsed, 2),
+        "rss_start_mb": round(rss.start / 1e6, 1),
+        "peak_rss_mb": round(rss.peak / 1e6, 1),
+        "rss_growth_mb": round((rss.peak - rss.start) / 1e6, 1),
+    }
+
+
+def _timed(fn: Callable, repeats: int) -> List[float]:
+    samples = []
+    for i in range(repeats):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_retrieval(args, work_dir: str) -> dict:
+    """p50/p99 search latency per strategy as the corpus grows"""
+    from utils.vectorstore import append_to_vectorstore, create_empty_vectorstore
+    from utils.ann_index import ensure_index_type
+    from utils.lexical_index import BM25Index
+    from utils.retrieval import search_documents_by_vector
+
+    embeddings = FakeEmbeddings(dim=args.dim)
+    vector_store = create_empty_vectorstore(embeddings)
+    vector_store.lexical_index = BM25Index()
+    questions = synthetic_paragraphs(args.queries, seed=args.seed + 1, words_per_paragraph=8)
+    vectors = embeddings.embed_documents(questions)
+
+    results = []
+    size = 0
+    for target in sorted(args.corpus_sizes):
+        texts = synthetic_paragraphs(target - size, seed=args.seed + target, words_per_paragraph=60)
+        append_to_vectorstore(vector_store, texts)
+        size = target
+        ensure_index_type(vector_store)
+        row = {"corpus_size": size, "index_type": type(vector_store.index).__name__}
+        for search_type in args.search_types:
+            samples = _timed(
+                lambda i: search_documents_by_vector(vector_store, questions[i], vectors[i], search_type, k=4),
+                len(questions)
+            )
+            row[search_type] = latency_summary(samples)
+        results.append(row)
+    return {"queries_per_size": len(questions), "sizes": results}
+
+
+def bench_end_to_end(args, work_dir: str) -> dict:
+    """handle_chat without Streamlit: embed, retrieve (memory + documents), build context, stream the answer"""
+    from langchain_core.prompts import ChatPromptTemplate
+    from utils.vectorstore import add_to_vectorstore, create_empty_vectorstore
+    from utils.lexical_index import BM25Index
+    from utils.memory_store import UserMemoryStore
+    from utils.retrieval import RetrievalCoordinator, QueryEmbeddingCache
+    from utils.context_builder import build_context
+    from utils.rag_chain import template
+
+    embeddings = fake_embeddings(args)
+    vector_store = create_empty_vectorstore(embeddings)
+    vector_store.lexical_index = BM25Index()
+    add_to_vectorstore(vector_store, synthetic_paragraphs(args.e2e_corpus, seed=args.seed, words_per_paragraph=60))
+    memory = UserMemoryStore(embeddings, os.path.join(work_dir, "memory"))
+    memory.add("bench-user", "what is the index latency", "It depends on the corpus size.")
+    # A fresh cache so every question pays for its embedding, as a new question would
+    coordinator = RetrievalCoordinator(vector_store, memory, query_cache=QueryEmbeddingCache())
+    chain = ChatPromptTemplate.from_template(template) | FakeLLM(
+        latency=args.llm_latency, token_latency=args.token_latency
+    )
+    questions = synthetic_paragraphs(args.queries, seed=args.seed + 2, words_per_paragraph=8)
+
+    async def answer(question):
+        started = time.perf_counter()
+        memory_docs, doc_chunks = coordinator.retrieve(question, "bench-user", search_type=args.e2e_search_type, k=4)
+        context, _, _ = build_context(memory_docs + doc_chunks, question)
+        retrieved = time.perf_counter()
+        first_token = None
+        async for _ in chain.astream({"question": question, "context": context}):
+            if first_token is None:
+                first_token = time.perf_counter()
+        done = time.perf_counter()
+        return retrieved - started, first_token - started, done - started
+
+    retrieval, ttft, total = [], [], []
+    for question in questions:
+        r, f, t = asyncio.run(answer(question))
+        retrieval.append(r)
+        ttft.append(f)
+        total.append(t)
+    return {
+        "questions": len(questions),
+        "search_type": args.e2e_search_type,
+        "retrieval": latency_summary(retrieval),
+        "time_to_first_token": latency_summary(ttft),
+        "total": latency_summary(total),
+    }
+
+
+BENCHMARKS = {
+    "parse": bench_parse,
+    "embed": bench_embed,
+    "retrieval": bench_retrieval,
+    "end_to_end": bench_end_to_end,
+}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    """Dotted metric name -> value for every numeric leaf"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                if isinstance(item, dict):
+                    flat.update(flatten(item, f"{name}[{item.get('corpus_size', index)}]."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Metrics that got worse than the baseline by more than the tolerance"""
+    regressions = []
+    now, before = flatten(current["results"]), flatten(baseline["results"])
+    for name, value in now.items():
+        old = before.get(name)
+        if not old:
+            continue
+        if name.endswith(LOWER_IS_BETTER):
+            change = (value - old) / old
+        elif name.endswith(HIGHER_IS_BETTER):
+            change = (old - value) / old
+        else:
+            continue
+        if change > tolerance:
+            regressions.append(f"{name}: {old} -> {value} ({change:+.0%} worse)")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline against fake backends")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown vs baseline")
+    parser.add_argument("--pages", type=int, default=40, help="synthetic PDF size for the parse benchmark")
+    parser.add_argument("--chunks", type=int, default=4000, help="approximate chunk count for the embed benchmark")
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--search-types", nargs="+", default=["similarity", "mmr", "hybrid"])
+    parser.add_argument("--queries", type=int, default=200, help="queries per measurement")
+    parser.add_argument("--e2e-corpus", type=int, default=5000)
+    parser.add_argument("--e2e-search-type", default="similarity")
+    parser.add_argument("--dim", type=int, default=384, help="fake embedding dimension")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per fake embedding request")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="fake LLM time to first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="fake LLM seconds per token")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="bench-") as work_dir:
+        for name in args.only or list(BENCHMARKS):
+            print(f"Running {name}...", file=sys.stderr)
+            try:
+                report["results"][name] = BENCHMARKS[name](args, work_dir)
+            except ImportError as e:
+                # unstructured is heavy; a missing optional dependency skips its benchmark only
+                report["results"][name] = {"skipped": str(e)}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+
+import random
+from typing import List
+
+VOCABULARY = (
+    "system index vector query latency document chunk model retrieval answer context "
+    "throughput memory cache batch embedding pipeline report figure table page section "
+    "analysis result method value error request response server client storage network"
+).split()
+LINES_PER_PAGE = 48
+CHARS_PER_LINE = 90
+
+
+def _paragraph_lines(rng: random.Random, words: int) -> List[str]:
+    lines, line = [], []
+    for i in range(words):
+        # Sprinkle identifiers so lexical search has exact tokens to match
+        word = f"ERR-{rng.randint(1000, 9999)}" if i % 40 == 39 else rng.choice(VOCABULARY)
+        if len(" ".join(line + [word])) > CHARS_PER_LINE:
+            lines.append(" ".join(line))
+            line = []
+        line.append(word)
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+
+def _page_stream(lines: List[str]) -> bytes:
+    ops = ["BT", "/F1 10 Tf", "12 TL", "50 760 Td"]
+    for line in lines:
+        ops.append(f"({line}) Tj T*")
+    ops.append("ET")
+    return "\n".join(ops).encode("latin-1")
+
+
+def synthetic_pdf_bytes(pages: int, seed: int = 0, words_per_paragraph: int = 80) -> bytes:
+    """A text-only PDF with deterministic pseudo-English content, built without any PDF library"""
+    rng = random.Random(seed)
+    page_count = max(1, pages)
+    font_id = 3
+    first_page_id = 4
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        font_id: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for page in range(page_count):
+        lines = []
+        while len(lines) < LINES_PER_PAGE - 2:
+            lines.extend(_paragraph_lines(rng, words_per_paragraph))
+            lines.append("")
+        stream = _page_stream([f"Page {page + 1}"] + lines[:LINES_PER_PAGE - 1])
+        page_id = first_page_id + page * 2
+        content_id = page_id + 1
+        kids.append(f"{page_id} 0 R")
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode("latin-1")
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {page_count} >>".encode("latin-1")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(out)
+        out += b"%d 0 obj\n" % object_id + objects[object_id] + b"\nendobj\n"
+    xref_at = len(out)
+    size = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for object_id in range(1, size):
+        out += b"%010d 00000 n \n" % offsets[object_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_at)
+    return bytes(out)
+
+
+def write_synthetic_pdf(path: str, pages: int, seed: int = 0) -> str:
+    with open(path, "wb") as f:
+        f.write(synthetic_pdf_bytes(pages, seed))
+    return path
+
+
+def synthetic_paragraphs(count: int, seed: int = 0, words_per_paragraph: int = 80) -> List[str]:
+    """The same pseudo-English as the PDFs, for benchmarks that skip parsing"""
+    rng = random.Random(seed)
+    return [" ".join(_paragraph_lines(rng, words_per_paragraph)) for _ in range(count)]
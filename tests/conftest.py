@@ -0,0 +1,39 @@
+"""Shared test setup: every model call goes to the local stub backends
+
+Module constants are read from the environment at import time, so the
+environment and working directory are prepared here, before any test
+module imports the app.
+"""
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from utils.stub_backends import StubOllamaServer
+
+STUB_SERVER = StubOllamaServer(port=0).start()
+WORKDIR = tempfile.mkdtemp(prefix="rag-tests-")
+_previous_cwd = os.getcwd()
+os.chdir(WORKDIR)
+os.environ.update(
+    OLLAMA_BASE_URL=STUB_SERVER.base_url,
+    DB_BACKEND="sqlite",
+    CAPTIONS_ENABLED="false",
+    ANSWER_CACHE_ENABLED="false",
+    MEMORY_MAINTENANCE_INTERVAL="0",
+    QUERY_BATCH_WAIT_MS="50",
+    API_REFRESH_INTERVAL="3600",
+)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    STUB_SERVER.shutdown()
+    os.chdir(_previous_cwd)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def stub_server():
+    return STUB_SERVER
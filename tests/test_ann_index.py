@@ -0,0 +1,140 @@
+"""Index rebuilds and deletions in utils/ann_index.py"""
+
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import pytest
+
+import utils.ann_index as ann_index
+from utils.ann_index import build_index, delete_from_vectorstore, index_kind, tombstones
+from utils.rwlock import ReadWriteLock
+from utils.vectorstore import append_to_vectorstore, create_empty_vectorstore
+
+DIMENSION = 8
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic random vectors keyed by text"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        seed = sum(ord(char) * (i + 1) for i, char in enumerate(text))
+        return np.random.default_rng(seed).random(DIMENSION).tolist()
+
+
+def make_store(count):
+    store = create_empty_vectorstore(HashEmbeddings())
+    store.lock = ReadWriteLock()
+    ids = append_to_vectorstore(store, [f"chunk {i}" for i in range(count)], metadatas=[{"i": i} for i in range(count)])
+    return store, ids
+
+
+def test_delete_from_hnsw_keeps_the_other_vectors_in_order():
+    store, ids = make_store(40)
+    store.index = build_index("hnsw", DIMENSION, store.index.reconstruct_n(0, store.index.ntotal))
+    assert index_kind(store.index) == "hnsw"
+
+    delete_from_vectorstore(store, ids[:5])
+    delete_from_vectorstore(store, ids[5:10])
+
+    # 10 of 40 deleted crosses the tombstone ratio and compacts the graph
+    assert index_kind(store.index) == "hnsw"
+    assert store.index.ntotal == 30
+    assert list(store.index_to_docstore_id.values()) == ids[10:]
+    assert all(doc_id not in store.docstore._dict for doc_id in ids[:10])
+    best = store.similarity_search("chunk 17", k=1)[0]
+    assert best.page_content == "chunk 17"
+
+
+@pytest.mark.parametrize("kind", ["hnsw", "ivf_sq8"])
+def test_delete_tombstones_without_rebuilding_or_reembedding(monkeypatch, kind):
+    store, ids = make_store(200)
+    store.index = build_index(kind, DIMENSION, store.index.reconstruct_n(0, store.index.ntotal))
+    index = store.index
+    calls = store.embeddings.calls
+
+    def no_rebuild(*args, **kwargs):
+        raise AssertionError("a small delete must not rebuild the index")
+
+    monkeypatch.setattr(ann_index, "build_index", no_rebuild)
+    monkeypatch.setattr(ann_index, "empty_like", no_rebuild)
+    delete_from_vectorstore(store, [ids[3]])
+
+    assert store.index is index
+    assert tombstones(index) == {3}
+    assert store.embeddings.calls == calls
+    results = store.similarity_search_with_score_by_vector(HashEmbeddings().embed_query("chunk 3"), k=5)
+    assert "chunk 3" not in [doc.page_content for doc, _ in results]
+    assert len(results) == 5
+
+    # Labels stay aligned with the docstore for later appends
+    new_ids = append_to_vectorstore(store, ["late chunk"], metadatas=[{"i": 200}])
+    assert store.index_to_docstore_id[200] == new_ids[0]
+    assert store.similarity_search("late chunk", k=1)[0].page_content == "late chunk"
+
+
+def test_compacting_ivf_keeps_the_trained_index_and_skips_reembedding():
+    store, ids = make_store(200)
+    store.index = build_index("ivf_sq8", DIMENSION, store.index.reconstruct_n(0, store.index.ntotal))
+    calls = store.embeddings.calls
+
+    delete_from_vectorstore(store, ids[:50])
+
+    assert index_kind(store.index) == "ivf_sq8"
+    assert store.index.ntotal == 150
+    assert not tombstones(store.index)
+    assert store.embeddings.calls == calls
+    assert list(store.index_to_docstore_id.values()) == ids[50:]
+    assert store.similarity_search("chunk 120", k=1)[0].page_content == "chunk 120"
+
+
+def test_tombstones_survive_save_and_load(tmp_path):
+    from utils.vectorstore import load_vectorstore, save_vectorstore
+
+    store, ids = make_store(100)
+    store.index = build_index("hnsw", DIMENSION, store.index.reconstruct_n(0, store.index.ntotal))
+    delete_from_vectorstore(store, [ids[7]])
+    save_vectorstore(store, str(tmp_path))
+
+    loaded = load_vectorstore(str(tmp_path), HashEmbeddings())
+
+    assert tombstones(loaded.index) == {7}
+    results = loaded.similarity_search("chunk 7", k=10)
+    assert "chunk 7" not in [doc.page_content for doc in results]
+
+
+def test_searches_run_while_the_replacement_index_is_built(monkeypatch):
+    store, ids = make_store(40)
+    store.index = build_index("hnsw", DIMENSION, store.index.reconstruct_n(0, store.index.ntotal))
+    building = threading.Event()
+    release = threading.Event()
+    real_build = ann_index.build_index
+
+    def slow_build(*args, **kwargs):
+        building.set()
+        release.wait(10)
+        return real_build(*args, **kwargs)
+
+    monkeypatch.setattr(ann_index, "build_index", slow_build)
+    deleter = threading.Thread(target=delete_from_vectorstore, args=(store, ids[:10]))
+    deleter.start()
+    assert building.wait(10)
+
+    # Neither a search nor an append waits for the build
+    with store.lock.read():
+        assert store.similarity_search("chunk 13", k=1)[0].page_content == "chunk 13"
+    new_ids = append_to_vectorstore(store, ["late chunk"], metadatas=[{"i": 40}])
+
+    release.set()
+    deleter.join(10)
+    assert not deleter.is_alive()
+    assert list(store.index_to_docstore_id.values()) == ids[10:] + new_ids
+    assert store.similarity_search("late chunk", k=1)[0].page_content == "late chunk"
@@ -0,0 +1,15 @@
+"""Semantic answer cache in utils/answer_cache.py"""
+
+from utils.answer_cache import SemanticAnswerCache, retrieval_key
+
+
+def test_answers_are_not_shared_across_search_types_or_k():
+    cache = SemanticAnswerCache(threshold=0.95)
+    vector = [1.0, 0.0, 0.0]
+    cache.store("What is X?", vector, "docs-v1", "answer from 2 chunks", "ctx",
+                retrieval=retrieval_key("similarity", 2))
+
+    assert cache.lookup(vector, "docs-v1", retrieval=retrieval_key("similarity", 2))["answer"] == "answer from 2 chunks"
+    assert cache.lookup(vector, "docs-v1", retrieval=retrieval_key("similarity", 8)) is None
+    assert cache.lookup(vector, "docs-v1", retrieval=retrieval_key("mmr", 2)) is None
+    assert cache.lookup(vector, "docs-v2", retrieval=retrieval_key("similarity", 2)) is None
@@ -0,0 +1,130 @@
+"""HTTP API tests against the local stub Ollama backends (utils/stub_backends.py)"""
+
+import json
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from utils.stub_backends import fake_completion
+
+DOCUMENT_TEXTS = [
+    "The pump is rated for a maximum pressure of 50 bar at 20 degrees.",
+    "Warranty claims require the original purchase date and serial number.",
+    "Replace the inlet filter every 500 operating hours or once a year.",
+]
+
+
+@pytest.fixture(scope="module")
+def api_module():
+    # Environment and working directory come from conftest.py
+    import api
+    return api
+
+
+def run_with_service(api, scenario):
+    """Run scenario(service, client) inside the app lifespan, with a seeded index"""
+    from utils.vectorstore import append_to_vectorstore
+
+    async def main():
+        async with api.lifespan(api.app):
+            service = api.app.state.service
+            if service.vector_store.index.ntotal == 0:
+                await asyncio.to_thread(
+                    append_to_vectorstore, service.vector_store, DOCUMENT_TEXTS,
+                    metadatas=[{"source": "manual.pdf", "chunk_index": i} for i in range(len(DOCUMENT_TEXTS))]
+                )
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://api", timeout=30) as client:
+                return await scenario(service, client)
+    return asyncio.run(main())
+
+
+async def asgi_body_chunks(app, path, payload):
+    """POST through the raw ASGI interface and return each body message separately"""
+    body = json.dumps(payload).encode("utf-8")
+    received = False
+    messages = []
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.sleep(3600)
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"host", b"api")],
+        "server": ("api", 80), "client": ("test", 1234), "root_path": "",
+    }
+    await app(scope, receive, send)
+    start = next(message for message in messages if message["type"] == "http.response.start")
+    chunks = [message["body"] for message in messages if message["type"] == "http.response.body" and message["body"]]
+    return start["status"], chunks
+
+
+def test_search_returns_matching_chunks(api_module):
+    async def scenario(service, client):
+        response = await client.post("/search", json={"query": "maximum pressure", "k": 2})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert len(results) == 2
+        assert all(result["metadata"]["source"] == "manual.pdf" for result in results)
+        assert {result["content"] for result in results} <= set(DOCUMENT_TEXTS)
+
+        response = await client.post("/search", json={"query": "pressure", "search_type": "bogus"})
+        assert response.status_code == 422
+
+    run_with_service(api_module, scenario)
+
+
+def test_concurrent_searches_share_one_embedding_request(api_module, stub_server):
+    async def scenario(service, client):
+        before = stub_server.embed_requests
+        responses = await asyncio.gather(*[
+            client.post("/search", json={"query": f"filter interval question {i}", "k": 1})
+            for i in range(16)
+        ])
+        assert [response.status_code for response in responses] == [200] * 16
+        return stub_server.embed_requests - before
+
+    assert run_with_service(api_module, scenario) == 1
+
+
+def test_answer_streams_tokens_from_the_llm(api_module, stub_server):
+    async def scenario(service, client):
+        before = stub_server.generate_requests
+        status, chunks = await asgi_body_chunks(
+            api_module.app, "/answer", {"question": "How often is the filter replaced?", "user_id": "u1"}
+        )
+        assert status == 200
+        assert stub_server.generate_requests == before + 1
+        return chunks
+
+    chunks = run_with_service(api_module, scenario)
+    # The stub sends one word per message; the endpoint forwards them as they arrive
+    assert len(chunks) > 1
+    answer = b"".join(chunks).decode("utf-8")
+    assert answer.startswith("Stub answer (")
+    assert "prompt characters" in answer
+
+
+def test_answer_without_streaming_returns_json(api_module):
+    async def scenario(service, client):
+        response = await client.post(
+            "/answer", json={"question": "What is the maximum pressure?", "stream": False, "user_id": "u2"}
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    payload = run_with_service(api_module, scenario)
+    assert payload["cached"] is False
+    assert payload["answer"].startswith("Stub answer")
+    assert payload["answer"] != fake_completion("")
+    assert payload["sources"]
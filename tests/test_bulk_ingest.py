@@ -0,0 +1,106 @@
+"""Checkpointed bulk ingestion in utils/bulk_ingest.py"""
+
+from concurrent.futures import Future
+
+import pytest
+
+import utils.bulk_ingest as bulk_ingest
+from utils.doc_registry import DocumentRegistry
+from utils.stub_backends import FakeEmbeddings
+from utils.vectorstore import init_vectorstore
+
+
+class InlinePool:
+    """Runs each parse in the calling process, so the monkeypatched parser is used"""
+
+    def __init__(self, max_workers, mp_context=None, initializer=None):
+        pass
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@pytest.fixture
+def bulk(tmp_path, monkeypatch):
+    parsed = []
+    interrupt_at = set()
+
+    def fake_parse(path, doc_hash, figures_root):
+        if path in interrupt_at:
+            raise KeyboardInterrupt
+        parsed.append(path)
+        return {
+            "path": path,
+            "doc_hash": doc_hash,
+            "source": path,
+            "chunks": [(f"{path} chunk {i}", {"page_number": 1}) for i in range(2)],
+            "figures": [],
+            "figures_dir": str(tmp_path / "figures" / doc_hash),
+            "pages": 1,
+            "parse_seconds": 0.0,
+        }
+
+    registry = DocumentRegistry(str(tmp_path / "documents.db"))
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(bulk_ingest, "ProcessPoolExecutor", InlinePool)
+    monkeypatch.setattr(bulk_ingest, "parse_document", fake_parse)
+    monkeypatch.setattr(bulk_ingest, "validate_pdf", lambda path: None)
+    monkeypatch.setattr(bulk_ingest, "fingerprint_file", lambda path: f"hash-{path}")
+    monkeypatch.setattr(bulk_ingest, "get_registry", lambda: registry)
+    monkeypatch.setattr(bulk_ingest, "init_vectorstore",
+                        lambda index_dir, mmap: init_vectorstore(index_dir, mmap=mmap, embeddings=embeddings))
+
+    def run(paths, checkpoint="checkpoint.json"):
+        return bulk_ingest.run(
+            paths, index_dir=str(tmp_path / "index"), checkpoint_path=str(tmp_path / checkpoint),
+            workers=1, batch_size=4, save_every=1, figures_root=str(tmp_path / "figures"), captions=False
+        )
+
+    run.parsed = parsed
+    run.interrupt_at = interrupt_at
+    run.registry = registry
+    return run
+
+
+def test_interrupted_run_resumes_after_the_last_checkpoint(bulk, tmp_path):
+    paths = ["a.pdf", "b.pdf", "c.pdf", "d.pdf"]
+    bulk.interrupt_at.add("c.pdf")
+    first = bulk(paths)
+
+    assert first["interrupted"]
+    assert first["indexed"] == 2
+    checkpoint = bulk_ingest.Checkpoint(str(tmp_path / "checkpoint.json"))
+    assert [checkpoint.status(path) for path in paths] == ["indexed", "indexed", None, None]
+
+    bulk.parsed.clear()
+    bulk.interrupt_at.clear()
+    second = bulk(paths)
+
+    assert not second["interrupted"]
+    assert bulk.parsed == ["c.pdf", "d.pdf"]
+    assert second["indexed"] == 2
+    assert second["vectors"] == 8
+    checkpoint = bulk_ingest.Checkpoint(str(tmp_path / "checkpoint.json"))
+    assert all(checkpoint.status(path) == "indexed" for path in paths)
+
+
+def test_registered_documents_are_skipped_without_parsing(bulk):
+    bulk(["a.pdf", "b.pdf"])
+    bulk.parsed.clear()
+
+    # A fresh checkpoint still finds both documents in the registry and the index
+    summary = bulk(["a.pdf", "b.pdf", "c.pdf"], checkpoint="other.json")
+
+    assert bulk.parsed == ["c.pdf"]
+    assert summary["skipped"] == 2
+    assert summary["indexed"] == 1
+    assert summary["vectors"] == 6
+    assert bulk.registry.get("hash-a.pdf")["chunk_ids"]
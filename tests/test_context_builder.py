@@ -0,0 +1,36 @@
+from langchain_core.documents import Document
+
+from utils.context_builder import merge_overlapping
+
+
+def chunk(text, start, doc_hash, chunk_index, source="manual.pdf"):
+    return Document(page_content=text, metadata={
+        "source": source, "doc_hash": doc_hash, "start_index": start, "chunk_index": chunk_index,
+    })
+
+
+def test_overlapping_chunks_of_one_document_are_merged():
+    docs = [chunk("The pump is rated for 50 bar", 0, "a", 0), chunk("50 bar maximum pressure.", 22, "a", 1)]
+    merged, folded = merge_overlapping(docs)
+    assert folded == 1
+    assert [doc.page_content for doc in merged] == ["The pump is rated for 50 bar maximum pressure."]
+
+
+def test_same_file_name_from_different_documents_is_not_merged():
+    docs = [
+        chunk("The pump is rated for 50 bar maximum pressure.", 0, "hash-pump", 0),
+        chunk("Warranty runs from purchase date in EU.", 30, "hash-warranty", 1),
+    ]
+    merged, folded = merge_overlapping(docs)
+    assert folded == 0
+    assert [doc.page_content for doc in merged] == [doc.page_content for doc in docs]
+
+
+def test_chunks_without_a_document_hash_pass_through():
+    docs = [
+        Document(page_content="old chunk one", metadata={"source": "a.pdf", "start_index": 0}),
+        Document(page_content="chunk one again", metadata={"source": "a.pdf", "start_index": 4}),
+    ]
+    merged, folded = merge_overlapping(docs)
+    assert folded == 0
+    assert merged == docs
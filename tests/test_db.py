@@ -0,0 +1,205 @@
+"""Chat history storage in app/db.py, against the SQLite backend"""
+
+import time
+
+import pytest
+
+import app.db as db
+from app.db import HistoryCache
+
+
+def test_generations_are_only_kept_for_cached_or_in_flight_users():
+    cache = HistoryCache(max_users=2)
+    for i in range(100):
+        cache.invalidate(f"writer-{i}")
+    assert not cache._generations
+
+    for user_id in ("a", "b", "c"):
+        generation = cache.begin_read(user_id)
+        cache.put(user_id, None, [], generation)
+        cache.end_read(user_id)
+    assert set(cache._users) == {"b", "c"}
+    assert set(cache._generations) == {"b", "c"}
+
+    cache.invalidate("b")
+    assert set(cache._generations) == {"c"}
+
+
+@pytest.fixture
+def chat_db(tmp_path, monkeypatch):
+    """A fresh SQLite database, pool, history cache and writer for one test"""
+    monkeypatch.setattr(db, "DB_SQLITE_PATH", str(tmp_path / "chats.db"))
+    monkeypatch.setattr(db, "_pool", None)
+    monkeypatch.setattr(db, "_schema_ready", False)
+    monkeypatch.setattr(db, "_writer", None)
+    monkeypatch.setattr(db, "history_cache", HistoryCache())
+    yield db
+    if db._writer is not None:
+        db._writer.close()
+    if db._pool is not None:
+        db._pool.closeall()
+
+
+def _questions(rows):
+    return [row["question"] for row in rows]
+
+
+def test_keyset_pages_cover_rows_with_equal_timestamps(chat_db):
+    for i in range(7):
+        chat_db.save_chat("alice", f"q{i}", f"a{i}", sync=True)
+    chat_db.save_chat("bob", "other", "answer", sync=True)
+
+    pages, before_id = [], None
+    while True:
+        page = chat_db.get_chat_history("alice", limit=3, before_id=before_id)
+        if not page:
+            break
+        pages.append(_questions(page))
+        before_id = page[-1]["id"]
+
+    # Rows saved within one second share a timestamp; the id breaks the tie
+    assert pages == [["q6", "q5", "q4"], ["q3", "q2", "q1"], ["q0"]]
+
+
+def test_sync_save_invalidates_the_cached_page(chat_db):
+    chat_db.save_chat("alice", "first", "answer", sync=True)
+    assert _questions(chat_db.get_chat_history("alice")) == ["first"]
+
+    chat_db.save_chat("alice", "second", "answer", sync=True)
+
+    assert _questions(chat_db.get_chat_history("alice")) == ["second", "first"]
+
+
+def test_write_behind_save_invalidates_the_cached_page(chat_db):
+    chat_db.save_chat("alice", "first", "answer", sync=True)
+    assert _questions(chat_db.get_chat_history("alice")) == ["first"]
+
+    chat_db.save_chat("alice", "queued", "answer")
+    chat_db.get_chat_writer().flush()
+
+    assert _questions(chat_db.get_chat_history("alice")) == ["queued", "first"]
+
+
+def test_page_read_before_a_write_is_not_cached(chat_db, monkeypatch):
+    chat_db.save_chat("alice", "first", "answer", sync=True)
+    real_cursor = chat_db._dict_cursor
+
+    class WriteAfterFetch:
+        # Another session saves between this read's query and its cache put
+        def __init__(self, cursor):
+            self.cursor = cursor
+
+        def execute(self, *args):
+            return self.cursor.execute(*args)
+
+        def fetchall(self):
+            rows = self.cursor.fetchall()
+            chat_db.save_chat("alice", "during read", "answer", sync=True)
+            return rows
+
+        def close(self):
+            self.cursor.close()
+
+    monkeypatch.setattr(chat_db, "_dict_cursor", lambda conn: WriteAfterFetch(real_cursor(conn)))
+    assert _questions(chat_db.get_chat_history("alice")) == ["first"]
+    monkeypatch.setattr(chat_db, "_dict_cursor", real_cursor)
+
+    assert _questions(chat_db.get_chat_history("alice")) == ["during read", "first"]
+
+
+def test_chat_context_is_only_returned_to_its_owner(chat_db):
+    chat_db.save_chat("alice", "question", "answer", context="alice's sources", sync=True)
+    chat_id = chat_db.get_chat_history("alice")[0]["id"]
+
+    assert chat_db.get_chat_context(chat_id, "alice") == "alice's sources"
+    assert chat_db.get_chat_context(chat_id, "mallory") is None
+
+
+def _count(chat_db, user_id):
+    with chat_db.get_pool().connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM chat_history WHERE user_id = ?", (user_id,))
+        count = cur.fetchone()[0]
+        cur.close()
+    return count
+
+
+def test_pool_replaces_connections_that_fail_the_health_check(monkeypatch):
+    import sqlite3
+
+    created = []
+
+    def factory():
+        created.append(sqlite3.connect(":memory:", check_same_thread=False))
+        return created[-1]
+
+    pool = db.ConnectionPool(factory, minconn=1, maxconn=2)
+    monkeypatch.setattr(db, "DB_HEALTH_CHECK_AFTER", 0)
+    # The server dropped the idle connection
+    created[0].close()
+
+    conn = pool.getconn()
+
+    assert conn is created[1]
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+
+
+def test_pool_never_opens_more_than_maxconn():
+    import sqlite3
+
+    pool = db.ConnectionPool(lambda: sqlite3.connect(":memory:", check_same_thread=False), minconn=0, maxconn=2)
+    first, second = pool.getconn(), pool.getconn()
+
+    with pytest.raises(TimeoutError):
+        pool.getconn(timeout=0.1)
+    pool.putconn(first)
+    assert pool.getconn(timeout=0.1) is first
+    pool.putconn(second)
+
+
+def test_writer_batches_rows_and_retries_while_the_database_is_down(chat_db, monkeypatch):
+    import sqlite3
+    import threading
+
+    chat_db.create_chat_table()
+    real_insert = chat_db._insert_rows
+    database_up = threading.Event()
+    attempts, written = [], []
+
+    def flaky_insert(conn, rows):
+        attempts.append(len(rows))
+        if not database_up.is_set():
+            raise sqlite3.OperationalError("database is down")
+        real_insert(conn, rows)
+        written.append(len(rows))
+
+    monkeypatch.setattr(chat_db, "_insert_rows", flaky_insert)
+    writer = chat_db.ChatWriter(batch_size=4, flush_interval=0.05)
+    for i in range(10):
+        writer.submit(("alice", f"q{i}", "a", None, None))
+    while not attempts:
+        time.sleep(0.01)
+    time.sleep(0.6)
+    assert len(attempts) >= 2 and not written
+
+    database_up.set()
+    writer.flush()
+    writer.close()
+
+    assert _count(chat_db, "alice") == 10
+    assert sum(written) == 10 and max(written) <= 4
+    # Rows queued during the outage go out in full batches, not one by one
+    assert len(written) <= 4
+
+
+def test_writer_flushes_queued_rows_on_close(chat_db):
+    chat_db.create_chat_table()
+    writer = chat_db.ChatWriter(batch_size=50, flush_interval=5)
+    for i in range(20):
+        writer.submit(("alice", f"q{i}", "a", None, None))
+
+    writer.close()
+
+    assert not writer._thread.is_alive()
+    assert _count(chat_db, "alice") == 20
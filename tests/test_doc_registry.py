@@ -0,0 +1,22 @@
+"""Corpus fingerprint of utils/doc_registry.py and the answer cache keyed by it"""
+
+from utils.answer_cache import SemanticAnswerCache
+from utils.doc_registry import DocumentRegistry
+
+
+def test_reindexing_a_document_invalidates_cached_answers(tmp_path):
+    registry = DocumentRegistry(str(tmp_path / "registry.db"))
+    cache = SemanticAnswerCache(threshold=0.9)
+    registry.register("hash-a", "manual.pdf", ["c1", "c2"], {"chunk_size": 800})
+    before = registry.fingerprint()
+    cache.store("What is the maximum pressure?", [1.0, 0.0], before, "50 bar", "context")
+    assert cache.lookup([1.0, 0.0], before) is not None
+
+    # Same document set, new parse parameters and chunks
+    registry.register("hash-a", "manual.pdf", ["c3", "c4", "c5"], {"chunk_size": 400})
+    after = registry.fingerprint()
+    assert after != before
+    assert cache.lookup([1.0, 0.0], after) is None
+
+    registry.remove("hash-a")
+    assert registry.fingerprint() not in (before, after)
@@ -0,0 +1,52 @@
+"""On-disk embedding cache in utils/embedding_cache.py"""
+
+import pytest
+
+from utils.embedding_cache import CachedEmbeddings, EmbeddingCache, cache_key
+from utils.stub_backends import FakeEmbeddings
+
+
+def test_repeated_texts_are_served_from_the_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"))
+    model = FakeEmbeddings(dim=16)
+    embeddings = CachedEmbeddings(model, cache)
+
+    first = embeddings.embed_documents(["alpha", "beta", "alpha"])
+    assert model.calls == 1
+    assert cache.stats()["misses"] == 3 and cache.stats()["entries"] == 2
+
+    # Whitespace and unicode normalization share a key
+    second = embeddings.embed_documents(["alpha", "  beta "])
+    assert model.calls == 1
+    # Vectors are stored as float32
+    assert second[0] == pytest.approx(first[0], abs=1e-6)
+    assert second[1] == pytest.approx(first[1], abs=1e-6)
+    assert cache.stats()["hits"] == 2
+
+    # A new process opening the same file starts warm
+    reopened = CachedEmbeddings(model, EmbeddingCache(str(tmp_path / "embeddings.db")))
+    assert reopened.embed_query("beta") == pytest.approx(first[1], abs=1e-6)
+    assert model.calls == 1
+
+
+def test_models_never_share_cached_vectors(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"))
+    small = CachedEmbeddings(FakeEmbeddings(dim=8, model="small"), cache)
+    large = CachedEmbeddings(FakeEmbeddings(dim=16, model="large"), cache)
+
+    assert len(small.embed_query("same text")) == 8
+    assert len(large.embed_query("same text")) == 16
+    assert large.underlying.calls == 1
+    assert cache_key("small", "same text") != cache_key("large", "same text")
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.db"), max_entries=10)
+    cache.put_many({f"key-{i}": [float(i)] for i in range(10)})
+    cache.get_many(["key-0"])
+
+    cache.put_many({"key-new": [1.0]})
+
+    assert cache.stats()["entries"] == 9
+    assert set(cache.get_many(["key-0", "key-new"])) == {"key-0", "key-new"}
+    assert not cache.get_many(["key-1"])
@@ -0,0 +1,50 @@
+"""In-flight cap of utils/embedding_executor.py"""
+
+import time
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from utils.embedding_executor import EmbeddingExecutor
+
+
+class SlowEmbeddings(Embeddings):
+    """Records the highest number of concurrent requests"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def _request(self, count):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return [[float(i), 1.0] for i in range(count)]
+
+    def embed_documents(self, texts):
+        return self._request(len(texts))
+
+    def embed_query(self, text):
+        return self._request(1)[0]
+
+
+def test_inline_and_pooled_requests_share_the_cap():
+    backend = SlowEmbeddings()
+    executor = EmbeddingExecutor(backend, batch_size=2, max_in_flight=2)
+    calls = [
+        lambda: executor.embed_query("question"),
+        lambda: executor.embed_documents(["one chunk"]),
+        lambda: executor.embed_documents([f"chunk {i}" for i in range(8)]),
+    ] * 4
+    threads = [threading.Thread(target=call) for call in calls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert backend.peak == 2
+    assert executor.embed_documents(["a", "b", "c"]) == [[0.0, 1.0], [1.0, 1.0], [0.0, 1.0]]
@@ -0,0 +1,89 @@
+"""BM25 index (utils/lexical_index.py) and hybrid retrieval (utils/hybrid_search.py)"""
+
+import pytest
+
+from utils.hybrid_search import HybridRetriever, hybrid_search, reciprocal_rank_fusion
+from utils.lexical_index import BM25Index, tokenize
+from utils.rwlock import ReadWriteLock
+from utils.stub_backends import FakeEmbeddings
+from utils.vectorstore import append_to_vectorstore, create_empty_vectorstore
+
+TEXTS = [
+    "error 0x80070005 when installing update KB5034441",
+    "the installer needs administrator rights",
+    "restart the machine after installing updates",
+    "disk cleanup frees space for updates",
+]
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    assert tokenize("Error AB-1234/5") == ["error", "ab-1234/5", "ab", "1234", "5"]
+
+
+def test_deleted_documents_leave_the_statistics():
+    index = BM25Index()
+    index.add_many(["a", "b", "c", "d", "e"], ["shared term alpha", "shared term", "shared", "other words", "more"])
+    index.delete(["b"])
+
+    fresh = BM25Index()
+    fresh.add_many(["a", "c", "d", "e"], ["shared term alpha", "shared", "other words", "more"])
+
+    # Tombstoned postings are ignored by df and the average length right away
+    assert index._deleted
+    results, expected = index.search("shared term", k=4), fresh.search("shared term", k=4)
+    assert [doc_id for doc_id, _ in results] == [doc_id for doc_id, _ in expected]
+    assert [score for _, score in results] == pytest.approx([score for _, score in expected])
+
+
+def test_compaction_renumbers_and_keeps_results():
+    index = BM25Index()
+    doc_ids = [f"doc-{i}" for i in range(10)]
+    index.add_many(doc_ids, [f"common word{i}" for i in range(10)])
+
+    index.delete(doc_ids[:3])
+
+    assert not index._deleted
+    assert index._doc_ids == doc_ids[3:]
+    assert len(index) == 7
+    assert index.search("word5", k=1)[0][0] == "doc-5"
+    assert "word1" not in index._postings
+    index.add("doc-new", "word1 again")
+    assert index.search("word1", k=1)[0][0] == "doc-new"
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]], k=60)
+
+    assert fused[:2] == ["a", "c"]
+    assert set(fused) == {"a", "b", "c", "d"}
+    assert reciprocal_rank_fusion([]) == []
+
+
+def make_store():
+    store = create_empty_vectorstore(FakeEmbeddings(dim=32))
+    store.lock = ReadWriteLock()
+    store.lexical_index = BM25Index()
+    ids = append_to_vectorstore(store, TEXTS, metadatas=[{"i": i} for i in range(len(TEXTS))])
+    return store, ids
+
+
+def test_hybrid_search_finds_exact_identifiers_the_vectors_miss():
+    store, _ = make_store()
+
+    docs = hybrid_search(store, "0x80070005", k=2, fetch_k=4)
+
+    # Stub embeddings are random per text, so only BM25 can rank this first
+    assert docs[0].page_content == TEXTS[0]
+    assert len(docs) == 2
+
+
+def test_hybrid_search_skips_deleted_documents():
+    from utils.ann_index import delete_from_vectorstore
+
+    store, ids = make_store()
+    delete_from_vectorstore(store, [ids[0]])
+
+    docs = HybridRetriever(vector_store=store, k=4, fetch_k=4).invoke("0x80070005 installing")
+
+    assert TEXTS[0] not in [doc.page_content for doc in docs]
+    assert len(docs) == 3
@@ -0,0 +1,56 @@
+"""Streaming ingest in utils/ingest.py"""
+
+import os
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import utils.ingest as ingest
+from utils.vectorstore import create_empty_vectorstore
+
+
+class HashEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return np.random.default_rng(len(text)).random(8).tolist()
+
+
+def test_failed_ingest_removes_the_chunks_it_indexed(monkeypatch):
+    def elements(file_path, figures_dir):
+        for page in range(1, 6):
+            yield {"type": "NarrativeText", "text": f"Page {page} text. " * 100, "metadata": {"page_number": page}}
+        raise RuntimeError("corrupt page 6")
+
+    monkeypatch.setattr(ingest, "iter_elements_from_pdf", elements)
+    store = create_empty_vectorstore(HashEmbeddings())
+    indexed = []
+
+    with pytest.raises(RuntimeError, match="corrupt page 6"):
+        ingest.ingest_pdf(store, "broken.pdf", batch_size=2, doc_hash="abc", on_progress=indexed.append)
+
+    assert indexed and indexed[-1] > 0
+    assert store.index.ntotal == 0
+    assert not store.docstore._dict
+
+
+def test_each_ingest_crops_figures_into_its_own_directory(monkeypatch):
+    seen = []
+
+    def elements(file_path, figures_dir):
+        seen.append(figures_dir)
+        with open(f"{figures_dir}/figure-1.png", "wb") as f:
+            f.write(b"png")
+        yield {"type": "NarrativeText", "text": f"Text of {file_path}.", "metadata": {"page_number": 1}}
+
+    monkeypatch.setattr(ingest, "iter_elements_from_pdf", elements)
+    store = create_empty_vectorstore(HashEmbeddings())
+
+    ingest.ingest_pdf(store, "a.pdf", doc_hash="same")
+    ingest.ingest_pdf(store, "b.pdf", doc_hash="same")
+
+    assert len(set(seen)) == 2
+    assert all(path.startswith(ingest.FIGURES_ROOT) for path in seen)
+    assert not any(os.path.exists(path) for path in seen)
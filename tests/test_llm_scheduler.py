@@ -0,0 +1,137 @@
+"""Admission control in utils/llm_scheduler.py"""
+
+import asyncio
+
+import pytest
+
+from utils.llm_scheduler import ClientDisconnected, GenerationScheduler
+
+
+def test_disconnected_client_leaves_the_queue():
+    scheduler = GenerationScheduler(max_concurrent=1, max_queue=4, queue_timeout=10)
+
+    async def scenario():
+        holder = await scheduler.acquire("alice")
+        gone = asyncio.Event()
+
+        async def is_disconnected():
+            return gone.is_set()
+
+        waiter = asyncio.create_task(scheduler.acquire("bob", is_disconnected=is_disconnected, poll_interval=0.01))
+        await asyncio.sleep(0.05)
+        assert scheduler.queued == 1
+        gone.set()
+        with pytest.raises(ClientDisconnected):
+            await waiter
+        assert scheduler.queued == 0
+
+        # The slot goes to the next live request, not the abandoned one
+        scheduler.release(holder)
+        assert scheduler.active == 0
+        ticket = await scheduler.acquire("carol", timeout=1)
+        assert scheduler.active == 1
+        scheduler.release(ticket)
+
+    asyncio.run(scenario())
+
+
+def test_never_runs_more_than_max_concurrent():
+    scheduler = GenerationScheduler(max_concurrent=2, max_queue=10, max_queued_per_user=10)
+    tickets = [scheduler._enqueue(f"user-{i}") for i in range(5)]
+
+    assert [t.state for t in tickets] == ["granted", "granted", "queued", "queued", "queued"]
+    assert (scheduler.active, scheduler.queued) == (2, 3)
+
+    scheduler.release(tickets[0])
+    assert tickets[2].state == "granted"
+    assert (scheduler.active, scheduler.queued) == (2, 2)
+    # Releasing twice must not free a second slot
+    scheduler.release(tickets[0])
+    assert scheduler.active == 2
+
+
+def test_waiting_requests_are_served_round_robin_across_users():
+    scheduler = GenerationScheduler(max_concurrent=1, max_queue=10, max_queued_per_user=5)
+    running = scheduler._enqueue("busy")
+    queued = [scheduler._enqueue(user) for user in ["alice", "alice", "alice", "bob", "carol"]]
+
+    order = []
+    current = running
+    for _ in queued:
+        scheduler.release(current)
+        current = next(t for t in queued if t.state == "granted")
+        order.append(current.user_id)
+
+    assert order == ["alice", "bob", "carol", "alice", "alice"]
+
+
+def test_full_queue_and_per_user_limit_are_rejected_at_once():
+    from utils.llm_scheduler import SchedulerOverloaded, rejections
+
+    scheduler = GenerationScheduler(max_concurrent=1, max_queue=3, max_queued_per_user=2)
+    scheduler._enqueue("alice")
+    scheduler._enqueue("alice")
+    scheduler._enqueue("alice")
+    before = dict(rejections._values)
+
+    with pytest.raises(SchedulerOverloaded, match="user_limit"):
+        scheduler._enqueue("alice")
+    scheduler._enqueue("bob")
+    with pytest.raises(SchedulerOverloaded, match="queue_full"):
+        scheduler._enqueue("carol")
+
+    assert scheduler.queued == 3
+    increased = {key for key, value in rejections._values.items() if value > before.get(key, 0)}
+    assert increased == {(("reason", "user_limit"),), (("reason", "queue_full"),)}
+
+
+def test_queued_request_times_out():
+    from utils.llm_scheduler import SchedulerTimeout
+
+    scheduler = GenerationScheduler(max_concurrent=1, max_queue=4)
+    holder = scheduler._enqueue("alice")
+
+    with pytest.raises(SchedulerTimeout):
+        with scheduler.slot("bob", timeout=0.1):
+            pass
+    assert scheduler.queued == 0
+
+    async def scenario():
+        with pytest.raises(SchedulerTimeout):
+            await scheduler.acquire("bob", timeout=0.1)
+
+    asyncio.run(scenario())
+    assert (scheduler.active, scheduler.queued) == (1, 0)
+    scheduler.release(holder)
+    assert scheduler.active == 0
+
+
+def test_slot_granted_while_the_requester_gives_up_is_handed_on():
+    scheduler = GenerationScheduler(max_concurrent=1, max_queue=4)
+    holder = scheduler._enqueue("alice")
+    quitter = scheduler._enqueue("bob")
+    waiting = scheduler._enqueue("carol")
+
+    # The grant lands first, then the requester abandons its ticket
+    scheduler.release(holder)
+    assert quitter.state == "granted"
+    scheduler._abandon(quitter)
+
+    assert waiting.state == "granted"
+    assert (scheduler.active, scheduler.queued) == (1, 0)
+
+
+def test_slot_leaves_the_queue_when_on_wait_raises():
+    scheduler = GenerationScheduler(max_concurrent=1, max_queue=4)
+    holder = scheduler._enqueue("alice")
+
+    def stop(queued, waited):
+        raise RuntimeError("session ended")
+
+    with pytest.raises(RuntimeError):
+        with scheduler.slot("bob", timeout=10, on_wait=stop):
+            pass
+
+    assert scheduler.queued == 0
+    scheduler.release(holder)
+    assert scheduler.active == 0
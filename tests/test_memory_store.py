@@ -0,0 +1,136 @@
+"""Per-user memory maintenance in utils/memory_store.py"""
+
+import time
+
+import utils.memory_store as memory_store
+from utils.memory_store import UserMemoryStore
+from utils.stub_backends import FakeEmbeddings
+
+DAY = 86400
+
+
+def test_maintain_all_loads_each_index_once(tmp_path, monkeypatch):
+    memories = UserMemoryStore(FakeEmbeddings(), str(tmp_path / "memory"), max_loaded=0, ttl_days=30)
+    for user_id in ("alice", "bob"):
+        for i in range(3):
+            memories.add(user_id, f"question {i}", f"answer {i}")
+
+    loads = []
+    real_load = memory_store.load_vectorstore
+
+    def counting_load(index_dir, embeddings, mmap=False):
+        loads.append(index_dir)
+        return real_load(index_dir, embeddings, mmap)
+
+    monkeypatch.setattr(memory_store, "load_vectorstore", counting_load)
+    totals = memories.maintain_all(time.time() + 60 * DAY)
+
+    assert totals["users"] == 2
+    assert totals["evicted"] == 6
+    assert len(loads) == 2
+    assert memories.get("alice") is None
+
+
+def _remember_from_process(index_dir, name, rounds, barrier):
+    from utils.memory_store import UserMemoryStore
+    from utils.stub_backends import FakeEmbeddings
+
+    memories = UserMemoryStore(FakeEmbeddings(latency=0.01), index_dir)
+    # Both processes cache the same (empty) index before writing, like two API workers
+    memories.get("alice", create=True)
+    barrier.wait(30)
+    for i in range(rounds):
+        memories.add("alice", f"{name} question {i}", f"{name} answer {i}")
+
+
+def test_processes_adding_memories_keep_each_others_entries(tmp_path):
+    import multiprocessing
+
+    index_dir = str(tmp_path / "memory")
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(2)
+    writers = [
+        context.Process(target=_remember_from_process, args=(index_dir, name, 5, barrier))
+        for name in ("ui", "api")
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join(120)
+    assert [writer.exitcode for writer in writers] == [0, 0]
+
+    memories = UserMemoryStore(FakeEmbeddings(), index_dir)
+    questions = {doc.metadata["question"] for _, doc in memories._entries(memories.get("alice"))}
+    assert questions == {f"{name} question {i}" for name in ("ui", "api") for i in range(5)}
+
+
+def _questions(memories, user_id):
+    return sorted(doc.metadata["question"] for _, doc in memories._entries(memories.get(user_id)))
+
+
+def test_cap_evicts_the_oldest_memories(tmp_path):
+    memories = UserMemoryStore(FakeEmbeddings(), str(tmp_path / "memory"), max_per_user=3, ttl_days=0,
+                               compact_after_days=0)
+    for i in range(5):
+        memories.add("alice", f"question {i}", f"answer {i}")
+
+    assert _questions(memories, "alice") == ["question 2", "question 3", "question 4"]
+    # Other users are untouched by alice's cap
+    memories.add("bob", "question 0", "answer 0")
+    assert _questions(memories, "bob") == ["question 0"]
+
+
+def test_compact_merges_full_groups_and_keeps_the_trailing_partial_group(tmp_path):
+    memories = UserMemoryStore(FakeEmbeddings(), str(tmp_path / "memory"), ttl_days=0, compact_after_days=7,
+                               compact_batch=3, rebuild_ratio=1.0)
+    for i in range(8):
+        memories.add("alice", f"question {i}", f"answer {i}")
+    store = memories.get("alice")
+    for position, doc_id in store.index_to_docstore_id.items():
+        store.docstore.search(doc_id).metadata["created_at"] = 1000.0 + position
+
+    merged = memories._compact(store, "alice", now=1000.0 + 10 * DAY)
+
+    assert merged == 6
+    entries = sorted(memories._entries(store), key=lambda entry: entry[1].metadata["created_at"])
+    summaries = [doc for _, doc in entries if doc.metadata["type"] == memory_store.SUMMARY_TYPE]
+    assert [doc.metadata["merged"] for doc in summaries] == [3, 3]
+    assert [doc.metadata["question"] for doc in summaries] == ["question 0", "question 3"]
+    assert "question 1 -> answer 1" in summaries[0].page_content
+    leftover = [doc.metadata["question"] for _, doc in entries if doc.metadata["type"] == memory_store.MEMORY_TYPE]
+    assert leftover == ["question 6", "question 7"]
+
+    # Summaries are never merged again, and two memories do not fill a group
+    assert memories._compact(store, "alice", now=1000.0 + 10 * DAY) == 0
+
+
+def test_rebuild_after_deletions_keeps_the_index_type(tmp_path):
+    import faiss
+
+    memories = UserMemoryStore(FakeEmbeddings(), str(tmp_path / "memory"), ttl_days=0, compact_after_days=0,
+                               rebuild_ratio=0.5)
+    store = memories.get("alice", create=True)
+    store.index = faiss.IndexFlatIP(store.index.d)
+    for i in range(6):
+        memories.add("alice", f"question {i}", f"answer {i}")
+
+    ids = list(store.index_to_docstore_id.values())
+    memories._delete(store, ids[:2])
+    assert not memories._rebuild_if_fragmented(store)
+    memories._delete(store, ids[2:4])
+    assert memories._rebuild_if_fragmented(store)
+
+    assert isinstance(store.index, faiss.IndexFlatIP)
+    assert store.index.ntotal == 2
+    assert list(store.index_to_docstore_id.values()) == ids[4:]
+    assert set(store.docstore._dict) == set(ids[4:])
+    best = memories.search("alice", "Q: question 5\nA: answer 5", k=1)[0]
+    assert best.metadata["question"] == "question 5"
+
+
+def test_user_locks_do_not_grow_with_the_number_of_users(tmp_path):
+    memories = UserMemoryStore(FakeEmbeddings(), str(tmp_path / "memory"))
+    locks = {id(memories.user_lock(f"user-{i}")) for i in range(10_000)}
+
+    assert len(locks) <= memory_store.MEMORY_LOCK_STRIPES
+    assert memories.user_lock("alice") is memories.user_lock("alice")
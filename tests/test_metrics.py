@@ -0,0 +1,50 @@
+"""Prometheus exposition in utils/metrics.py"""
+
+from utils.metrics import MetricsRegistry
+
+
+def test_counters_and_gauges_render_with_help_type_and_labels():
+    registry = MetricsRegistry()
+    uploads = registry.counter("test_uploads_total", "Files uploaded")
+    uploads.inc(source="ui")
+    uploads.inc(2, source="api")
+    registry.gauge("test_queue_depth", "Items waiting").set(3)
+
+    lines = registry.render().splitlines()
+
+    assert lines[:4] == [
+        "# HELP test_uploads_total Files uploaded",
+        "# TYPE test_uploads_total counter",
+        'test_uploads_total{source="ui"} 1.0',
+        'test_uploads_total{source="api"} 2.0',
+    ]
+    assert lines[4:] == ["# HELP test_queue_depth Items waiting", "# TYPE test_queue_depth gauge", "test_queue_depth 3"]
+    # The same name returns the same metric
+    assert registry.counter("test_uploads_total", "Files uploaded") is uploads
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("test_latency_seconds", "Request latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe(value, stage="search")
+
+    lines = registry.render().splitlines()
+
+    assert lines == [
+        "# HELP test_latency_seconds Request latency",
+        "# TYPE test_latency_seconds histogram",
+        'test_latency_seconds_bucket{stage="search",le="0.1"} 1',
+        'test_latency_seconds_bucket{stage="search",le="1.0"} 3',
+        'test_latency_seconds_bucket{stage="search",le="+Inf"} 4',
+        'test_latency_seconds_count{stage="search"} 4',
+        'test_latency_seconds_sum{stage="search"} 6.05',
+    ]
+    assert latency.snapshot(stage="search") == {"count": 4, "sum": 6.05}
+
+
+def test_label_values_are_escaped_and_empty_labels_dropped():
+    registry = MetricsRegistry()
+    registry.counter("test_files_total", "Files").inc(document='a "quoted"\\path\nname', search_type=None)
+
+    assert registry.render().splitlines()[-1] == 'test_files_total{document="a \\"quoted\\"\\\\path\\nname"} 1.0'
@@ -0,0 +1,25 @@
+"""Streaming chunking in utils/parse_pdf.py"""
+
+import random
+
+from utils.parse_pdf import _get_splitter, iter_chunks
+
+
+def test_streamed_chunks_match_splitting_the_whole_document():
+    words = "pump valve filter pressure bar serial warranty the a of replace hours".split()
+    for trial in range(50):
+        rng = random.Random(trial)
+        elements = []
+        for _ in range(rng.randint(5, 40)):
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(1, 300)))
+            if rng.random() < 0.2:
+                text = text.replace(" the ", "\nthe ", 3)
+            elements.append({"text": text, "metadata": {"page_number": rng.randint(1, 9)}})
+        full_text = "\n\n".join(element["text"] for element in elements)
+
+        streamed = list(iter_chunks(elements, chunk_size=400, chunk_overlap=80))
+        expected = _get_splitter(400, 80).split_text(full_text)
+
+        assert [chunk for chunk, _ in streamed] == expected
+        for chunk, metadata in streamed:
+            assert full_text[metadata["start_index"]:metadata["start_index"] + len(chunk)] == chunk
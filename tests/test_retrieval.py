@@ -0,0 +1,57 @@
+"""Retrieval coordination in utils/retrieval.py"""
+
+from utils.memory_store import UserMemoryStore
+from utils.retrieval import QueryEmbeddingCache, RetrievalCoordinator
+from utils.rwlock import ReadWriteLock
+from utils.stub_backends import FakeEmbeddings
+from utils.vectorstore import append_to_vectorstore, create_empty_vectorstore
+
+TEXTS = [f"document chunk number {i}" for i in range(6)]
+
+
+def make_coordinator(tmp_path):
+    embeddings = FakeEmbeddings(dim=32)
+    store = create_empty_vectorstore(embeddings)
+    store.lock = ReadWriteLock()
+    append_to_vectorstore(store, TEXTS)
+    memories = UserMemoryStore(embeddings, str(tmp_path / "memory"))
+    memories.add("alice", "earlier question", "earlier answer")
+    embeddings.calls = 0
+    return RetrievalCoordinator(store, memories, query_cache=QueryEmbeddingCache()), embeddings
+
+
+def test_question_is_embedded_once_for_memory_and_documents(tmp_path):
+    coordinator, embeddings = make_coordinator(tmp_path)
+
+    memory_docs, doc_chunks = coordinator.retrieve("document chunk number 3", "alice", k=2)
+
+    assert embeddings.calls == 1
+    assert [doc.metadata["question"] for doc in memory_docs] == ["earlier question"]
+    assert doc_chunks[0].page_content == "document chunk number 3"
+
+    # Asking again (modulo whitespace) is served from the query cache
+    coordinator.retrieve("document  chunk number 3 ", "alice", k=2)
+    assert embeddings.calls == 1
+
+
+def test_precomputed_vector_skips_embedding(tmp_path):
+    coordinator, embeddings = make_coordinator(tmp_path)
+    vector = FakeEmbeddings(dim=32).embed_query("document chunk number 1")
+
+    _, doc_chunks = coordinator.retrieve("anything", "bob", k=1, vector=vector)
+
+    assert embeddings.calls == 0
+    assert doc_chunks[0].page_content == "document chunk number 1"
+
+
+def test_score_threshold_drops_weak_matches(tmp_path):
+    coordinator, _ = make_coordinator(tmp_path)
+
+    _, similar = coordinator.retrieve("document chunk number 4", "bob", search_type="similarity", k=4)
+    _, thresholded = coordinator.retrieve(
+        "document chunk number 4", "bob", search_type="similarity_score_threshold", k=4
+    )
+
+    assert len(similar) == 4
+    # Stub vectors of different texts are nearly orthogonal; only the exact chunk is relevant
+    assert [doc.page_content for doc in thresholded] == ["document chunk number 4"]
@@ -0,0 +1,109 @@
+"""Snapshot persistence in utils/vectorstore.py"""
+
+import os
+import time
+
+import pytest
+
+from utils.vectorstore import current_snapshot, load_vectorstore
+
+
+def test_loading_removes_stale_staging_dirs_only(tmp_path):
+    index_dir = tmp_path / "index"
+    stale = index_dir / ".snapshot-1-111.tmp"
+    fresh = index_dir / ".snapshot-2-222.tmp"
+    stale_pointer = index_dir / ".CURRENT.111.tmp"
+    for staging in (stale, fresh):
+        staging.mkdir(parents=True)
+        (staging / "index.faiss").write_bytes(b"partial")
+    stale_pointer.write_text("snapshot-1-111")
+    hour_ago = time.time() - 7200
+    for path in (stale, stale_pointer):
+        os.utime(path, (hour_ago, hour_ago))
+
+    assert load_vectorstore(str(index_dir), embeddings=None) is None
+
+    assert not stale.exists()
+    assert not stale_pointer.exists()
+    # A save may still be writing this one
+    assert fresh.exists()
+
+
+def _write_from_process(index_dir, name, rounds, barrier):
+    from utils.stub_backends import FakeEmbeddings
+    from utils.vectorstore import append_to_vectorstore, exclusive_writer, init_vectorstore, save_vectorstore
+
+    store = init_vectorstore(index_dir, mmap=False, embeddings=FakeEmbeddings(latency=0.01))
+    # Both processes start from the same (empty) index, like a UI and a bulk run
+    barrier.wait(30)
+    for i in range(rounds):
+        with exclusive_writer(store, index_dir):
+            append_to_vectorstore(store, [f"{name} chunk {i}"], metadatas=[{"writer": name}])
+            save_vectorstore(store, index_dir)
+
+
+def test_writers_in_separate_processes_keep_each_others_chunks(tmp_path):
+    import multiprocessing
+
+    from utils.stub_backends import FakeEmbeddings
+
+    index_dir = str(tmp_path / "index")
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(2)
+    writers = [
+        context.Process(target=_write_from_process, args=(index_dir, name, 5, barrier))
+        for name in ("ui", "bulk")
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join(120)
+    assert [writer.exitcode for writer in writers] == [0, 0]
+
+    store = load_vectorstore(index_dir, FakeEmbeddings())
+    texts = sorted(doc.page_content for doc in store.docstore._dict.values())
+    assert texts == sorted(f"{name} chunk {i}" for name in ("ui", "bulk") for i in range(5))
+    assert store.index.ntotal == 10
+
+
+def _memory_mb():
+    with open("/proc/self/status") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return {name: int(fields[name].split()[0]) / 1024 for name in ("RssAnon", "RssFile")}
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs Linux /proc")
+def test_mapped_index_stays_in_shared_file_pages(tmp_path):
+    import numpy as np
+    from langchain_community.vectorstores.faiss import dependable_faiss_import
+
+    from utils.stub_backends import FakeEmbeddings
+    from utils.vectorstore import append_to_vectorstore, create_empty_vectorstore, exclusive_writer, save_vectorstore
+
+    faiss = dependable_faiss_import()
+    index_dir = str(tmp_path / "index")
+    store = create_empty_vectorstore(FakeEmbeddings(dim=256))
+    vectors = np.random.default_rng(0).random((40000, 256), dtype=np.float32)
+    store.index.add(vectors)
+    store.index_to_docstore_id = {i: f"doc-{i}" for i in range(len(vectors))}
+    save_vectorstore(store, index_dir)
+    del store, vectors
+    index_mb = os.path.getsize(os.path.join(index_dir, current_snapshot(index_dir), "index.faiss")) / 2 ** 20
+
+    before = _memory_mb()
+    mapped = load_vectorstore(index_dir, FakeEmbeddings(dim=256), mmap=True)
+    # A flat search reads every vector
+    mapped.index.search(np.zeros((1, 256), dtype=np.float32), 1)
+    after = _memory_mb()
+
+    assert isinstance(mapped.index, faiss.IndexFlatL2) and mapped.read_only
+    assert after["RssAnon"] - before["RssAnon"] < index_mb / 4
+    assert after["RssFile"] - before["RssFile"] > index_mb / 2
+
+    # Writes go through a private copy; the store maps the new snapshot afterwards
+    with exclusive_writer(mapped, index_dir):
+        assert not mapped.read_only
+        append_to_vectorstore(mapped, ["new chunk"])
+        save_vectorstore(mapped, index_dir)
+    assert mapped.read_only and mapped.index.ntotal == 40001
+    assert mapped.snapshot == current_snapshot(index_dir)
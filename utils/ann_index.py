@@ -0,0 +1,278 @@
+
+import os
+import math
+import logging
+import threading
+from typing import Iterable, List, Tuple
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+from utils.rwlock import store_lock
+
+logger = logging.getLogger(__name__)
+
+# flat | hnsw | ivf_sq8 | ivf_pq | auto (hnsw, then ivf_pq for very large corpora)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "auto")
+ANN_THRESHOLD = int(os.getenv("ANN_THRESHOLD", 50_000))
+ANN_QUANTIZE_THRESHOLD = int(os.getenv("ANN_QUANTIZE_THRESHOLD", 1_000_000))
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", 200_000))
+
+# Recall/latency knobs: higher values trade speed and memory for recall
+HNSW_M = int(os.getenv("HNSW_M", 32))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", 200))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 64))
+IVF_NLIST = int(os.getenv("IVF_NLIST", 0))  # 0 derives it from the corpus size
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", 16))
+PQ_M = int(os.getenv("PQ_M", 16))
+PQ_NBITS = int(os.getenv("PQ_NBITS", 8))
+# Fraction of deleted-but-still-indexed vectors that triggers a compacting rebuild
+ANN_TOMBSTONE_RATIO = float(os.getenv("ANN_TOMBSTONE_RATIO", 0.2))
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_sq8", "ivf_pq")
+
+_rebuild_locks_guard = threading.Lock()
+
+
+def index_kind(index) -> str:
+    """Classify a FAISS index as one of INDEX_TYPES"""
+    faiss = dependable_faiss_import()
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return "ivf_sq8"
+    return "flat"
+
+
+def target_kind(ntotal: int, current: str, configured: str = VECTOR_INDEX_TYPE) -> str:
+    """Index type the store should use at its current size"""
+    if configured == "auto":
+        desired = "ivf_pq" if ntotal >= ANN_QUANTIZE_THRESHOLD else "hnsw"
+    elif configured in INDEX_TYPES:
+        desired = configured
+    else:
+        raise ValueError(f"Unknown VECTOR_INDEX_TYPE '{configured}'")
+
+    # Small stores stay exact until there is enough data to justify (and train) an ANN index
+    if desired != "flat" and current == "flat" and ntotal < ANN_THRESHOLD:
+        return "flat"
+    return desired
+
+
+def apply_search_params(index) -> None:
+    """Set query-time recall/latency parameters, which are not stored in the index file"""
+    faiss = dependable_faiss_import()
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+
+
+def _nlist(ntotal: int) -> int:
+    nlist = IVF_NLIST or int(4 * math.sqrt(ntotal))
+    # FAISS wants roughly 39 training points per centroid
+    return max(1, min(nlist, ntotal // 39))
+
+
+def _pq_m(dimension: int) -> int:
+    m = min(PQ_M, dimension)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def build_index(kind: str, dimension: int, vectors: np.ndarray):
+    """Create, train if needed, and fill an index of the given kind"""
+    faiss = dependable_faiss_import()
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if kind.startswith("ivf") and len(vectors) < 39:
+        logger.warning(f"Too few vectors ({len(vectors)}) to train {kind}; using a flat index")
+        kind = "flat"
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif kind in ("ivf_pq", "ivf_sq8"):
+        nlist = _nlist(len(vectors))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if kind == "ivf_pq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_m(dimension), PQ_NBITS)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_8bit)
+        sample = vectors
+        if len(vectors) > ANN_TRAIN_SAMPLE:
+            rows = np.random.default_rng(0).choice(len(vectors), ANN_TRAIN_SAMPLE, replace=False)
+            sample = vectors[rows]
+        logger.info(f"Training {kind} index (nlist={nlist}) on {len(sample)} vectors")
+        index.train(sample)
+    else:
+        raise ValueError(f"Unknown index type '{kind}'")
+
+    if len(vectors):
+        index.add(vectors)
+    if kind.startswith("ivf"):
+        # Needed for reconstruct(), which MMR search relies on
+        index.make_direct_map()
+    apply_search_params(index)
+    return index
+
+
+def tombstones(index) -> frozenset:
+    """Labels of deleted vectors that are still stored in index"""
+    # Carried by the search filter so they travel with the index object
+    return getattr(index.search, "tombstones", frozenset())
+
+
+def set_tombstones(index, labels: Iterable[int]) -> None:
+    """Hide labels from every search on index without removing their vectors
+
+    HNSW cannot remove vectors, and removing from IVF would break the
+    position-based labels the FAISS wrapper assigns on add, so deletions
+    are filtered at search time until the index is compacted.
+    """
+    faiss = dependable_faiss_import()
+    labels = frozenset(labels)
+    batch = faiss.IDSelectorBatch(np.fromiter(labels, dtype=np.int64, count=len(labels)))
+    selector = faiss.IDSelectorNot(batch)
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = HNSW_EF_SEARCH
+    else:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = IVF_NPROBE
+    params.sel = selector
+    search = type(index).search
+
+    def filtered_search(x, k, _keep=(batch, selector), **kwargs):
+        kwargs.setdefault("params", params)
+        return search(index, x, k, **kwargs)
+
+    filtered_search.tombstones = labels
+    index.search = filtered_search
+
+
+def restore_tombstones(vector_store: FAISS) -> None:
+    """Re-derive tombstones of a loaded store from labels whose documents are gone"""
+    if index_kind(vector_store.index) == "flat":
+        return
+    dead = [label for label, doc_id in vector_store.index_to_docstore_id.items()
+            if doc_id not in vector_store.docstore._dict]
+    if dead:
+        set_tombstones(vector_store.index, dead)
+
+
+def extract_vectors(vector_store: FAISS) -> np.ndarray:
+    """All live vectors in index order, exact where the index can reconstruct them"""
+    return _copy_rows(vector_store)[1]
+
+
+def live_rows(vector_store: FAISS) -> Tuple[List[str], np.ndarray]:
+    """(doc ids, vectors) of every live row in index order"""
+    doc_ids, vectors, _ = _copy_rows(vector_store)
+    return doc_ids, vectors
+
+
+def _copy_rows(vector_store: FAISS, start: int = 0) -> Tuple[List[str], np.ndarray, int]:
+    """(doc ids, vectors, end position) of the live rows from start on
+
+    Vectors are reconstructed from the index rather than re-embedded: exact
+    for flat and HNSW, the stored codes for IVF.
+    """
+    with store_lock(vector_store).read():
+        index = vector_store.index
+        end = index.ntotal
+        dead = tombstones(index)
+        rows = [i for i in range(start, end) if i not in dead]
+        doc_ids = [vector_store.index_to_docstore_id[i] for i in rows]
+        vectors = index.reconstruct_n(start, end - start) if end > start else np.empty((0, index.d), np.float32)
+    return doc_ids, vectors[[i - start for i in rows]].reshape(len(doc_ids), index.d), end
+
+
+def empty_like(index):
+    """An empty index of the same type, metric and trained state"""
+    faiss = dependable_faiss_import()
+    empty = faiss.clone_index(index)
+    empty.reset()
+    apply_search_params(empty)
+    return empty
+
+
+def _rebuild_lock(vector_store: FAISS) -> threading.RLock:
+    # Serializes rebuilds and deletions of one store; appends do not need it
+    with _rebuild_locks_guard:
+        lock = getattr(vector_store, "rebuild_lock", None)
+        if lock is None:
+            lock = vector_store.rebuild_lock = threading.RLock()
+        return lock
+
+
+def rebuild_index(vector_store: FAISS, kind: str) -> None:
+    """Replace the store's index with one of the given kind, keeping ids and order
+
+    The new index is built from a copy while searches carry on; vectors
+    appended meanwhile are added to it before the swap, which is the only
+    step that holds the write lock. Tombstoned vectors are left out.
+    """
+    with _rebuild_lock(vector_store):
+        doc_ids, vectors, copied = _copy_rows(vector_store, 0)
+        if kind.startswith("ivf") and kind == index_kind(vector_store.index):
+            with store_lock(vector_store).read():
+                # Same trained quantizers: compaction does not need to retrain
+                index = empty_like(vector_store.index)
+            index.add(vectors)
+        else:
+            index = build_index(kind, vector_store.index.d, vectors)
+        while True:
+            with store_lock(vector_store).write():
+                if vector_store.index.ntotal == copied:
+                    vector_store.index = index
+                    vector_store.index_to_docstore_id = dict(enumerate(doc_ids))
+                    return
+            tail_ids, tail_vectors, copied = _copy_rows(vector_store, copied)
+            if len(tail_vectors):
+                index.add(tail_vectors)
+            doc_ids.extend(tail_ids)
+
+
+def ensure_index_type(vector_store: FAISS, configured: str = VECTOR_INDEX_TYPE) -> bool:
+    """Switch index type if the configuration or corpus size calls for it; True if rebuilt"""
+    with _rebuild_lock(vector_store):
+        current = index_kind(vector_store.index)
+        target = target_kind(vector_store.index.ntotal, current, configured)
+        if target == current:
+            return False
+        logger.info(f"Rebuilding vector index: {current} -> {target} ({vector_store.index.ntotal} vectors)")
+        rebuild_index(vector_store, target)
+    return True
+
+
+def delete_from_vectorstore(vector_store: FAISS, ids: List[str]) -> None:
+    """Delete documents by id for any index type
+
+    Flat indexes remove the vectors outright. Other types tombstone them,
+    which costs O(deleted), and are compacted once tombstones exceed
+    ANN_TOMBSTONE_RATIO of the index.
+    """
+    if getattr(vector_store, "read_only", False):
+        raise Exception("Cannot delete from a read-only (memory-mapped) vector store")
+    with _rebuild_lock(vector_store):
+        with store_lock(vector_store).write():
+            lexical_index = getattr(vector_store, "lexical_index", None)
+            if lexical_index is not None:
+                lexical_index.delete(ids)
+            index = vector_store.index
+            kind = index_kind(index)
+            if kind == "flat":
+                vector_store.delete(ids)
+                return
+            doomed = set(ids)
+            labels = [label for label, doc_id in vector_store.index_to_docstore_id.items() if doc_id in doomed]
+            set_tombstones(index, tombstones(index).union(labels))
+            vector_store.docstore.delete([doc_id for doc_id in doomed if doc_id in vector_store.docstore._dict])
+            dead, total = len(tombstones(index)), index.ntotal
+        if dead > ANN_TOMBSTONE_RATIO * total:
+            logger.info(f"Compacting {kind} index ({dead} of {total} vectors deleted)")
+            rebuild_index(vector_store, kind)
@@ -0,0 +1,134 @@
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1000))
+
+GLOBAL_SCOPE = ""
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+def retrieval_key(search_type: str, k: int) -> str:
+    """Retrieval settings an answer depends on besides the question and documents"""
+    return f"{search_type}:{k}"
+
+
+class SemanticAnswerCache:
+    """Answers keyed by question embedding, document-set fingerprint and retrieval settings
+
+    A lookup hits when a stored question for the same fingerprint and
+    retrieval key (search type and k) has cosine similarity at or above the
+    threshold. Entries expire after ttl seconds
+    and the least recently used entry is evicted beyond max_entries.
+    Answers that drew on a user's private memory are stored under that
+    user's scope so they are never served to anyone else.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    def lookup(self, question_vector: List[float], doc_fingerprint: str, scope: str = GLOBAL_SCOPE,
+               retrieval: str = "") -> Optional[dict]:
+        """Best cached answer for a near-duplicate question, or None"""
+        query = _unit(question_vector)
+        with self._lock:
+            self._expire(time.time())
+            best_key, best_score = None, self.threshold
+            for key, entry in self._entries.items():
+                if (entry["fingerprint"] != doc_fingerprint or entry["retrieval"] != retrieval
+                        or entry["scope"] not in (GLOBAL_SCOPE, scope)):
+                    continue
+                score = float(np.dot(query, entry["vector"]))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            entry = self._entries[best_key]
+            return {"answer": entry["answer"], "context": entry["context"],
+                    "question": entry["question"], "similarity": best_score}
+
+    def store(self, question: str, question_vector: List[float], doc_fingerprint: str,
+              answer: str, context: str, scope: str = GLOBAL_SCOPE, retrieval: str = "") -> None:
+        with self._lock:
+            self._entries[self._next_key] = {
+                "question": question,
+                "vector": _unit(question_vector),
+                "fingerprint": doc_fingerprint,
+                "retrieval": retrieval,
+                "scope": scope,
+                "answer": answer,
+                "context": context,
+                "created_at": time.time(),
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, doc_fingerprint: Optional[str] = None) -> None:
+        """Drop entries computed against any other document set (or everything)"""
+        with self._lock:
+            if doc_fingerprint is None:
+                self._entries.clear()
+            else:
+                stale = [key for key, entry in self._entries.items() if entry["fingerprint"] != doc_fingerprint]
+                for key in stale:
+                    del self._entries[key]
+        logger.info("Answer cache invalidated")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Process-wide answer cache shared by all sessions"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache()
+        return _cache
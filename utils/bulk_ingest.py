@@ -0,0 +1,377 @@
+"""Preload a directory (or manifest) of PDFs into the persistent vector store
+
+    python -m utils.bulk_ingest /data/pdfs
+    python -m utils.bulk_ingest --manifest files.txt --workers 8
+
+PDFs are parsed and chunked in a process pool, one document per worker.
+The parent embeds chunks from all documents in shared batches and
+appends them to the index. Every --save-every documents it publishes a
+snapshot, registers those documents and updates the checkpoint. An
+interrupted run started again with the same checkpoint resumes after
+the last saved document. The Streamlit app picks the new snapshot up on
+its next rerun.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import signal
+import logging
+import argparse
+import multiprocessing
+from contextlib import ExitStack
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional
+from utils.parse_pdf import validate_pdf, extract_elements_from_pdf, iter_chunks, PDF_PARSE_WORKERS
+from utils.vectorstore import (
+    init_vectorstore, append_to_vectorstore, save_vectorstore, exclusive_writer, log_cache_stats,
+    VECTOR_INDEX_DIR, EMBED_BATCH_SIZE
+)
+from utils.doc_registry import fingerprint_file, get_registry
+from utils.answer_cache import get_answer_cache
+from utils.ann_index import ensure_index_type, delete_from_vectorstore
+from utils.ingest import current_parse_params, caption_documents
+from utils.figure_captions import CAPTIONS_ENABLED, figure_image_path, get_figure_captioner
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.path.join(os.path.dirname(VECTOR_INDEX_DIR) or ".", "bulk_ingest.checkpoint.json")
+SAVE_EVERY = 50
+
+
+def iter_pdf_paths(paths: List[str], manifest: Optional[str] = None) -> Iterator[str]:
+    """PDF files under the given files/directories and listed in the manifest, in a stable order"""
+    if manifest:
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield os.path.abspath(line)
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf"):
+                        yield os.path.abspath(os.path.join(root, name))
+        else:
+            yield os.path.abspath(path)
+
+
+def _ignore_sigint() -> None:
+    # Ctrl-C is handled by the parent; workers dying on it would be recorded as failed documents
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def parse_document(path: str, doc_hash: str, figures_root: str) -> dict:
+    """Worker entry point: parse and chunk one PDF serially"""
+    started = time.perf_counter()
+    source = os.path.basename(path)
+    figures_dir = os.path.join(figures_root, doc_hash[:16])
+    # One document per worker process, so no nested page-range pool here
+    elements = extract_elements_from_pdf(path, figures_dir, workers=1)
+    chunks = list(iter_chunks(elements, document=source))
+    figures = [
+        {"type": element["type"], "metadata": {
+            "page_number": element.get("metadata", {}).get("page_number"),
+            "image_path": figure_image_path(element),
+        }}
+        for element in elements if figure_image_path(element)
+    ]
+    pages = max((element.get("metadata", {}).get("page_number") or 0 for element in elements), default=0)
+    return {
+        "path": path,
+        "doc_hash": doc_hash,
+        "source": source,
+        "chunks": chunks,
+        "figures": figures,
+        "figures_dir": figures_dir,
+        "pages": pages,
+        "parse_seconds": time.perf_counter() - started,
+    }
+
+
+class Checkpoint:
+    """Per-path outcome of earlier runs, rewritten atomically after every snapshot"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f).get("documents", {})
+
+    def status(self, path: str) -> Optional[str]:
+        entry = self.entries.get(path)
+        return entry["status"] if entry else None
+
+    def mark(self, path: str, status: str, **details) -> None:
+        self.entries[path] = {"status": status, **details}
+
+    def save(self) -> None:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"updated_at": time.time(), "documents": self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+
+class BulkIngestor:
+    """Batches chunks across documents and commits snapshot, registry and checkpoint together"""
+
+    def __init__(self, vector_store, index_dir: str, checkpoint: Checkpoint,
+                 batch_size: int = EMBED_BATCH_SIZE, save_every: int = SAVE_EVERY, captioner=None):
+        self.vector_store = vector_store
+        self.index_dir = index_dir
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.save_every = save_every
+        self.captioner = captioner
+        self.registry = get_registry()
+        self.params = current_parse_params()
+        self._texts, self._metadatas, self._ids = [], [], []
+        self._pending = []   # documents whose chunks are appended but not yet saved
+        self._removed = []   # re-parsed documents that lost their old chunks and have no new ones
+        self._writer = None  # the index dir's writer lock, held from the first add until commit
+        self.stats = {"indexed": 0, "skipped": 0, "failed": 0, "pages": 0, "chunks": 0, "figures": 0}
+
+    def skip(self, path: str, doc_hash: Optional[str] = None, status: str = "skipped") -> None:
+        self.stats["skipped"] += 1
+        self.checkpoint.mark(path, status, doc_hash=doc_hash)
+
+    def fail(self, path: str, error: str) -> None:
+        self.stats["failed"] += 1
+        self.checkpoint.mark(path, "failed", error=error)
+        logger.error(f"Failed to ingest {path}: {error}")
+
+    def _hold_writer(self) -> None:
+        # Appends from here to the next commit go on top of the newest snapshot
+        if self._writer is None:
+            writer = ExitStack()
+            writer.enter_context(exclusive_writer(self.vector_store, self.index_dir))
+            self._writer = writer
+
+    def _release_writer(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def add(self, parsed: dict) -> None:
+        """Queue a parsed document's chunks (and figure captions) for embedding"""
+        source = parsed["source"]
+        self._hold_writer()
+        if self.registry.is_indexed(parsed["doc_hash"], self.params, self.vector_store):
+            # Another process indexed it while it was being parsed
+            shutil.rmtree(parsed["figures_dir"], ignore_errors=True)
+            self.skip(parsed["path"], parsed["doc_hash"])
+            return
+        stale = self.registry.get(parsed["doc_hash"])
+        if stale and stale["chunk_ids"]:
+            try:
+                delete_from_vectorstore(self.vector_store, stale["chunk_ids"])
+            except ValueError:
+                logger.warning(f"Stale chunks for {source} were not in the index")
+
+        texts = [text for text, _ in parsed["chunks"]]
+        doc_hash = parsed["doc_hash"]
+        metadatas = [{**metadata, "source": source, "doc_hash": doc_hash} for _, metadata in parsed["chunks"]]
+        if self.captioner and parsed["figures"]:
+            figures = [(element, *self.captioner.submit(element["metadata"]["image_path"]))
+                       for element in parsed["figures"]]
+            for text, metadata in caption_documents(figures, source, doc_hash):
+                texts.append(text)
+                metadatas.append(metadata)
+            self.stats["figures"] += len(figures)
+        shutil.rmtree(parsed["figures_dir"], ignore_errors=True)
+
+        if not texts:
+            if stale:
+                self._removed.append(doc_hash)
+            self.skip(parsed["path"], parsed["doc_hash"], status="empty")
+            return
+        ids = [str(uuid.uuid4()) for _ in texts]
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas)
+        self._ids.extend(ids)
+        self._pending.append((parsed, ids))
+        self.stats["pages"] += parsed["pages"]
+        self.stats["chunks"] += len(texts)
+        if len(self._texts) >= self.batch_size:
+            self._flush()
+        if len(self._pending) >= self.save_every:
+            self.commit()
+
+    def _flush(self) -> None:
+        if not self._texts:
+            return
+        append_to_vectorstore(
+            self.vector_store, self._texts, metadatas=self._metadatas, ids=self._ids, batch_size=self.batch_size
+        )
+        self._texts, self._metadatas, self._ids = [], [], []
+
+    def commit(self) -> None:
+        """Publish a snapshot, then register its documents and record them in the checkpoint
+
+        Releases the writer lock, so other processes can publish between commits.
+        """
+        try:
+            self._flush()
+            if self._pending or self._removed:
+                ensure_index_type(self.vector_store)
+                save_vectorstore(self.vector_store, self.index_dir)
+            for parsed, ids in self._pending:
+                self.registry.register(parsed["doc_hash"], parsed["source"], ids, self.params)
+                self.checkpoint.mark(parsed["path"], "indexed", doc_hash=parsed["doc_hash"], chunks=len(ids))
+                self.stats["indexed"] += 1
+            for doc_hash in self._removed:
+                self.registry.remove(doc_hash)
+        finally:
+            self._release_writer()
+        if self._pending or self._removed:
+            # New or re-indexed documents move the registry fingerprint; drop answers cached before
+            get_answer_cache().invalidate(self.registry.fingerprint())
+        self._pending, self._removed = [], []
+        self.checkpoint.save()
+
+    def abort(self) -> None:
+        """Give up the unsaved window: nothing is published and the writer lock is released"""
+        self._release_writer()
+
+
+def run(paths: List[str], index_dir: str = VECTOR_INDEX_DIR, checkpoint_path: str = CHECKPOINT_PATH,
+        workers: int = PDF_PARSE_WORKERS, batch_size: int = EMBED_BATCH_SIZE, save_every: int = SAVE_EVERY,
+        figures_root: str = "temp/bulk_figures", captions: bool = CAPTIONS_ENABLED,
+        retry_failed: bool = False) -> dict:
+    """Ingest every path not already done; returns the throughput summary"""
+    started = time.perf_counter()
+    vector_store = init_vectorstore(index_dir, mmap=False)
+    checkpoint = Checkpoint(checkpoint_path)
+    ingestor = BulkIngestor(
+        vector_store, index_dir, checkpoint, batch_size, save_every,
+        captioner=get_figure_captioner() if captions else None
+    )
+    registry = ingestor.registry
+    seen_hashes = set()
+
+    def todo() -> Iterator[tuple]:
+        for path in paths:
+            status = checkpoint.status(path)
+            if status in ("indexed", "skipped", "empty", "duplicate") or (status == "failed" and not retry_failed):
+                continue
+            try:
+                validate_pdf(path)
+                doc_hash = fingerprint_file(path)
+            except Exception as e:
+                ingestor.fail(path, str(e))
+                continue
+            if doc_hash in seen_hashes:
+                ingestor.skip(path, doc_hash, status="duplicate")
+            elif registry.is_indexed(doc_hash, ingestor.params, vector_store):
+                ingestor.skip(path, doc_hash)
+            else:
+                seen_hashes.add(doc_hash)
+                yield path, doc_hash
+
+    parse_seconds = 0.0
+    interrupted = False
+    # spawn avoids forking the parent's threads (embedding pool, captioner) into workers
+    pool = ProcessPoolExecutor(
+        max_workers=max(1, workers),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_ignore_sigint
+    )
+    try:
+        queued = todo()
+        in_flight = {}
+        for path, doc_hash in queued:
+            in_flight[pool.submit(parse_document, path, doc_hash, figures_root)] = path
+            if len(in_flight) >= workers * 2:
+                break
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = in_flight.pop(future)
+                try:
+                    parsed = future.result()
+                    parse_seconds += parsed["parse_seconds"]
+                    ingestor.add(parsed)
+                    logger.info(f"Parsed {parsed['source']}: {parsed['pages']} pages, {len(parsed['chunks'])} chunks")
+                except Exception as e:
+                    ingestor.fail(path, str(e))
+                # Keep the window full as documents finish
+                next_item = next(queued, None)
+                if next_item is not None:
+                    in_flight[pool.submit(parse_document, next_item[0], next_item[1], figures_root)] = next_item[0]
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        pool.shutdown(wait=not interrupted, cancel_futures=True)
+
+    if interrupted:
+        # The in-memory index may hold a half-appended batch; keep the last
+        # snapshot and let the next run redo the documents after it
+        logger.warning(f"Interrupted; {len(ingestor._pending)} unsaved documents will be redone on resume")
+        ingestor.abort()
+        checkpoint.save()
+    else:
+        ingestor.commit()
+
+    elapsed = time.perf_counter() - started
+    log_cache_stats(vector_store)
+    stats = ingestor.stats
+    return {
+        **stats,
+        "interrupted": interrupted,
+        "vectors": vector_store.index.ntotal,
+        "elapsed_seconds": round(elapsed, 2),
+        "parse_seconds": round(parse_seconds, 2),
+        "docs_per_sec": round(stats["indexed"] / elapsed, 3) if elapsed else 0.0,
+        "pages_per_sec": round(stats["pages"] / elapsed, 2) if elapsed else 0.0,
+        "chunks_per_sec": round(stats["chunks"] / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk-ingest PDFs into the persistent vector store")
+    parser.add_argument("paths", nargs="*", help="PDF files or directories (searched recursively)")
+    parser.add_argument("--manifest", help="text file with one PDF path per line")
+    parser.add_argument("--index-dir", default=VECTOR_INDEX_DIR)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH, help="resume state; delete it to start over")
+    parser.add_argument("--workers", type=int, default=PDF_PARSE_WORKERS, help="parser processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="chunks per embedding batch")
+    parser.add_argument("--save-every", type=int, default=SAVE_EVERY, help="documents per snapshot/checkpoint")
+    parser.add_argument("--no-captions", action="store_true", help="skip figure captioning")
+    parser.add_argument("--retry-failed", action="store_true", help="retry documents that failed in earlier runs")
+    args = parser.parse_args(argv)
+    if not args.paths and not args.manifest:
+        parser.error("give at least one path or --manifest")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    summary = run(
+        list(dict.fromkeys(iter_pdf_paths(args.paths, args.manifest))),
+        index_dir=args.index_dir,
+        checkpoint_path=args.checkpoint,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        save_every=args.save_every,
+        captions=CAPTIONS_ENABLED and not args.no_captions,
+        retry_failed=args.retry_failed,
+    )
+    print(
+        f"\nIndexed {summary['indexed']} documents ({summary['skipped']} skipped, {summary['failed']} failed) "
+        f"in {summary['elapsed_seconds']:.1f}s\n"
+        f"  {summary['pages']} pages, {summary['chunks']} chunks, {summary['figures']} figures, "
+        f"{summary['vectors']} vectors in the index\n"
+        f"  {summary['docs_per_sec']:.2f} docs/s, {summary['pages_per_sec']:.1f} pages/s, "
+        f"{summary['chunks_per_sec']:.1f} chunks/s"
+    )
+    print(json.dumps(summary))
+    return 130 if summary["interrupted"] else (1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
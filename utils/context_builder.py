@@ -0,0 +1,148 @@
+
+import os
+import re
+import math
+import logging
+from typing import List, Tuple
+from langchain_core.documents import Document
+from utils.rag_chain import NUM_CTX, template
+
+logger = logging.getLogger(__name__)
+
+# llava's tokenizer is not available client-side; ~4 characters per token is
+# a conservative estimate for English prose
+CHARS_PER_TOKEN = 4
+ANSWER_TOKEN_RESERVE = int(os.getenv("ANSWER_TOKEN_RESERVE", 384))
+DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", 0.85))
+SEPARATOR = "\n\n"
+
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def context_budget(question: str, num_ctx: int = NUM_CTX, reserve: int = ANSWER_TOKEN_RESERVE) -> int:
+    """Tokens left for context once the template, question and answer are accounted for"""
+    prompt_tokens = estimate_tokens(template.format(context="", question=question))
+    return max(0, num_ctx - prompt_tokens - reserve)
+
+
+def _span(doc: Document):
+    # Only chunks stamped with their file's content hash can be merged safely;
+    # two different PDFs may share a source file name
+    start = doc.metadata.get("start_index")
+    if start is None or doc.metadata.get("doc_hash") is None:
+        return None
+    return start, start + len(doc.page_content)
+
+
+def merge_overlapping(docs: List[Document]) -> Tuple[List[Document], int]:
+    """Merge chunks of the same document (same doc_hash) whose spans overlap or touch
+
+    Returns the merged documents in rank order (a merged chunk takes the
+    best rank of its parts) and how many chunks were folded away.
+    """
+    ranked = list(enumerate(docs))
+    by_document = {}
+    passthrough = []
+    for rank, doc in ranked:
+        if _span(doc) is None:
+            passthrough.append((rank, doc))
+        else:
+            by_document.setdefault(doc.metadata["doc_hash"], []).append((rank, doc))
+
+    merged = list(passthrough)
+    folded = 0
+    for chunks in by_document.values():
+        chunks.sort(key=lambda item: _span(item[1])[0])
+        rank, current = chunks[0]
+        head = current.metadata
+        start, end = _span(current)
+        text = current.page_content
+        for next_rank, doc in chunks[1:]:
+            next_start, next_end = _span(doc)
+            chunk_index = current.metadata.get("chunk_index")
+            adjacent = chunk_index is not None and doc.metadata.get("chunk_index") == chunk_index + 1
+            if next_start <= end or adjacent:
+                if next_end > end:
+                    overlap = max(0, end - next_start)
+                    text += ("" if overlap else " ") + doc.page_content[overlap:]
+                    end = next_end
+                rank = min(rank, next_rank)
+                current = doc
+                folded += 1
+            else:
+                merged.append((rank, Document(page_content=text, metadata=head)))
+                rank, current, head = next_rank, doc, doc.metadata
+                start, end = next_start, next_end
+                text = doc.page_content
+        merged.append((rank, Document(page_content=text, metadata=head)))
+
+    merged.sort(key=lambda item: item[0])
+    return [doc for _, doc in merged], folded
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def remove_near_duplicates(docs: List[Document], threshold: float = DUPLICATE_THRESHOLD) -> Tuple[List[Document], int]:
+    """Drop documents whose word-shingle Jaccard similarity to a better-ranked one meets the threshold"""
+    kept, kept_shingles = [], []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & other) / (len(shingles | other) or 1) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept, len(docs) - len(kept)
+
+
+def pack_to_budget(docs: List[Document], budget: int) -> List[Document]:
+    """Take documents in rank order while they fit; trim the first one if nothing fits"""
+    packed, used = [], 0
+    separator_tokens = estimate_tokens(SEPARATOR)
+    for doc in docs:
+        cost = estimate_tokens(doc.page_content) + (separator_tokens if packed else 0)
+        if used + cost <= budget:
+            packed.append(doc)
+            used += cost
+        elif not packed and budget > 0:
+            packed.append(Document(page_content=doc.page_content[:budget * CHARS_PER_TOKEN], metadata=doc.metadata))
+            break
+    return packed
+
+
+def build_context(docs: List[Document], question: str, num_ctx: int = NUM_CTX) -> Tuple[str, List[Document], dict]:
+    """Merge, dedupe and pack retrieved docs into a context string that fits the model window
+
+    Returns (context, documents used, stats).
+    """
+    raw_tokens = estimate_tokens(SEPARATOR.join(doc.page_content for doc in docs))
+    merged, folded = merge_overlapping(docs)
+    unique, duplicates = remove_near_duplicates(merged)
+    budget = context_budget(question, num_ctx)
+    packed = pack_to_budget(unique, budget)
+    context = SEPARATOR.join(doc.page_content for doc in packed)
+
+    stats = {
+        "input_docs": len(docs),
+        "merged": folded,
+        "duplicates": duplicates,
+        "dropped": len(unique) - len(packed),
+        "budget_tokens": budget,
+        "raw_tokens": raw_tokens,
+        "context_tokens": estimate_tokens(context),
+    }
+    stats["saved_tokens"] = max(0, raw_tokens - stats["context_tokens"])
+    logger.info(
+        f"Context: {stats['context_tokens']}/{budget} tokens from {len(docs)} docs "
+        f"({folded} merged, {duplicates} duplicates, {stats['dropped']} dropped, "
+        f"{stats['saved_tokens']} tokens saved)"
+    )
+    return context, packed, stats
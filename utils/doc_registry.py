@@ -0,0 +1,134 @@
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import List, Optional
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+DOC_REGISTRY_PATH = os.getenv("DOC_REGISTRY_PATH", "index/documents.db")
+
+
+def fingerprint_bytes(data: bytes) -> str:
+    """Content hash identifying a document regardless of its file name"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def fingerprint_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentRegistry:
+    """Persistent record of which documents are indexed, with their chunk ids and parse parameters"""
+
+    def __init__(self, path: str = DOC_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._data_version = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_hash TEXT PRIMARY KEY,
+                filename TEXT,
+                chunk_ids TEXT NOT NULL,
+                parse_params TEXT NOT NULL,
+                indexed_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, doc_hash: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_hash, filename, chunk_ids, parse_params, indexed_at FROM documents WHERE doc_hash = ?",
+                (doc_hash,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "doc_hash": row[0],
+            "filename": row[1],
+            "chunk_ids": json.loads(row[2]),
+            "parse_params": json.loads(row[3]),
+            "indexed_at": row[4],
+        }
+
+    def is_indexed(self, doc_hash: str, parse_params: dict, vector_store=None) -> bool:
+        """True if the document was indexed with these parameters (and is still in the store)"""
+        record = self.get(doc_hash)
+        if record is None or record["parse_params"] != parse_params:
+            return False
+        if vector_store is not None and record["chunk_ids"]:
+            # Guard against a registry that outlived its index directory
+            return isinstance(vector_store.docstore.search(record["chunk_ids"][0]), Document)
+        return True
+
+    def register(self, doc_hash: str, filename: str, chunk_ids: List[str], parse_params: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_hash, filename, chunk_ids, parse_params, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (doc_hash, filename, json.dumps(chunk_ids), json.dumps(parse_params, sort_keys=True), time.time())
+            )
+            self._conn.commit()
+            self._fingerprint = None
+        logger.info(f"Registered {filename} ({doc_hash[:12]}) with {len(chunk_ids)} chunks")
+
+    def remove(self, doc_hash: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE doc_hash = ?", (doc_hash,))
+            self._conn.commit()
+            self._fingerprint = None
+
+    def fingerprint(self) -> str:
+        """Version of the indexed corpus; changes whenever a document is added, re-indexed or removed"""
+        with self._lock:
+            # data_version moves when another process (e.g. bulk ingest) commits
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._fingerprint = None
+            if self._fingerprint is None:
+                # Re-indexing a document (e.g. new parse params) replaces its
+                # chunks, so it must move the fingerprint even though the set
+                # of documents is unchanged
+                rows = self._conn.execute(
+                    "SELECT doc_hash, chunk_ids, parse_params FROM documents ORDER BY doc_hash"
+                ).fetchall()
+                digest = hashlib.sha256()
+                for row in rows:
+                    digest.update("\0".join(row).encode("utf-8"))
+                self._fingerprint = digest.hexdigest()
+            return self._fingerprint
+
+    def documents(self) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_hash, filename, indexed_at FROM documents ORDER BY indexed_at"
+            ).fetchall()
+        return [{"doc_hash": r[0], "filename": r[1], "indexed_at": r[2]} for r in rows]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> DocumentRegistry:
+    """Process-wide registry instance"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = DocumentRegistry()
+        return _registry
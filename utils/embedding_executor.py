@@ -0,0 +1,80 @@
+
+import os
+import time
+import random
+import logging
+import threading
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBED_REQUEST_SIZE = int(os.getenv("EMBED_REQUEST_SIZE", 32))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", 4))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 3))
+EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", 0.5))
+
+
+class EmbeddingExecutor(Embeddings):
+    """Splits embedding work into batches and fans them out with bounded parallelism
+
+    Results come back in input order. Failed batches are retried with
+    exponential backoff before the error is propagated.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        batch_size: int = EMBED_REQUEST_SIZE,
+        max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+        max_retries: int = EMBED_MAX_RETRIES,
+        backoff: float = EMBED_RETRY_BACKOFF
+    ):
+        self.underlying = underlying
+        self.model = getattr(underlying, "model", type(underlying).__name__)
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # Every backend request, pooled or inline, holds a permit, so the cap
+        # covers all callers in the process
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed")
+
+    def _with_retry(self, fn, *args):
+        attempt = 0
+        while True:
+            try:
+                # The permit is not held during the backoff sleep
+                with self._in_flight:
+                    return fn(*args)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                attempt += 1
+                logger.warning(
+                    f"Embedding request failed ({str(e)}), retry {attempt}/{self.max_retries} in {delay:.2f}s"
+                )
+                time.sleep(delay)
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        vectors = self._with_retry(self.underlying.embed_documents, batch)
+        if len(vectors) != len(batch):
+            raise ValueError(f"Embedding backend returned {len(vectors)} vectors for {len(batch)} texts")
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            return self._embed_batch(batches[0]) if batches else []
+
+        futures = [self._pool.submit(self._embed_batch, batch) for batch in batches]
+        vectors = []
+        for future in futures:
+            vectors.extend(future.result())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._with_retry(self.underlying.embed_query, text)
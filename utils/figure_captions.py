@@ -0,0 +1,144 @@
+
+import os
+import time
+import base64
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from utils.rag_chain import OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE
+
+logger = logging.getLogger(__name__)
+
+CAPTIONS_ENABLED = os.getenv("CAPTIONS_ENABLED", "true").lower() == "true"
+CAPTION_MODEL = os.getenv("CAPTION_MODEL", "llava:7b")
+# Concurrent caption requests across the whole process; llava is far heavier than the embedder
+CAPTION_WORKERS = int(os.getenv("CAPTION_WORKERS", 2))
+CAPTION_CACHE_PATH = os.getenv("CAPTION_CACHE_PATH", "cache/captions.db")
+CAPTION_PROMPT = (
+    "Describe this figure from a PDF document for search. Include any visible text, "
+    "numbers, axis labels and what the figure or table shows. Be concise."
+)
+FIGURE_TYPES = ("Image", "Table")
+
+
+def image_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def figure_image_path(element: dict) -> Optional[str]:
+    """Path of the crop unstructured wrote for an Image/Table element, if any"""
+    if element.get("type") not in FIGURE_TYPES:
+        return None
+    path = element.get("metadata", {}).get("image_path")
+    return path if path and os.path.exists(path) else None
+
+
+class CaptionCache:
+    """On-disk captions keyed by (model, image hash)"""
+
+    def __init__(self, path: str = CAPTION_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS captions (
+                key TEXT PRIMARY KEY,
+                caption TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT caption FROM captions WHERE key = ?", (key,)).fetchone()
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, key: str, caption: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO captions (key, caption, created_at) VALUES (?, ?, ?)",
+                (key, caption, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+
+class FigureCaptioner:
+    """Captions figure crops with the multimodal model on a bounded worker pool
+
+    Identical images (repeated logos, page headers) are captioned once: the
+    cache covers earlier documents and in-flight requests are shared.
+    """
+
+    def __init__(self, llm=None, cache: Optional[CaptionCache] = None,
+                 workers: int = CAPTION_WORKERS, model: str = CAPTION_MODEL):
+        if llm is None:
+            from langchain_ollama.llms import OllamaLLM
+            llm = OllamaLLM(model=model, base_url=OLLAMA_BASE_URL, temperature=0.0, keep_alive=OLLAMA_KEEP_ALIVE)
+        self.llm = llm
+        self.model = model
+        self.cache = cache or CaptionCache()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="caption")
+        self._in_flight: Dict[str, Future] = {}
+        # Reentrant: a future that is already done runs its callback immediately
+        self._lock = threading.RLock()
+
+    def submit(self, path: str) -> Tuple[str, Future]:
+        """Queue an image for captioning; returns (image hash, future caption)"""
+        digest = image_hash(path)
+        with self._lock:
+            future = self._in_flight.get(digest)
+            if future is None:
+                future = self._pool.submit(self._caption, path, digest)
+                self._in_flight[digest] = future
+                future.add_done_callback(lambda _, d=digest: self._forget(d))
+        return digest, future
+
+    def _forget(self, digest: str) -> None:
+        with self._lock:
+            self._in_flight.pop(digest, None)
+
+    def _caption(self, path: str, digest: str) -> str:
+        key = f"{self.model}:{digest}"
+        caption = self.cache.get(key)
+        if caption is not None:
+            return caption
+        with open(path, "rb") as f:
+            image = base64.b64encode(f.read()).decode("ascii")
+        started = time.time()
+        caption = self.llm.invoke(CAPTION_PROMPT, images=[image]).strip()
+        logger.info(f"Captioned {os.path.basename(path)} in {time.time() - started:.2f}s")
+        if caption:
+            self.cache.put(key, caption)
+        return caption
+
+
+_captioner = None
+_captioner_lock = threading.Lock()
+
+
+def get_figure_captioner() -> FigureCaptioner:
+    """Process-wide captioner, so the concurrency limit holds across sessions"""
+    global _captioner
+    with _captioner_lock:
+        if _captioner is None:
+            _captioner = FigureCaptioner()
+        return _captioner
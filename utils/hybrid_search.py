@@ -0,0 +1,76 @@
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.rwlock import store_lock
+
+logger = logging.getLogger(__name__)
+
+RRF_K = 60
+
+# Lexical searches run here while the calling thread embeds the query and searches FAISS
+_search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="lexical")
+
+
+def vector_search_ids(vector_store: FAISS, vector: List[float], k: int) -> List[str]:
+    """Docstore ids of the k nearest vectors, best first"""
+    if vector_store.index.ntotal == 0:
+        return []
+    query = np.asarray([vector], dtype=np.float32)
+    _, positions = vector_store.index.search(query, k)
+    return [vector_store.index_to_docstore_id[p] for p in positions[0] if p != -1]
+
+
+def lexical_search_ids(vector_store: FAISS, query: str, k: int) -> List[str]:
+    lexical_index = getattr(vector_store, "lexical_index", None)
+    if lexical_index is None:
+        return []
+    with store_lock(vector_store).read():
+        return [doc_id for doc_id, _ in lexical_index.search(query, k)]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[str]], k: int = RRF_K) -> List[str]:
+    """Merge ranked id lists by summing 1 / (k + rank) across lists"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def hybrid_search(vector_store: FAISS, query: str, k: int = 4, fetch_k: int = 20,
+                  vector: Optional[List[float]] = None) -> List[Document]:
+    """Run BM25 concurrently with query embedding + FAISS search and fuse the results
+
+    Pass vector when the query has already been embedded.
+    """
+    lexical = _search_pool.submit(lexical_search_ids, vector_store, query, fetch_k)
+    if vector is None:
+        vector = vector_store.embeddings.embed_query(query)
+    # Never wait on the lexical thread while holding the read lock: a queued
+    # writer would block that thread's own read and deadlock
+    with store_lock(vector_store).read():
+        dense = vector_search_ids(vector_store, vector, fetch_k)
+    fused = reciprocal_rank_fusion([dense, lexical.result()])[:k]
+    with store_lock(vector_store).read():
+        docs = [vector_store.docstore.search(doc_id) for doc_id in fused]
+    # Ids deleted between the searches come back as "not found" strings
+    return [doc for doc in docs if isinstance(doc, Document)]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever combining BM25 and FAISS results with reciprocal-rank fusion"""
+
+    vector_store: Any
+    k: int = 4
+    fetch_k: int = 20
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return hybrid_search(self.vector_store, query, k=self.k, fetch_k=self.fetch_k)
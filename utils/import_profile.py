@@ -0,0 +1,118 @@
+
+import os
+import sys
+import json
+import time
+import builtins
+import logging
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# The hook is removed at system_ready, so leaving this on costs nothing after startup
+IMPORT_PROFILE_ENABLED = os.getenv("IMPORT_PROFILE_ENABLED", "true").lower() == "true"
+IMPORT_PROFILE_PATH = os.getenv("IMPORT_PROFILE_PATH", "logs/import_profile.json")
+
+_original_import = builtins.__import__
+_records = {}
+_records_lock = threading.Lock()
+_local = threading.local()
+_started_at = None
+_marks = {}
+_written = 0
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    # Already-loaded modules and relative imports cost nothing worth recording
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+    started = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - started
+        children = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        with _records_lock:
+            if name not in _records:
+                _records[name] = {
+                    "module": name,
+                    "cumulative_ms": round(elapsed * 1000, 2),
+                    "self_ms": round((elapsed - children) * 1000, 2),
+                    "nested": bool(stack),
+                    "thread": threading.current_thread().name,
+                    "at_s": round(time.perf_counter() - _started_at, 3),
+                }
+
+
+def start_import_profile() -> bool:
+    """Time every first import from here on (once per process); False if disabled or already running"""
+    global _started_at
+    # Streamlit re-runs the script on every interaction; a stopped profile stays stopped
+    if not IMPORT_PROFILE_ENABLED or _started_at is not None:
+        return False
+    _started_at = time.perf_counter()
+    builtins.__import__ = _timed_import
+    return True
+
+
+def stop_import_profile() -> None:
+    """Put the original __import__ back; what was recorded so far is kept"""
+    if builtins.__import__ is _timed_import:
+        builtins.__import__ = _original_import
+
+
+def mark(label: str) -> None:
+    """Record a startup milestone (e.g. first render) relative to start_import_profile()"""
+    if _started_at is not None and label not in _marks:
+        _marks[label] = round(time.perf_counter() - _started_at, 3)
+
+
+def import_profile(top: Optional[int] = None) -> List[dict]:
+    """Top-level imports by cumulative time, slowest first"""
+    with _records_lock:
+        records = [record for record in _records.values() if not record["nested"]]
+    records.sort(key=lambda record: record["cumulative_ms"], reverse=True)
+    return records[:top] if top else records
+
+
+def write_import_profile(path: str = IMPORT_PROFILE_PATH, top: int = 15) -> Optional[str]:
+    """Write the profile as JSON and log the slowest imports
+
+    Skipped (returns None) when profiling is off or nothing new was imported
+    since the last write, so it is cheap to call on every Streamlit rerun.
+    """
+    global _written
+    if _started_at is None:
+        return None
+    with _records_lock:
+        if len(_records) == _written:
+            return None
+        _written = len(_records)
+        records = sorted(_records.values(), key=lambda record: record["cumulative_ms"], reverse=True)
+    slowest = [record for record in records if not record["nested"]][:top]
+    profile = {
+        "pid": os.getpid(),
+        "python": sys.version.split()[0],
+        "modules": len(sys.modules),
+        "total_import_ms": round(sum(record["cumulative_ms"] for record in records if not record["nested"]), 2),
+        "marks": dict(_marks),
+        "imports": records,
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+    logger.info(
+        f"Import profile: {profile['total_import_ms']:.0f}ms in imports, {profile['modules']} modules, "
+        f"marks {profile['marks']}; slowest: "
+        + ", ".join(f"{record['module']} {record['cumulative_ms']:.0f}ms" for record in slowest[:5])
+    )
+    return path
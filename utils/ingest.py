@@ -0,0 +1,274 @@
+
+import os
+import uuid
+import queue
+import shutil
+import logging
+import tempfile
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from langchain_community.vectorstores import FAISS
+from utils.parse_pdf import iter_elements_from_pdf, iter_chunks, CHUNK_SIZE, CHUNK_OVERLAP
+from utils.vectorstore import (
+    append_to_vectorstore,
+    exclusive_writer,
+    save_vectorstore,
+    log_cache_stats,
+    EMBED_BATCH_SIZE,
+    EMBED_MODEL,
+    VECTOR_INDEX_DIR
+)
+from utils.doc_registry import DocumentRegistry, fingerprint_file, get_registry
+from utils.answer_cache import get_answer_cache
+from utils.ann_index import ensure_index_type, delete_from_vectorstore
+from utils.metrics import timed_iter
+from utils.figure_captions import CAPTIONS_ENABLED, CAPTION_MODEL, FigureCaptioner, figure_image_path, get_figure_captioner
+
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 512))
+# Each ingest crops figures into its own directory under here and removes it when done
+FIGURES_ROOT = os.path.join("temp", "figures")
+
+_DONE = object()
+
+
+def current_parse_params() -> dict:
+    """Settings that change the indexed chunks; a document is re-ingested when they differ"""
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "strategy": "fast",
+        "embed_model": EMBED_MODEL,
+        "caption_model": CAPTION_MODEL if CAPTIONS_ENABLED else None,
+    }
+
+
+class _StageFailed:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocking put that gives up once the pipeline is being torn down"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _drain(q: queue.Queue, stop: threading.Event) -> Iterator:
+    """Iterate a stage queue until its producer signals completion"""
+    while not stop.is_set():
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _StageFailed):
+            raise item.error
+        yield item
+
+
+def _run_stage(source: Callable[[], Iterable], out: queue.Queue, stop: threading.Event) -> None:
+    try:
+        for item in source():
+            if not _put(out, item, stop):
+                return
+        _put(out, _DONE, stop)
+    except Exception as e:
+        _put(out, _StageFailed(e), stop)
+
+
+def _submit_figures(elements: Iterable[dict], captioner: Optional[FigureCaptioner], figures: list) -> Iterator[dict]:
+    """Pass elements through, queueing each figure crop for captioning on the way"""
+    for element in elements:
+        path = figure_image_path(element) if captioner else None
+        if path:
+            try:
+                digest, future = captioner.submit(path)
+                figures.append((element, digest, future))
+            except OSError as e:
+                logger.warning(f"Could not read figure {path}: {str(e)}")
+        yield element
+
+
+def caption_documents(figures: list, source: str, doc_hash: Optional[str] = None) -> Iterator[Tuple[str, dict]]:
+    """(text, metadata) for every figure whose caption succeeded, in page order"""
+    for element, digest, future in figures:
+        try:
+            caption = future.result()
+        except Exception as e:
+            logger.warning(f"Captioning a figure from {source} failed: {str(e)}")
+            continue
+        if not caption:
+            continue
+        page_number = element.get("metadata", {}).get("page_number")
+        yield f"{element['type']} on page {page_number}: {caption}", {
+            "source": source,
+            "doc_hash": doc_hash,
+            "page_number": page_number,
+            "content_type": "figure_caption",
+            "element_type": element["type"],
+            "image_hash": digest,
+        }
+
+
+def ingest_pdf(
+    vector_store: FAISS,
+    file_path: str,
+    source: Optional[str] = None,
+    batch_size: int = EMBED_BATCH_SIZE,
+    on_progress: Optional[Callable[[int], None]] = None,
+    figures_dir: Optional[str] = None,
+    captioner: Optional[FigureCaptioner] = None,
+    doc_hash: Optional[str] = None
+) -> List[str]:
+    """Stream a PDF through parse -> chunk -> embed -> index and return the new chunk ids
+
+    Parsing and chunking run on background threads connected by bounded
+    queues, so embedding starts with the first batch of chunks and memory
+    stays proportional to the queue sizes rather than the document size.
+    Figure crops are captioned on the captioner's pool while the text is
+    embedded, and the captions are indexed after the text chunks.
+    Indexing happens on the calling thread, which is also where
+    on_progress is invoked with the running count of indexed chunks.
+    Every chunk carries the file's content hash as doc_hash, which tells
+    apart different PDFs that share a file name. If ingestion fails part
+    way, the chunks it already indexed are deleted again. Unless figures_dir
+    is given, figure crops go to a private directory that is removed afterwards.
+    """
+    source = source or os.path.basename(file_path)
+    doc_hash = doc_hash or fingerprint_file(file_path)
+    owns_figures_dir = figures_dir is None
+    if owns_figures_dir:
+        os.makedirs(FIGURES_ROOT, exist_ok=True)
+        figures_dir = tempfile.mkdtemp(prefix=f"{doc_hash[:16]}-", dir=FIGURES_ROOT)
+    if captioner is None and CAPTIONS_ENABLED:
+        captioner = get_figure_captioner()
+    figures = []
+    stop = threading.Event()
+    elements = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    chunks = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+
+    stages = [
+        threading.Thread(
+            target=_run_stage,
+            args=(lambda: timed_iter(iter_elements_from_pdf(file_path, figures_dir), "parse", document=source), elements, stop),
+            name="ingest-parse",
+            daemon=True
+        ),
+        threading.Thread(
+            target=_run_stage,
+            args=(
+                lambda: iter_chunks(_submit_figures(_drain(elements, stop), captioner, figures), document=source),
+                chunks,
+                stop
+            ),
+            name="ingest-chunk",
+            daemon=True
+        ),
+    ]
+    for stage in stages:
+        stage.start()
+
+    ids = []
+    texts, metadatas = [], []
+
+    def flush():
+        batch_ids = [str(uuid.uuid4()) for _ in texts]
+        ids.extend(append_to_vectorstore(
+            vector_store, texts, metadatas=metadatas, ids=batch_ids, batch_size=batch_size, document=source
+        ))
+        texts.clear()
+        metadatas.clear()
+        if on_progress:
+            on_progress(len(ids))
+
+    try:
+        for text, metadata in _drain(chunks, stop):
+            texts.append(text)
+            metadatas.append({**metadata, "source": source, "doc_hash": doc_hash})
+            if len(texts) >= batch_size:
+                flush()
+        for text, metadata in caption_documents(figures, source, doc_hash):
+            texts.append(text)
+            metadatas.append(metadata)
+            if len(texts) >= batch_size:
+                flush()
+        if texts:
+            flush()
+    except BaseException:
+        # Batches go straight into the live index; take back what this run added
+        if ids:
+            try:
+                delete_from_vectorstore(vector_store, ids)
+                logger.warning(f"Ingest of {source} failed; removed its {len(ids)} indexed chunks")
+            except Exception as e:
+                logger.error(f"Ingest of {source} failed and its {len(ids)} chunks could not be removed: {str(e)}")
+        raise
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join(timeout=5)
+        if owns_figures_dir:
+            shutil.rmtree(figures_dir, ignore_errors=True)
+
+    # Past the ANN threshold the flat index is swapped for the configured ANN type
+    ensure_index_type(vector_store)
+    log_cache_stats(vector_store)
+    logger.info(f"Ingested {len(ids)} chunks ({len(figures)} figures) from {source}")
+    return ids
+
+
+def ingest_registered_pdf(
+    vector_store: FAISS,
+    file_path: str,
+    source: Optional[str] = None,
+    doc_hash: Optional[str] = None,
+    registry: Optional[DocumentRegistry] = None,
+    on_progress: Optional[Callable[[int], None]] = None,
+    save: bool = True,
+    index_dir: str = VECTOR_INDEX_DIR
+) -> Tuple[List[str], bool]:
+    """Ingest a PDF unless the registry already has it; returns (chunk ids, skipped)
+
+    Runs under the index dir's writer lock, on top of the newest snapshot,
+    so uploads in other processes (or a bulk run) are never overwritten.
+    """
+    registry = registry or get_registry()
+    doc_hash = doc_hash or fingerprint_file(file_path)
+    source = source or os.path.basename(file_path)
+    params = current_parse_params()
+
+    with exclusive_writer(vector_store, index_dir):
+        if registry.is_indexed(doc_hash, params, vector_store):
+            logger.info(f"Skipping {source}: already indexed as {doc_hash[:12]}")
+            return registry.get(doc_hash)["chunk_ids"], True
+
+        # Indexed earlier with different settings: drop the stale chunks first
+        stale = registry.get(doc_hash)
+        if stale and stale["chunk_ids"]:
+            try:
+                delete_from_vectorstore(vector_store, stale["chunk_ids"])
+            except ValueError:
+                logger.warning(f"Stale chunks for {source} were not in the index")
+
+        chunk_ids = ingest_pdf(vector_store, file_path, source=source, on_progress=on_progress, doc_hash=doc_hash)
+        if chunk_ids:
+            if save:
+                save_vectorstore(vector_store, index_dir)
+            registry.register(doc_hash, source, chunk_ids, params)
+        elif stale:
+            # The old chunks are gone and nothing replaced them
+            if save:
+                save_vectorstore(vector_store, index_dir)
+            registry.remove(doc_hash)
+    if chunk_ids or stale:
+        # Cached answers were computed without this document, or from its old chunks
+        get_answer_cache().invalidate(registry.fingerprint())
+    return chunk_ids, False
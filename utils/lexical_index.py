@@ -0,0 +1,150 @@
+
+import re
+import math
+import heapq
+import logging
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Keeps identifiers such as "AB-1234/5", "0x80070005" or "v2.1" intact
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/:][a-z0-9]+)*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+MAX_TF = 65535
+# Rewrite postings once tombstoned documents make up this share of the index
+COMPACT_RATIO = 0.2
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms, emitting compound identifiers both whole and split into parts"""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(PART_PATTERN.findall(token))
+    return tokens
+
+
+class BM25Index:
+    """Incrementally updated BM25 inverted index
+
+    Postings are stored as parallel typed arrays (uint32 document ordinals
+    and uint16 term frequencies) rather than Python objects, which keeps
+    them a few bytes per entry. A deletion updates the live document count
+    and total length at once and tombstones the postings, which are skipped
+    (and left out of document frequencies) until compact() rewrites them.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._doc_ids: List[str] = []            # ordinal -> document id
+        self._ordinals: Dict[str, int] = {}      # document id -> ordinal
+        self._lengths = array("I")
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+        self._live = 0
+        self._deleted = set()
+
+    def __len__(self) -> int:
+        return self._live
+
+    def add(self, doc_id: str, text: str) -> None:
+        if doc_id in self._ordinals:
+            self.delete([doc_id])
+        ordinal = len(self._doc_ids)
+        self._doc_ids.append(doc_id)
+        self._ordinals[doc_id] = ordinal
+
+        counts: Dict[str, int] = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        length = sum(counts.values())
+        self._lengths.append(length)
+        self._total_length += length
+        self._live += 1
+
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("H"))
+            postings[0].append(ordinal)
+            postings[1].append(min(tf, MAX_TF))
+
+    def add_many(self, doc_ids: Iterable[str], texts: Iterable[str]) -> None:
+        for doc_id, text in zip(doc_ids, texts):
+            self.add(doc_id, text)
+
+    def delete(self, doc_ids: Iterable[str]) -> None:
+        for doc_id in doc_ids:
+            ordinal = self._ordinals.pop(doc_id, None)
+            if ordinal is not None:
+                self._deleted.add(ordinal)
+                self._total_length -= self._lengths[ordinal]
+                self._live -= 1
+        if self._deleted and len(self._deleted) > COMPACT_RATIO * len(self._doc_ids):
+            self.compact()
+
+    def compact(self) -> None:
+        """Drop tombstoned documents and renumber the rest contiguously"""
+        deleted = self._deleted
+        if not deleted:
+            return
+        renumbered = {}
+        doc_ids, lengths = [], array("I")
+        for ordinal, doc_id in enumerate(self._doc_ids):
+            if ordinal not in deleted:
+                renumbered[ordinal] = len(doc_ids)
+                doc_ids.append(doc_id)
+                lengths.append(self._lengths[ordinal])
+        for term in list(self._postings):
+            ordinals, tfs = self._postings[term]
+            kept = [(renumbered[o], tf) for o, tf in zip(ordinals, tfs) if o not in deleted]
+            if kept:
+                self._postings[term] = (array("I", (o for o, _ in kept)), array("H", (tf for _, tf in kept)))
+            else:
+                del self._postings[term]
+        self._doc_ids = doc_ids
+        self._ordinals = {doc_id: ordinal for ordinal, doc_id in enumerate(doc_ids)}
+        self._lengths = lengths
+        self._deleted = set()
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """Top-k (document id, BM25 score) pairs"""
+        live = len(self)
+        if not live:
+            return []
+        avg_length = self._total_length / live or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            ordinals, tfs = postings
+            if self._deleted:
+                live_postings = [(o, tf) for o, tf in zip(ordinals, tfs) if o not in self._deleted]
+            else:
+                live_postings = list(zip(ordinals, tfs))
+            # Document frequency over live documents only
+            df = len(live_postings)
+            if not df:
+                continue
+            idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+            for ordinal, tf in live_postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[ordinal] / avg_length)
+                scores[ordinal] = scores.get(ordinal, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self._doc_ids[ordinal], score) for ordinal, score in top]
+
+    @classmethod
+    def from_vectorstore(cls, vector_store) -> "BM25Index":
+        """Build an index over every document currently in a FAISS store"""
+        index = cls()
+        for doc_id in vector_store.index_to_docstore_id.values():
+            doc = vector_store.docstore.search(doc_id)
+            if hasattr(doc, "page_content"):
+                index.add(doc_id, doc.page_content)
+        logger.info(f"Built lexical index over {len(index)} documents")
+        return index
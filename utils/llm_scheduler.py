@@ -0,0 +1,246 @@
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Optional
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", 2))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 32))
+LLM_MAX_QUEUED_PER_USER = int(os.getenv("LLM_MAX_QUEUED_PER_USER", 2))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 30))
+LLM_GENERATION_TIMEOUT = float(os.getenv("LLM_GENERATION_TIMEOUT", 120))
+
+queue_depth = registry.gauge("rag_llm_queue_depth", "Generations waiting for a slot")
+active_generations = registry.gauge("rag_llm_active", "Generations currently running")
+queue_wait = registry.histogram("rag_llm_queue_wait_seconds", "Time from request to generation slot")
+rejections = registry.counter("rag_llm_rejected_total", "Generations refused by the scheduler")
+cancellations = registry.counter("rag_llm_cancelled_total", "Queued generations abandoned before they started")
+
+
+class SchedulerOverloaded(Exception):
+    """The generation queue (or this user's share of it) is full"""
+
+
+class SchedulerTimeout(SchedulerOverloaded):
+    """Waited longer than the queue timeout for a generation slot"""
+
+
+class ClientDisconnected(Exception):
+    """The requester went away while waiting for a generation slot"""
+
+
+class _Ticket:
+    __slots__ = ("user_id", "enqueued_at", "state", "event", "loop", "future")
+
+    def __init__(self, user_id: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+        self.state = "queued"
+        self.event = threading.Event()
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class GenerationScheduler:
+    """Admission control in front of the LLM
+
+    At most max_concurrent generations run at once. Waiting requests are
+    queued per user and served round-robin across users, so one user
+    firing many questions cannot starve the others. New requests are
+    refused at once when the queue is full or the user already has
+    max_queued_per_user waiting, which keeps the wait of admitted
+    requests bounded. Works from threads (slot) and asyncio (aslot).
+    """
+
+    def __init__(self, max_concurrent: int = LLM_MAX_CONCURRENT, max_queue: int = LLM_MAX_QUEUE,
+                 max_queued_per_user: int = LLM_MAX_QUEUED_PER_USER, queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        self._active = 0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def _update_gauges(self) -> None:
+        queue_depth.set(self._queued)
+        active_generations.set(self._active)
+
+    def _grant(self, ticket: _Ticket) -> None:
+        ticket.state = "granted"
+        self._active += 1
+        queue_wait.observe(time.monotonic() - ticket.enqueued_at)
+        ticket.event.set()
+        if ticket.future is not None:
+            ticket.loop.call_soon_threadsafe(_resolve, ticket.future)
+
+    def _enqueue(self, user_id: str, loop: Optional[asyncio.AbstractEventLoop] = None) -> _Ticket:
+        ticket = _Ticket(user_id, loop)
+        with self._lock:
+            if self._active < self.max_concurrent and not self._queued:
+                self._grant(ticket)
+            else:
+                user_queue = self._queues.get(user_id)
+                if self._queued >= self.max_queue:
+                    reason = "queue_full"
+                elif user_queue and len(user_queue) >= self.max_queued_per_user:
+                    reason = "user_limit"
+                else:
+                    reason = None
+                if reason:
+                    rejections.inc(reason=reason)
+                    raise SchedulerOverloaded(f"Generation queue is full ({reason})")
+                if user_queue is None:
+                    user_queue = self._queues[user_id] = deque()
+                user_queue.append(ticket)
+                self._queued += 1
+            self._update_gauges()
+        return ticket
+
+    def _grant_waiting(self) -> None:
+        # Round-robin: serve the head of the least recently served user's queue
+        while self._active < self.max_concurrent and self._queues:
+            user_id, user_queue = next(iter(self._queues.items()))
+            ticket = user_queue.popleft()
+            self._queued -= 1
+            if user_queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            self._grant(ticket)
+
+    def release(self, ticket: _Ticket) -> None:
+        """Give the slot back and hand it to the next user in line"""
+        with self._lock:
+            if ticket.state != "granted":
+                return
+            ticket.state = "done"
+            self._active -= 1
+            self._grant_waiting()
+            self._update_gauges()
+
+    def _dequeue(self, ticket: _Ticket, timed_out: bool = False) -> bool:
+        """Take a still-waiting ticket out of its queue; False if it was granted meanwhile"""
+        with self._lock:
+            if ticket.state != "queued":
+                return False
+            user_queue = self._queues[ticket.user_id]
+            user_queue.remove(ticket)
+            if not user_queue:
+                del self._queues[ticket.user_id]
+            self._queued -= 1
+            ticket.state = "cancelled"
+            if timed_out:
+                rejections.inc(reason="timeout")
+            else:
+                cancellations.inc()
+            self._update_gauges()
+            return True
+
+    def _abandon(self, ticket: _Ticket, timed_out: bool = False) -> None:
+        """Drop a ticket whose requester went away; frees the slot if it was granted meanwhile"""
+        if not self._dequeue(ticket, timed_out):
+            self.release(ticket)
+
+    @contextmanager
+    def slot(self, user_id: str, timeout: Optional[float] = None,
+             on_wait: Optional[Callable[[int, float], None]] = None):
+        """Hold a generation slot for the duration of the block (blocking wait)
+
+        on_wait(queued, waited_seconds) is called about twice a second while
+        queued; if it raises (e.g. Streamlit stopping a dead session's script)
+        the request leaves the queue.
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        ticket = self._enqueue(user_id)
+        try:
+            while not ticket.event.wait(0.5):
+                waited = time.monotonic() - ticket.enqueued_at
+                if waited >= timeout and self._dequeue(ticket, timed_out=True):
+                    raise SchedulerTimeout(f"No generation slot within {timeout:.0f}s")
+                if on_wait:
+                    on_wait(self._queued, waited)
+        except SchedulerTimeout:
+            raise
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    async def acquire(self, user_id: str, timeout: Optional[float] = None,
+                      is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+                      poll_interval: float = 0.5) -> _Ticket:
+        """Wait for a slot without blocking the event loop; pair with release()
+
+        Cancelling the awaiting task leaves the queue. ASGI servers do not
+        cancel a handler when its client disconnects, so pass
+        is_disconnected (e.g. Request.is_disconnected) to have it polled
+        while queued; ClientDisconnected is raised once it returns True.
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        ticket = self._enqueue(user_id, asyncio.get_running_loop())
+        deadline = ticket.enqueued_at + timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                try:
+                    # Shielded so a poll timeout does not cancel the grant
+                    await asyncio.wait_for(asyncio.shield(ticket.future),
+                                           min(remaining, poll_interval) if is_disconnected else remaining)
+                    return ticket
+                except asyncio.TimeoutError:
+                    if is_disconnected and await is_disconnected():
+                        raise ClientDisconnected("Client disconnected while queued for a generation slot")
+        except asyncio.TimeoutError:
+            self._abandon(ticket, timed_out=True)
+            raise SchedulerTimeout(f"No generation slot within {timeout:.0f}s")
+        except BaseException:
+            self._abandon(ticket)
+            raise
+
+    @asynccontextmanager
+    async def aslot(self, user_id: str, timeout: Optional[float] = None):
+        """Async version of slot()"""
+        ticket = await self.acquire(user_id, timeout)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> GenerationScheduler:
+    """Process-wide scheduler shared by every session in front of the single LLM"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GenerationScheduler()
+        return _scheduler
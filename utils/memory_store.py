@@ -0,0 +1,330 @@
+
+import os
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from utils.vectorstore import (
+    append_to_vectorstore,
+    create_empty_vectorstore,
+    exclusive_writer,
+    load_vectorstore,
+    save_vectorstore,
+    WRITER_LOCK_FILE
+)
+from utils.ann_index import delete_from_vectorstore, empty_like, live_rows
+from utils.metrics import registry, timed
+
+logger = logging.getLogger(__name__)
+
+MEMORY_INDEX_DIR = os.getenv("MEMORY_INDEX_DIR", "index/memory")
+MEMORY_LOADED_USERS = int(os.getenv("MEMORY_LOADED_USERS", 64))
+MEMORY_MAX_PER_USER = int(os.getenv("MEMORY_MAX_PER_USER", 500))
+MEMORY_TTL_DAYS = float(os.getenv("MEMORY_TTL_DAYS", 90))  # 0 keeps memories until the cap pushes them out
+MEMORY_COMPACT_AFTER_DAYS = float(os.getenv("MEMORY_COMPACT_AFTER_DAYS", 7))  # 0 disables compaction
+MEMORY_COMPACT_BATCH = int(os.getenv("MEMORY_COMPACT_BATCH", 8))
+# Rebuild an index in place once this share of the vectors it held has been deleted
+MEMORY_REBUILD_RATIO = float(os.getenv("MEMORY_REBUILD_RATIO", 0.25))
+MEMORY_MAINTENANCE_INTERVAL = float(os.getenv("MEMORY_MAINTENANCE_INTERVAL", 3600))  # 0 disables the sweep
+# Users share this many locks (by hash), so lock memory does not grow with the user count
+MEMORY_LOCK_STRIPES = int(os.getenv("MEMORY_LOCK_STRIPES", 64))
+
+MEMORY_TYPE = "chat_memory"
+SUMMARY_TYPE = "chat_memory_summary"
+SUMMARY_ANSWER_CHARS = 240
+
+evicted = registry.counter("rag_memory_evicted_total", "Chat memories deleted from the per-user indexes")
+compacted = registry.counter("rag_memory_compacted_total", "Chat memories merged into summaries")
+rebuilds = registry.counter("rag_memory_rebuilds_total", "Per-user memory indexes rebuilt after deletions")
+
+
+def merge_memories(docs: List[Document]) -> str:
+    """Fold several Q&A memories into one summary: every question, each answer trimmed"""
+    lines = ["Summary of earlier conversation:"]
+    for doc in docs:
+        question, _, answer = doc.page_content.partition("\nA: ")
+        answer = " ".join(answer.split())
+        if len(answer) > SUMMARY_ANSWER_CHARS:
+            answer = answer[:SUMMARY_ANSWER_CHARS].rsplit(" ", 1)[0] + " ..."
+        lines.append(f"- {question[len('Q: '):] if question.startswith('Q: ') else question} -> {answer}")
+    return "\n".join(lines)
+
+
+def _created_at(entry) -> float:
+    return entry[1].metadata.get("created_at", 0.0)
+
+
+class UserMemoryStore:
+    """Chat memory kept in one small FAISS index per user, separate from document chunks
+
+    Searches only touch the asking user's index, so their cost depends on that
+    user's history alone and other users' Q&A can never be returned. Recently
+    used indexes stay in memory; the rest are loaded from disk on demand.
+
+    Each user keeps at most max_per_user memories and none older than
+    ttl_days. Memories older than compact_after_days are merged in groups of
+    compact_batch into single summary entries, and an index that has lost
+    rebuild_ratio of its vectors to deletions is rebuilt to give the memory back.
+    """
+
+    def __init__(self, embeddings: Embeddings, index_dir: str = MEMORY_INDEX_DIR,
+                 max_loaded: int = MEMORY_LOADED_USERS, max_per_user: int = MEMORY_MAX_PER_USER,
+                 ttl_days: float = MEMORY_TTL_DAYS, compact_after_days: float = MEMORY_COMPACT_AFTER_DAYS,
+                 compact_batch: int = MEMORY_COMPACT_BATCH, rebuild_ratio: float = MEMORY_REBUILD_RATIO,
+                 summarize: Callable[[List[Document]], str] = merge_memories):
+        self.embeddings = embeddings
+        self.index_dir = index_dir
+        self.max_loaded = max_loaded
+        self.max_per_user = max_per_user
+        self.ttl = ttl_days * 86400
+        self.compact_after = compact_after_days * 86400
+        self.compact_batch = max(2, compact_batch)
+        self.rebuild_ratio = rebuild_ratio
+        self.summarize = summarize
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+        self._user_locks = [threading.Lock() for _ in range(max(1, MEMORY_LOCK_STRIPES))]
+        self._maintenance_started = False
+
+    def user_dir(self, user_id: str) -> str:
+        # Hash user ids so they are always safe directory names
+        return os.path.join(self.index_dir, hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32])
+
+    def user_lock(self, user_id: str) -> threading.Lock:
+        # Never hold two of these at once: two users may share a stripe
+        return self._user_locks[hash(user_id) % len(self._user_locks)]
+
+    def get(self, user_id: str, create: bool = False, cache: bool = True) -> Optional[FAISS]:
+        """The user's memory index, loading it from disk if needed
+
+        cache=False leaves the LRU alone, so a sweep over every user does not
+        push the active ones out.
+        """
+        with self._lock:
+            store = self._stores.get(user_id)
+            if store is not None:
+                if cache:
+                    self._stores.move_to_end(user_id)
+                return store
+
+        store = load_vectorstore(self.user_dir(user_id), self.embeddings)
+        if not cache:
+            return store
+        if store is None:
+            if not create:
+                return None
+            store = create_empty_vectorstore(self.embeddings)
+
+        with self._lock:
+            # Another thread may have loaded it meanwhile; keep the first copy
+            store = self._stores.setdefault(user_id, store)
+            self._stores.move_to_end(user_id)
+            while len(self._stores) > self.max_loaded:
+                self._stores.popitem(last=False)
+        return store
+
+    def add(self, user_id: str, question: str, answer: str) -> str:
+        """Embed a Q&A pair into the user's index and persist it
+
+        Runs under the user dir's writer lock on top of the newest snapshot,
+        so API workers and UI sessions in other processes keep each other's memories.
+        """
+        with self.user_lock(user_id), exclusive_writer(self.get(user_id, create=True), self.user_dir(user_id)) as store:
+            metadata = {
+                "user_id": user_id,
+                "type": MEMORY_TYPE,
+                "question": question,
+                "created_at": time.time(),
+            }
+            ids = append_to_vectorstore(store, [f"Q: {question}\nA: {answer}"], metadatas=[metadata])
+            self._evict(store)
+            self._rebuild_if_fragmented(store)
+            save_vectorstore(store, self.user_dir(user_id))
+            return ids[0]
+
+    def search(self, user_id: str, question: str, k: int = 2) -> List[Document]:
+        return self.search_by_vector(user_id, self.embeddings.embed_query(question), k=k)
+
+    def search_by_vector(self, user_id: str, vector: List[float], k: int = 2) -> List[Document]:
+        store = self.get(user_id)
+        if store is None:
+            return []
+        with self.user_lock(user_id):
+            if store.index.ntotal == 0:
+                return []
+            return store.similarity_search_by_vector(vector, k=k)
+
+    def _entries(self, store: FAISS) -> List[tuple]:
+        """(doc_id, document) for every memory in the index"""
+        entries = []
+        for doc_id in store.index_to_docstore_id.values():
+            doc = store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                entries.append((doc_id, doc))
+        return entries
+
+    def _delete(self, store: FAISS, ids: List[str]) -> None:
+        delete_from_vectorstore(store, ids)
+        store.deleted_since_rebuild = getattr(store, "deleted_since_rebuild", 0) + len(ids)
+
+    def _evict(self, store: FAISS, now: Optional[float] = None) -> int:
+        """Delete memories past the TTL, then the oldest beyond the per-user cap"""
+        now = time.time() if now is None else now
+        entries = sorted(self._entries(store), key=_created_at)
+        expired = [entry[0] for entry in entries if self.ttl and now - _created_at(entry) > self.ttl]
+        remaining = entries[len(expired):]
+        over_cap = [doc_id for doc_id, _ in remaining[:max(0, len(remaining) - self.max_per_user)]]
+        if expired:
+            self._delete(store, expired)
+            evicted.inc(len(expired), reason="ttl")
+        if over_cap:
+            self._delete(store, over_cap)
+            evicted.inc(len(over_cap), reason="cap")
+        return len(expired) + len(over_cap)
+
+    def _compact(self, store: FAISS, user_id: str, now: Optional[float] = None) -> int:
+        """Merge old Q&A memories, compact_batch at a time, into summary entries
+
+        Summaries themselves are never merged again; the TTL and cap retire them.
+        """
+        if not self.compact_after:
+            return 0
+        now = time.time() if now is None else now
+        old = sorted(
+            (entry for entry in self._entries(store)
+             if entry[1].metadata.get("type", MEMORY_TYPE) == MEMORY_TYPE
+             and now - _created_at(entry) > self.compact_after),
+            key=_created_at
+        )
+        merged = 0
+        # A trailing partial group waits until it fills up
+        for start in range(0, len(old) - self.compact_batch + 1, self.compact_batch):
+            group = old[start:start + self.compact_batch]
+            docs = [doc for _, doc in group]
+            metadata = {
+                "user_id": user_id,
+                "type": SUMMARY_TYPE,
+                "question": docs[0].metadata.get("question", ""),
+                "created_at": _created_at(group[-1]),
+                "merged": len(group),
+            }
+            append_to_vectorstore(store, [self.summarize(docs)], metadatas=[metadata])
+            self._delete(store, [doc_id for doc_id, _ in group])
+            merged += len(group)
+        if merged:
+            compacted.inc(merged)
+        return merged
+
+    def _rebuild_if_fragmented(self, store: FAISS) -> bool:
+        """Copy the index and docstore into right-sized new ones after many deletions
+
+        Removing ids shrinks an index and the docstore dict logically but
+        neither hands its allocation back. The new index has the old one's
+        type and metric.
+        """
+        deleted = getattr(store, "deleted_since_rebuild", 0)
+        if not deleted or deleted < self.rebuild_ratio * (store.index.ntotal + deleted):
+            return False
+        ids, vectors = live_rows(store)
+        index = empty_like(store.index)
+        if len(ids):
+            index.add(vectors)
+        store.docstore = InMemoryDocstore({doc_id: store.docstore.search(doc_id) for doc_id in ids})
+        store.index_to_docstore_id = dict(enumerate(ids))
+        store.index = index
+        store.deleted_since_rebuild = 0
+        rebuilds.inc()
+        return True
+
+    def maintain(self, user_id: str, now: Optional[float] = None, store: Optional[FAISS] = None) -> dict:
+        """Evict, compact and defragment one user's memory; persists only if something changed
+
+        store is a copy the caller already loaded from disk; it is used unless
+        the user's index is loaded in the LRU. Either way it is re-based onto
+        the newest snapshot under the user dir's writer lock first.
+        """
+        user_dir = self.user_dir(user_id)
+        with self.user_lock(user_id), timed("memory_maintenance"):
+            with self._lock:
+                store = self._stores.get(user_id, store)
+            if store is None:
+                store = self.get(user_id, cache=False)
+            if store is None:
+                return {"evicted": 0, "compacted": 0, "rebuilt": False}
+            with exclusive_writer(store, user_dir):
+                removed = self._evict(store, now)
+                merged = self._compact(store, user_id, now)
+                rebuilt = self._rebuild_if_fragmented(store)
+                if store.index.ntotal == 0:
+                    # Nothing left to remember: drop the user's index entirely
+                    with self._lock:
+                        self._stores.pop(user_id, None)
+                    self._drop_index(user_dir)
+                elif removed or merged or rebuilt:
+                    save_vectorstore(store, user_dir)
+            return {"evicted": removed, "compacted": merged, "rebuilt": rebuilt}
+
+    @staticmethod
+    def _drop_index(user_dir: str) -> None:
+        # The lock file stays: a writer in another process may be waiting on it
+        for name in os.listdir(user_dir):
+            if name == WRITER_LOCK_FILE:
+                continue
+            path = os.path.join(user_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def maintain_all(self, now: Optional[float] = None) -> dict:
+        """Run maintenance for every user with a memory index on disk"""
+        totals = {"users": 0, "evicted": 0, "compacted": 0, "rebuilt": 0}
+        if not os.path.isdir(self.index_dir):
+            return totals
+        for name in os.listdir(self.index_dir):
+            # Directory names are hashes; the user id comes from the stored entries
+            store = load_vectorstore(os.path.join(self.index_dir, name), self.embeddings)
+            if store is None:
+                continue
+            entries = self._entries(store)
+            if not entries:
+                self._drop_index(os.path.join(self.index_dir, name))
+                continue
+            try:
+                result = self.maintain(entries[0][1].metadata["user_id"], now, store=store)
+            except Exception as e:
+                logger.warning(f"Memory maintenance failed for {name}: {str(e)}")
+                continue
+            totals["users"] += 1
+            totals["evicted"] += result["evicted"]
+            totals["compacted"] += result["compacted"]
+            totals["rebuilt"] += int(result["rebuilt"])
+        logger.info(
+            f"Memory maintenance: {totals['users']} users, {totals['evicted']} evicted, "
+            f"{totals['compacted']} compacted, {totals['rebuilt']} rebuilt"
+        )
+        return totals
+
+    def start_maintenance(self, interval: float = MEMORY_MAINTENANCE_INTERVAL) -> None:
+        """Sweep all users every interval seconds from a daemon thread (once per store)"""
+        with self._lock:
+            if self._maintenance_started or not interval:
+                return
+            self._maintenance_started = True
+
+        def sweep_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.maintain_all()
+                except Exception as e:
+                    logger.warning(f"Memory maintenance sweep failed: {str(e)}")
+
+        threading.Thread(target=sweep_loop, name="memory-maintenance", daemon=True).start()
@@ -0,0 +1,284 @@
+
+import os
+import time
+import logging
+import threading
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Serve /metrics on this port; 0 disables the endpoint
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# Rewrite this file periodically for node_exporter's textfile collector; empty disables it
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 15))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+STAGE_METRIC = "rag_stage_duration_seconds"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, "" if value is None else str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = [(name, value) for name, value in key + extra if value != ""]
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="' + value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(key)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, Prometheus style"""
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def snapshot(self, **labels) -> Optional[dict]:
+        """Count and sum for one label set, for logs and tests"""
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            return None if series is None else {"count": series[-2], "sum": series[-1]}
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        for key, values in series:
+            for bound, count in zip(self.buckets, values):
+                yield f"{self.name}_bucket{_format_labels(key, (('le', repr(bound)),))} {count}"
+            yield f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {values[-2]}"
+            yield f"{self.name}_count{_format_labels(key)} {values[-2]}"
+            yield f"{self.name}_sum{_format_labels(key)} {values[-1]}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help_text: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+stage_duration = registry.histogram(STAGE_METRIC, "Time spent in each pipeline stage")
+stage_errors = registry.counter("rag_stage_errors_total", "Pipeline stage failures")
+
+
+def _stage_labels(stage: str, document: Optional[str], search_type: Optional[str]) -> dict:
+    return {"stage": stage, "document": document, "search_type": search_type}
+
+
+def observe_stage(stage: str, seconds: float, document: Optional[str] = None, search_type: Optional[str] = None) -> None:
+    """Record a duration measured elsewhere, e.g. time to first token"""
+    if METRICS_ENABLED:
+        stage_duration.observe(seconds, **_stage_labels(stage, document, search_type))
+
+
+class timed:
+    """Time a stage, as a context manager or a decorator
+
+        with timed("search", search_type="mmr"):
+            ...
+
+        @timed("db_write")
+        def flush(): ...
+    """
+
+    __slots__ = ("stage", "document", "search_type", "_started")
+
+    def __init__(self, stage: str, document: Optional[str] = None, search_type: Optional[str] = None):
+        self.stage = stage
+        self.document = document
+        self.search_type = search_type
+
+    def __enter__(self):
+        self._started = time.perf_counter() if METRICS_ENABLED else None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._started is None:
+            return False
+        labels = _stage_labels(self.stage, self.document, self.search_type)
+        stage_duration.observe(time.perf_counter() - self._started, **labels)
+        if exc_type is not None:
+            stage_errors.inc(**labels)
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(self.stage, self.document, self.search_type):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+def timed_iter(items: Iterable, stage: str, document: Optional[str] = None) -> Iterator:
+    """Pass items through, recording the total time spent producing them as one observation
+
+    For streaming stages (parse, split) whose work happens inside next().
+    """
+    if not METRICS_ENABLED:
+        yield from items
+        return
+    spent = 0.0
+    iterator = iter(items)
+    failed = False
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                spent += time.perf_counter() - started
+                break
+            except Exception:
+                failed = True
+                raise
+            spent += time.perf_counter() - started
+            yield item
+    finally:
+        labels = _stage_labels(stage, document, None)
+        stage_duration.observe(spent, **labels)
+        if failed:
+            stage_errors.inc(**labels)
+
+
+def write_textfile(path: str = METRICS_TEXTFILE) -> None:
+    """Atomically rewrite the metrics file read by node_exporter's textfile collector"""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_metrics_exporter(port: int = METRICS_PORT, textfile: str = METRICS_TEXTFILE,
+                           interval: float = METRICS_FLUSH_INTERVAL) -> None:
+    """Start the /metrics endpoint and/or textfile writer once per process"""
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started or not METRICS_ENABLED:
+            return
+        _exporter_started = True
+    if port:
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Serving metrics on :{port}/metrics")
+        except OSError as e:
+            # Another worker process already owns the port
+            logger.warning(f"Metrics endpoint not started on port {port}: {str(e)}")
+    if textfile:
+        def flush_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    write_textfile(textfile)
+                except OSError as e:
+                    logger.warning(f"Could not write metrics file {textfile}: {str(e)}")
+        threading.Thread(target=flush_loop, name="metrics-textfile", daemon=True).start()
@@ -1,15 +1,29 @@
 
 import os
+import re
+import time
 import logging
+import tempfile
+import multiprocessing
 import streamlit as st
-from typing import Union
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 from io import BytesIO
-from unstructured.partition.pdf import partition_pdf
-from unstructured.partition.utils.constants import PartitionStrategy
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from utils.metrics import observe_stage
 
 logger = logging.getLogger(__name__)
 
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", os.cpu_count() or 1))
+PDF_PAGES_PER_RANGE = int(os.getenv("PDF_PAGES_PER_RANGE", 8))
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+
+# The splitter cuts on paragraph breaks first and keeps each break at the
+# start of the piece that follows it
+_PARAGRAPH_BREAK = re.compile("\n\n")
+
+
 def validate_pdf(file: Union[str, BytesIO]) -> None:
     """Validate PDF file before processing
     
@@ -39,23 +53,243 @@ def validate_pdf(file: Union[str, BytesIO]) -> None:
     if file_size > max_size:
         raise ValueError(f"File too large. Max size: {max_size/1024/1024}MB")
 
-def extract_content_from_pdf(file_path: str, figures_dir: str = "temp/figures") -> str:
-    """Extract and structure PDF content"""
-    os.makedirs(figures_dir, exist_ok=True)
-    
-    elements = partition_pdf(
-        file_path,
+def _get_splitter(
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    add_start_index: bool = False
+) -> "RecursiveCharacterTextSplitter":
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        add_start_index=add_start_index
+    )
+
+
+def _partition_kwargs(figures_dir: str) -> dict:
+    from unstructured.partition.utils.constants import PartitionStrategy
+
+    return dict(
         strategy=PartitionStrategy.FAST,
         extract_image_block_types=["Image", "Table"],
         extract_image_block_output_dir=figures_dir,
         max_image_size=400
     )
-    
+
+
+def _page_ranges(page_count: int, pages_per_range: int) -> List[Tuple[int, int]]:
+    """Split [0, page_count) into consecutive half-open page ranges"""
+    return [
+        (start, min(start + pages_per_range, page_count))
+        for start in range(0, page_count, pages_per_range)
+    ]
+
+
+def _partition_page_range(file_path: str, start: int, end: int, figures_dir: str) -> List[dict]:
+    """Partition pages [start, end) by copying them into a standalone PDF"""
+    from pypdf import PdfReader, PdfWriter
+    # unstructured is slow to import, so it loads on the first parse (in each worker)
+    from unstructured.partition.pdf import partition_pdf
+
+    reader = PdfReader(file_path)
+    writer = PdfWriter()
+    for page in range(start, end):
+        writer.add_page(reader.pages[page])
+
+    # Separate figure folders keep per-range image file names from colliding
+    range_figures_dir = os.path.join(figures_dir, f"pages_{start + 1:05d}-{end:05d}")
+    os.makedirs(range_figures_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        range_path = os.path.join(tmp_dir, "range.pdf")
+        with open(range_path, "wb") as f:
+            writer.write(f)
+        elements = partition_pdf(
+            range_path,
+            starting_page_number=start + 1,
+            **_partition_kwargs(range_figures_dir)
+        )
+    return [element.to_dict() for element in elements]
+
+
+def _partition_range_isolated(file_path: str, start: int, end: int, figures_dir: str) -> List[dict]:
+    """Worker entry point: partition a page range, falling back to single pages on failure"""
+    try:
+        return _partition_page_range(file_path, start, end, figures_dir)
+    except Exception as e:
+        if end - start == 1:
+            logger.warning(f"Skipping page {start + 1} of {file_path}: {str(e)}")
+            return []
+        logger.warning(f"Pages {start + 1}-{end} failed ({str(e)}), retrying page by page")
+
+    elements = []
+    for page in range(start, end):
+        try:
+            elements.extend(_partition_page_range(file_path, page, page + 1, figures_dir))
+        except Exception as e:
+            logger.warning(f"Skipping page {page + 1} of {file_path}: {str(e)}")
+    return elements
+
+
+def iter_elements_from_pdf(
+    file_path: str,
+    figures_dir: str = "temp/figures",
+    workers: int = PDF_PARSE_WORKERS,
+    pages_per_range: int = PDF_PAGES_PER_RANGE
+) -> Iterator[dict]:
+    """Yield element dicts in page order as page ranges finish parsing"""
+    os.makedirs(figures_dir, exist_ok=True)
+
+    from pypdf import PdfReader
+    page_count = len(PdfReader(file_path).pages)
+    ranges = _page_ranges(page_count, max(1, pages_per_range))
+
+    if workers <= 1 or len(ranges) <= 1:
+        from unstructured.partition.pdf import partition_pdf
+
+        for element in partition_pdf(file_path, **_partition_kwargs(figures_dir)):
+            yield element.to_dict()
+        return
+
+    workers = min(workers, len(ranges))
+    # spawn avoids forking Streamlit's threads into the workers
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        # Keep a bounded window of ranges in flight so parsed results
+        # cannot pile up faster than the consumer takes them
+        pending = deque()
+        remaining = iter(ranges)
+        for start, end in remaining:
+            pending.append((start, end, pool.submit(_partition_range_isolated, file_path, start, end, figures_dir)))
+            if len(pending) >= workers * 2:
+                break
+
+        while pending:
+            start, end, future = pending.popleft()
+            next_range = next(remaining, None)
+            if next_range is not None:
+                pending.append((*next_range, pool.submit(_partition_range_isolated, file_path, *next_range, figures_dir)))
+            try:
+                yield from future.result()
+            except Exception as e:
+                logger.error(f"Pages {start + 1}-{end} of {file_path} could not be parsed: {str(e)}")
+
+
+def extract_elements_from_pdf(
+    file_path: str,
+    figures_dir: str = "temp/figures",
+    workers: int = PDF_PARSE_WORKERS,
+    pages_per_range: int = PDF_PAGES_PER_RANGE
+) -> List[dict]:
+    """Partition a PDF into element dicts in page order, in parallel when it pays off"""
+    return list(iter_elements_from_pdf(file_path, figures_dir, workers, pages_per_range))
+
+
+def _paragraph_bounds(text: str, position: int) -> Tuple[int, int]:
+    """Start (at its leading break) and end of the splitter's paragraph containing position"""
+    start, end = 0, len(text)
+    for match in _PARAGRAPH_BREAK.finditer(text):
+        if match.start() > position:
+            end = match.start()
+            break
+        start = match.start()
+    return start, end
+
+
+def iter_chunks(
+    elements: Iterable[dict],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    document: Optional[str] = None
+) -> Iterator[Tuple[str, dict]]:
+    """Incrementally split a stream of elements into (chunk, metadata) pairs
+
+    Only a few chunks' worth of text is buffered: everything except the last
+    chunk is emitted, and the paragraph the last one starts in is carried
+    over so it can grow into the text that follows. Chunks from a paragraph
+    longer than chunk_size are final, since the splitter cuts such a
+    paragraph on its own. Either way the output matches what splitting the
+    whole document would give. Time spent splitting (not waiting for
+    elements) is recorded as the "split" stage once the stream ends.
+    """
+    splitter = _get_splitter(chunk_size, chunk_overlap, add_start_index=True)
+    flush_at = chunk_size * 4
+    buffer = ""
+    offset = 0        # document offset of buffer[0]
+    page_marks = []   # (buffer offset, page number) where each element starts
+    chunk_index = 0
+    split_seconds = 0.0
+
+    def page_at(position):
+        page = None
+        for mark, number in page_marks:
+            if mark > position:
+                break
+            page = number
+        return page
+
+    def split(final):
+        nonlocal buffer, offset, page_marks, chunk_index, split_seconds
+        started = time.perf_counter()
+        docs = splitter.create_documents([buffer])
+        split_seconds += time.perf_counter() - started
+        keep = docs
+        carry_from = len(buffer)
+        if not final and docs:
+            # The last chunk runs to the end of the buffer; its start_index can
+            # point at an earlier copy of the same text
+            carry_from, paragraph_end = _paragraph_bounds(buffer, buffer.rfind(docs[-1].page_content))
+            if paragraph_end - carry_from >= chunk_size:
+                carry_from = paragraph_end
+            else:
+                keep = docs[:-1]
+        for doc in keep:
+            start = doc.metadata["start_index"]
+            yield doc.page_content, {
+                "chunk_index": chunk_index,
+                "start_index": offset + start,
+                "page_number": page_at(start),
+            }
+            chunk_index += 1
+        if final or not docs:
+            buffer, page_marks = "", []
+            return
+        carried_page = page_at(carry_from)
+        buffer = buffer[carry_from:]
+        offset += carry_from
+        page_marks = [(mark - carry_from, page) for mark, page in page_marks if mark > carry_from]
+        page_marks.insert(0, (0, carried_page))
+
+    for element in elements:
+        text = (element.get("text") or "").strip()
+        if not text:
+            continue
+        # The break belongs to the next paragraph even when nothing was carried over
+        if buffer or offset:
+            buffer += "\n\n"
+        page_marks.append((len(buffer), element.get("metadata", {}).get("page_number")))
+        buffer += text
+        if len(buffer) >= flush_at:
+            yield from split(final=False)
+
+    if buffer:
+        yield from split(final=True)
+    observe_stage("split", split_seconds, document=document)
+
+
+def extract_content_from_pdf(file_path: str, figures_dir: str = "temp/figures") -> str:
+    """Extract and structure PDF content"""
+    elements = extract_elements_from_pdf(file_path, figures_dir)
+
     text_content = []
     for element in elements:
-        if hasattr(element, 'text') and element.text.strip():
-            text_content.append(element.text.strip())
-    
+        text = (element.get("text") or "").strip()
+        if text:
+            text_content.append(text)
+
     return "\n\n".join(text_content)
 
 
@@ -67,12 +301,7 @@ def process_pdf(file_path: str):
         validate_pdf(file_path)  # Add validation
         content = extract_content_from_pdf(file_path)
         
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
-            chunk_overlap=100,
-            length_function=len
-        )
-        return splitter.split_text(content)
+        return _get_splitter().split_text(content)
     
     except Exception as e:
         logger.error(f"PDF processing failed: {str(e)}")
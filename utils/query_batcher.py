@@ -0,0 +1,68 @@
+
+import os
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from utils.metrics import registry, timed
+
+logger = logging.getLogger(__name__)
+
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", 64))
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", 5))
+
+batch_sizes = registry.histogram(
+    "rag_query_embed_batch_size", "Queries per batched embedding call", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+
+class QueryBatcher:
+    """Groups query embeddings that arrive within a few milliseconds into one embedding call
+
+    The first query of a batch starts a short timer; everything that arrives
+    before it fires (or until max_batch is reached) is embedded together in a
+    worker thread. Must be used from a single event loop.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch: int = QUERY_BATCH_MAX,
+                 max_wait_ms: float = QUERY_BATCH_WAIT_MS):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._embed_batch(batch))
+
+    async def _embed_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Identical concurrent questions share one slot in the request
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        batch_sizes.observe(len(texts))
+        try:
+            with timed("query_embed_batch"):
+                vectors = await asyncio.to_thread(self.embeddings.embed_documents, texts)
+            by_text = dict(zip(texts, vectors))
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(by_text[text])
+        except Exception as e:
+            logger.error(f"Batched query embedding failed for {len(texts)} queries: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
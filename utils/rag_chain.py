@@ -1,8 +1,13 @@
 
 
+import os
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama.llms import OllamaLLM
 
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL")
+OLLAMA_KEEP_ALIVE = int(os.getenv("OLLAMA_KEEP_ALIVE", 1800))
+NUM_CTX = 2048
+
 template = """You are a helpful document assistant. Answer based on the context.
 Context: {context}
 Question: {question}
@@ -13,8 +18,10 @@ def setup_rag_chain():
     try:
         llm = OllamaLLM(
             model="llava:7b",
+            base_url=OLLAMA_BASE_URL,
             temperature=0.3,
-            num_ctx=2048
+            num_ctx=NUM_CTX,
+            keep_alive=OLLAMA_KEEP_ALIVE
         )
         prompt = ChatPromptTemplate.from_template(template)
         return prompt | llm
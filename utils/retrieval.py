@@ -0,0 +1,115 @@
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from utils.embedding_cache import normalize_text
+from utils.hybrid_search import hybrid_search
+from utils.vectorstore import SCORE_THRESHOLD
+from utils.rwlock import store_lock
+from utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", 256))
+MEMORY_RESULTS = 2
+
+
+class QueryEmbeddingCache:
+    """In-process LRU of query vectors, so a repeated question costs no embedding call"""
+
+    def __init__(self, max_entries: int = QUERY_EMBED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question: str) -> Optional[List[float]]:
+        key = normalize_text(question)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def put(self, question: str, vector: List[float]) -> None:
+        with self._lock:
+            self._entries[normalize_text(question)] = vector
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def embed(self, embeddings: Embeddings, question: str) -> List[float]:
+        vector = self.get(question)
+        if vector is None:
+            vector = embeddings.embed_query(question)
+            self.put(question, vector)
+        return vector
+
+
+_query_cache = QueryEmbeddingCache()
+_memory_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="memory-search")
+
+
+def search_documents_by_vector(
+    vector_store: FAISS,
+    question: str,
+    vector: List[float],
+    search_type: str = "similarity",
+    k: int = 4
+) -> List[Document]:
+    """Document search for every sidebar strategy, reusing an already-computed query vector"""
+    if search_type == "hybrid":
+        # Takes the store's read lock itself
+        return hybrid_search(vector_store, question, k=k, vector=vector)
+    with store_lock(vector_store).read():
+        if vector_store.index.ntotal == 0:
+            return []
+        if search_type == "mmr":
+            return vector_store.max_marginal_relevance_search_by_vector(vector, k=k)
+        if search_type == "similarity_score_threshold":
+            relevance = vector_store._select_relevance_score_fn()
+            scored = vector_store.similarity_search_with_score_by_vector(vector, k=k)
+            return [doc for doc, score in scored if relevance(score) >= SCORE_THRESHOLD]
+        return vector_store.similarity_search_by_vector(vector, k=k)
+
+
+class RetrievalCoordinator:
+    """Embeds each question once and searches chat memory and documents concurrently"""
+
+    def __init__(self, vector_store: FAISS, memory_store=None, query_cache: Optional[QueryEmbeddingCache] = None):
+        self.vector_store = vector_store
+        self.memory_store = memory_store
+        self.query_cache = query_cache or _query_cache
+
+    def embed_query(self, question: str) -> List[float]:
+        with timed("query_embed"):
+            return self.query_cache.embed(self.vector_store.embeddings, question)
+
+    def retrieve(
+        self,
+        question: str,
+        user_id: str,
+        search_type: str = "similarity",
+        k: int = 4,
+        memory_k: int = MEMORY_RESULTS,
+        vector: Optional[List[float]] = None
+    ) -> Tuple[List[Document], List[Document]]:
+        """Return (memory docs, document chunks) for the question
+
+        Pass vector when the question has already been embedded.
+        """
+        if vector is None:
+            vector = self.embed_query(question)
+        memory = None
+        if self.memory_store is not None:
+            memory = _memory_pool.submit(
+                timed("memory_search")(self.memory_store.search_by_vector), user_id, vector, memory_k
+            )
+        with timed("search", search_type=search_type):
+            doc_chunks = search_documents_by_vector(self.vector_store, question, vector, search_type, k)
+        memory_docs = memory.result() if memory is not None else []
+        return memory_docs, doc_chunks
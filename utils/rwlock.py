@@ -0,0 +1,58 @@
+
+import threading
+from contextlib import contextmanager, nullcontext
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer; waiting writers block new readers"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class _Unlocked:
+    def read(self):
+        return nullcontext()
+
+    def write(self):
+        return nullcontext()
+
+
+_UNLOCKED = _Unlocked()
+
+
+def store_lock(vector_store):
+    """The store's ReadWriteLock, or a no-op lock for stores that are not shared"""
+    return getattr(vector_store, "lock", None) or _UNLOCKED
@@ -0,0 +1,200 @@
+
+"""Deterministic local stand-ins for the Ollama model backends
+
+Run `python -m utils.stub_backends --port 11435` and point the app at it with
+OLLAMA_BASE_URL=http://127.0.0.1:11435 to exercise the full stack without models.
+"""
+
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import logging
+import threading
+from typing import Any, Iterator, List, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+logger = logging.getLogger(__name__)
+
+STUB_EMBED_DIM = 384
+
+
+def fake_completion(prompt: str, images: List[str] = None) -> str:
+    """Deterministic text for /api/generate: a caption for images, otherwise an answer"""
+    if images:
+        digest = hashlib.sha256("".join(images).encode("utf-8")).hexdigest()[:8]
+        return f"Stub caption: a figure with fingerprint {digest}."
+    question = prompt.strip().splitlines()[-1] if prompt.strip() else ""
+    return f"Stub answer ({len(prompt)} prompt characters). {question}".strip()
+
+
+def fake_embedding(text: str, dim: int = STUB_EMBED_DIM) -> List[float]:
+    """Unit vector derived from the text hash, identical across runs and processes"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeEmbeddings(Embeddings):
+    """In-process fake embedding model with optional per-call latency"""
+
+    def __init__(self, dim: int = STUB_EMBED_DIM, latency: float = 0.0, model: str = "stub-embed"):
+        self.dim = dim
+        self.latency = latency
+        self.model = model
+        self.calls = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [fake_embedding(text, self.dim) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeLLM(LLM):
+    """In-process fake LLM with configurable time to first token and per-token latency"""
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-llm"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        for word in fake_completion(prompt, kwargs.get("images")).split(" "):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = GenerationChunk(text=word + " ")
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class _StubOllamaHandler(BaseHTTPRequestHandler):
+    server_version = "StubOllama/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _maybe_fail(self) -> bool:
+        if random.random() < self.server.failure_rate:
+            self._send_json({"error": "stub failure"}, status=503)
+            return True
+        return False
+
+    def _generate(self, payload: dict) -> None:
+        model = payload.get("model", "stub-llm")
+        text = fake_completion(payload.get("prompt", ""), payload.get("images"))
+        if not payload.get("stream", True):
+            self._send_json({"model": model, "response": text, "done": True, "done_reason": "stop"})
+            return
+        # Newline-delimited JSON, one word per message, like the real server
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for word in text.split(" "):
+            self.wfile.write(json.dumps({"model": model, "response": word + " ", "done": False}).encode("utf-8") + b"\n")
+            self.wfile.flush()
+        self.wfile.write(json.dumps({"model": model, "response": "", "done": True, "done_reason": "stop"}).encode("utf-8") + b"\n")
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "stub-embed"}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self._maybe_fail():
+            return
+
+        if self.path == "/api/embed":
+            inputs = payload.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            with self.server.lock:
+                self.server.embed_requests += 1
+            self._send_json({
+                "model": payload.get("model", "stub-embed"),
+                "embeddings": [fake_embedding(text, self.server.dim) for text in inputs]
+            })
+        elif self.path == "/api/embeddings":
+            self._send_json({"embedding": fake_embedding(payload.get("prompt", ""), self.server.dim)})
+        elif self.path == "/api/generate":
+            with self.server.lock:
+                self.server.generate_requests += 1
+            self._generate(payload)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    """Minimal HTTP server speaking the subset of the Ollama API the app uses"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, dim: int = STUB_EMBED_DIM,
+                 latency: float = 0.0, failure_rate: float = 0.0):
+        super().__init__((host, port), _StubOllamaHandler)
+        self.dim = dim
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.embed_requests = 0
+        self.generate_requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubOllamaServer":
+        """Serve from a daemon thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run stub Ollama backends")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=STUB_EMBED_DIM)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StubOllamaServer(args.host, args.port, args.dim, args.latency, args.failure_rate)
+    logger.info(f"Stub Ollama listening on {server.base_url}")
+    server.serve_forever()
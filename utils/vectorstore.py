@@ -1,46 +1,408 @@
 
+import os
+import time
+import fcntl
+import shutil
+import pickle
+import logging
+import threading
+from contextlib import contextmanager
 from typing import List, Optional
 from langchain_ollama import OllamaEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.retrievers import BaseRetriever
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from utils.embedding_cache import EmbeddingCache, CachedEmbeddings
+from utils.embedding_executor import EmbeddingExecutor
+from utils.ann_index import apply_search_params, ensure_index_type, index_kind, restore_tombstones, target_kind
+from utils.lexical_index import BM25Index
+from utils.hybrid_search import HybridRetriever
+from utils.rwlock import ReadWriteLock, store_lock
+from utils.metrics import timed
 
+logger = logging.getLogger(__name__)
 
-def init_vectorstore() -> FAISS:
-    """Initialize FAISS vector store with a dummy doc"""
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-minilm")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL")
+OLLAMA_KEEP_ALIVE = int(os.getenv("OLLAMA_KEEP_ALIVE", 1800))
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "index/documents")
+# Map the index file read-only so worker processes share one copy through the page cache
+VECTOR_INDEX_MMAP = os.getenv("VECTOR_INDEX_MMAP", "false").lower() == "true"
+SNAPSHOTS_TO_KEEP = 2
+# Staging dirs this old were left by a save that crashed; younger ones may still be in progress
+SNAPSHOT_STAGING_MAX_AGE = float(os.getenv("SNAPSHOT_STAGING_MAX_AGE", 3600))
+# Every process that publishes snapshots to an index dir holds this file's flock while it writes
+WRITER_LOCK_FILE = ".writer.lock"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 256))
+SCORE_THRESHOLD = float(os.getenv("SCORE_THRESHOLD", 0.5))
+
+
+def get_embeddings() -> Embeddings:
+    """Build the embedding function: cache lookups first, then batched parallel requests"""
+    return CachedEmbeddings(
+        EmbeddingExecutor(OllamaEmbeddings(model=EMBED_MODEL, base_url=OLLAMA_BASE_URL, keep_alive=OLLAMA_KEEP_ALIVE)),
+        EmbeddingCache(),
+        model_name=EMBED_MODEL
+    )
+
+
+def log_cache_stats(vector_store: FAISS) -> None:
+    """Report embedding cache hit/miss counts, if the store uses the cache"""
+    cache = getattr(vector_store.embeddings, "cache", None)
+    if cache is not None:
+        stats = cache.stats()
+        logger.info(
+            f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} hit rate, {stats['entries']} entries)"
+        )
+
+
+def create_empty_vectorstore(embeddings: Embeddings) -> FAISS:
+    """Create an empty flat FAISS store sized for the embedding model"""
+    faiss = dependable_faiss_import()
+    dimension = len(embeddings.embed_query("dimension probe"))
+    return FAISS(
+        embedding_function=embeddings,
+        index=faiss.IndexFlatL2(dimension),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+
+
+def current_snapshot(index_dir: str) -> Optional[str]:
+    """Name of the snapshot the CURRENT pointer refers to, if any"""
     try:
-        embeddings = OllamaEmbeddings(model="all-minilm")
-        dummy_text = ["Initialize"]
-        return FAISS.from_texts(texts=dummy_text, embedding=embeddings)
-    except Exception as e:
-        raise Exception(f"Vector store initialization failed: {str(e)}")
+        with open(os.path.join(index_dir, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
 
 
-def add_to_vectorstore(vector_store: FAISS, chunks: List[str]) -> FAISS:
-    """Add plain text chunks to the vector store (e.g., from PDF)"""
+def load_vectorstore(index_dir: str, embeddings: Embeddings, mmap: bool = False) -> Optional[FAISS]:
+    """Load the current snapshot from disk, memory-mapping the index when requested
+
+    A mapped index keeps its vectors (flat, HNSW) or inverted lists (IVF) in
+    the file's pages, which every process mapping the same snapshot shares.
+    It cannot be modified in place; see exclusive_writer().
+    """
+    _prune_staging(index_dir)
+    snapshot = current_snapshot(index_dir)
+    if snapshot is None:
+        return None
+
+    faiss = dependable_faiss_import()
+    snapshot_dir = os.path.join(index_dir, snapshot)
+    index_path = os.path.join(snapshot_dir, "index.faiss")
+    # IO_FLAG_MMAP alone only maps IVF inverted lists and still copies flat and
+    # HNSW vectors into private memory; IO_FLAG_MMAP_IFC maps both
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None)
+    if mmap and mmap_flag is None:
+        logger.warning("This faiss build cannot memory-map flat or HNSW indexes; loading into memory")
+        mmap = False
+    if mmap:
+        try:
+            index = faiss.read_index(index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning(f"Index cannot be memory-mapped ({str(e)}); loading into memory")
+            index = faiss.read_index(index_path)
+            mmap = False
+    else:
+        index = faiss.read_index(index_path)
+    apply_search_params(index)
+    with open(os.path.join(snapshot_dir, "docstore.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    vector_store = FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id
+    )
+    restore_tombstones(vector_store)
+    lexical_path = os.path.join(snapshot_dir, "lexical.pkl")
+    if os.path.exists(lexical_path):
+        with open(lexical_path, "rb") as f:
+            vector_store.lexical_index = pickle.load(f)
+    vector_store.snapshot = snapshot
+    vector_store.read_only = mmap
+    vector_store.mmap = mmap
+    logger.info(f"Loaded vector store snapshot {snapshot} ({index.ntotal} vectors, mmap={mmap})")
+    return vector_store
+
+
+_held_writer_locks = threading.local()
+
+
+@contextmanager
+def index_write_lock(index_dir: str = VECTOR_INDEX_DIR):
+    """Exclusive writer lock on an index dir, across processes and threads
+
+    Re-entrant within a thread; the OS drops it if the holder dies.
+    """
+    held = getattr(_held_writer_locks, "dirs", None)
+    if held is None:
+        held = _held_writer_locks.dirs = {}
+    key = os.path.abspath(index_dir)
+    if key not in held:
+        os.makedirs(index_dir, exist_ok=True)
+        lock_file = open(os.path.join(index_dir, WRITER_LOCK_FILE), "a")
+        try:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info(f"Waiting for another writer of {index_dir}")
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except BaseException:
+            lock_file.close()
+            raise
+        held[key] = [0, lock_file]
+    held[key][0] += 1
+    try:
+        yield
+    finally:
+        held[key][0] -= 1
+        if not held[key][0]:
+            _, lock_file = held.pop(key)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+
+def rebase_vectorstore(vector_store: FAISS, index_dir: str = VECTOR_INDEX_DIR, mmap: bool = False) -> bool:
+    """Load the newest published snapshot into vector_store in place; True if it was reloaded
+
+    Must run under index_write_lock and before appending, otherwise the next
+    save would drop whatever another process published since this copy was
+    loaded. mmap chooses between a mapped (read-only) and a private copy.
+    """
+    snapshot = current_snapshot(index_dir)
+    if snapshot is None:
+        return False
+    if snapshot == getattr(vector_store, "snapshot", None) and getattr(vector_store, "read_only", False) == mmap:
+        return False
+    latest = load_vectorstore(index_dir, vector_store.embeddings, mmap=mmap)
+    if latest is None:
+        return False
+    if getattr(latest, "lexical_index", None) is None and getattr(vector_store, "lexical_index", None) is not None:
+        latest.lexical_index = BM25Index.from_vectorstore(latest)
+    with store_lock(vector_store).write():
+        vector_store.index = latest.index
+        vector_store.docstore = latest.docstore
+        vector_store.index_to_docstore_id = latest.index_to_docstore_id
+        vector_store.lexical_index = getattr(latest, "lexical_index", None)
+        vector_store.snapshot = latest.snapshot
+        vector_store.read_only = latest.read_only
+    logger.info(f"Re-based vector store onto snapshot {snapshot} ({latest.index.ntotal} vectors)")
+    return True
+
+
+@contextmanager
+def exclusive_writer(vector_store: FAISS, index_dir: str = VECTOR_INDEX_DIR):
+    """Hold the index dir's writer lock with vector_store re-based onto the newest snapshot
+
+    Wrap the whole read-modify-publish sequence (delete, append, save,
+    register) so concurrent writers cannot overwrite each other's snapshots.
+    A memory-mapped store is written through a private copy and maps the
+    published snapshot again afterwards.
+    """
+    mapped = getattr(vector_store, "mmap", False)
+    with index_write_lock(index_dir):
+        rebase_vectorstore(vector_store, index_dir)
+        try:
+            yield vector_store
+        finally:
+            if mapped:
+                rebase_vectorstore(vector_store, index_dir, mmap=True)
+
+
+def save_vectorstore(vector_store: FAISS, index_dir: str = VECTOR_INDEX_DIR) -> str:
+    """Atomically persist the index, docstore and id map as a new snapshot"""
+    if getattr(vector_store, "read_only", False):
+        raise Exception("Cannot save a read-only (memory-mapped) vector store")
     try:
-        new_vectorstore = FAISS.from_texts(texts=chunks, embedding=vector_store.embeddings)
+        faiss = dependable_faiss_import()
+        os.makedirs(index_dir, exist_ok=True)
+        snapshot = f"snapshot-{time.time_ns()}-{os.getpid()}"
+        staging_dir = os.path.join(index_dir, f".{snapshot}.tmp")
+        os.makedirs(staging_dir)
+
+        # Write everything into a staging directory, then publish it with renames
+        # so readers only ever see a complete snapshot
+        with store_lock(vector_store).read():
+            faiss.write_index(vector_store.index, os.path.join(staging_dir, "index.faiss"))
+            with open(os.path.join(staging_dir, "docstore.pkl"), "wb") as f:
+                pickle.dump((vector_store.docstore, vector_store.index_to_docstore_id), f)
+                f.flush()
+                os.fsync(f.fileno())
+            lexical_index = getattr(vector_store, "lexical_index", None)
+            if lexical_index is not None:
+                with open(os.path.join(staging_dir, "lexical.pkl"), "wb") as f:
+                    pickle.dump(lexical_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    f.flush()
+                    os.fsync(f.fileno())
+        os.rename(staging_dir, os.path.join(index_dir, snapshot))
 
-        if len(vector_store.index_to_docstore_id) > 0:
-            vector_store.merge_from(new_vectorstore)
+        pointer_tmp = os.path.join(index_dir, f".CURRENT.{os.getpid()}.tmp")
+        with open(pointer_tmp, "w") as f:
+            f.write(snapshot)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(index_dir, "CURRENT"))
+
+        vector_store.snapshot = snapshot
+        _prune_snapshots(index_dir)
+        logger.info(f"Saved vector store snapshot {snapshot} ({vector_store.index.ntotal} vectors)")
+        return snapshot
+    except Exception as e:
+        raise Exception(f"Failed to save vector store: {str(e)}")
+
+
+def _prune_snapshots(index_dir: str) -> None:
+    # Open memory maps stay valid after unlink, so older snapshots can go
+    snapshots = sorted(
+        name for name in os.listdir(index_dir)
+        if name.startswith("snapshot-")
+    )
+    for name in snapshots[:-SNAPSHOTS_TO_KEEP]:
+        shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+
+def _prune_staging(index_dir: str, max_age: float = SNAPSHOT_STAGING_MAX_AGE) -> None:
+    # Saves that died between staging and rename leave .snapshot-*.tmp dirs
+    # (and .CURRENT.*.tmp files) behind; nothing else ever removes them
+    try:
+        names = os.listdir(index_dir)
+    except FileNotFoundError:
+        return
+    now = time.time()
+    for name in names:
+        if not (name.startswith(".snapshot-") or name.startswith(".CURRENT.")) or not name.endswith(".tmp"):
+            continue
+        path = os.path.join(index_dir, name)
+        try:
+            if now - os.path.getmtime(path) < max_age:
+                continue
+        except FileNotFoundError:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
         else:
-            vector_store = new_vectorstore
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        logger.info(f"Removed stale snapshot staging entry {name}")
 
+
+def refresh_vectorstore(vector_store: FAISS, index_dir: str = VECTOR_INDEX_DIR) -> FAISS:
+    """Reload if another process has published a newer snapshot"""
+    if current_snapshot(index_dir) == getattr(vector_store, "snapshot", None):
+        return vector_store
+    refreshed = load_vectorstore(
+        index_dir,
+        vector_store.embeddings,
+        mmap=getattr(vector_store, "mmap", False)
+    )
+    if refreshed is None:
+        return vector_store
+    refreshed.lock = ReadWriteLock()
+    return refreshed
+
+
+def init_vectorstore(
+    index_dir: str = VECTOR_INDEX_DIR,
+    mmap: bool = VECTOR_INDEX_MMAP,
+    embeddings: Optional[Embeddings] = None
+) -> FAISS:
+    """Load the persisted FAISS store, or create an empty one on first run"""
+    try:
+        embeddings = embeddings or get_embeddings()
+        vector_store = load_vectorstore(index_dir, embeddings, mmap=mmap)
+        if vector_store is None:
+            vector_store = create_empty_vectorstore(embeddings)
+            vector_store.read_only = False
+            # Mapped from the first published snapshot on
+            vector_store.mmap = mmap
+        elif not mmap and target_kind(vector_store.index.ntotal, index_kind(vector_store.index)) != index_kind(vector_store.index):
+            # VECTOR_INDEX_TYPE changed since the snapshot was written
+            with exclusive_writer(vector_store, index_dir):
+                if ensure_index_type(vector_store):
+                    save_vectorstore(vector_store, index_dir)
+        if getattr(vector_store, "lexical_index", None) is None:
+            # Snapshots from before hybrid search have no lexical index yet
+            vector_store.lexical_index = BM25Index.from_vectorstore(vector_store)
+        # The document store is shared by every session in the process
+        vector_store.lock = ReadWriteLock()
         return vector_store
     except Exception as e:
-        raise Exception(f"Failed to add text chunks: {str(e)}")
+        raise Exception(f"Vector store initialization failed: {str(e)}")
 
 
-def add_documents_to_vectorstore(vector_store: FAISS, docs: List[Document]) -> FAISS:
-    """Add langchain Document objects to the vector store (e.g., chat memory)"""
+def append_to_vectorstore(
+    vector_store: FAISS,
+    texts: List[str],
+    metadatas: Optional[List[dict]] = None,
+    ids: Optional[List[str]] = None,
+    batch_size: int = EMBED_BATCH_SIZE,
+    document: Optional[str] = None
+) -> List[str]:
+    """Embed texts in batches and append them straight into the existing index and docstore
+
+    document only labels the embed/index stage metrics.
+    """
+    if getattr(vector_store, "read_only", False):
+        raise Exception("Cannot add to a read-only (memory-mapped) vector store")
+
+    added_ids = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        with timed("embed", document=document):
+            vectors = vector_store.embeddings.embed_documents(batch)
+        # Embed outside the lock; only the in-memory append excludes searches
+        with timed("index", document=document), store_lock(vector_store).write():
+            batch_ids = vector_store.add_embeddings(
+                text_embeddings=zip(batch, vectors),
+                metadatas=metadatas[start:start + batch_size] if metadatas else None,
+                ids=ids[start:start + batch_size] if ids else None
+            )
+            lexical_index = getattr(vector_store, "lexical_index", None)
+            if lexical_index is not None:
+                lexical_index.add_many(batch_ids, batch)
+        added_ids.extend(batch_ids)
+    return added_ids
+
+
+def add_to_vectorstore(
+    vector_store: FAISS,
+    chunks: List[str],
+    metadatas: Optional[List[dict]] = None,
+    ids: Optional[List[str]] = None,
+    batch_size: int = EMBED_BATCH_SIZE
+) -> FAISS:
+    """Add plain text chunks to the vector store (e.g., from PDF)"""
     try:
-        new_vectorstore = FAISS.from_documents(documents=docs, embedding=vector_store.embeddings)
+        append_to_vectorstore(vector_store, chunks, metadatas=metadatas, ids=ids, batch_size=batch_size)
+        log_cache_stats(vector_store)
+        return vector_store
+    except Exception as e:
+        raise Exception(f"Failed to add text chunks: {str(e)}")
 
-        if len(vector_store.index_to_docstore_id) > 0:
-            vector_store.merge_from(new_vectorstore)
-        else:
-            vector_store = new_vectorstore
 
+def add_documents_to_vectorstore(
+    vector_store: FAISS,
+    docs: List[Document],
+    batch_size: int = EMBED_BATCH_SIZE
+) -> FAISS:
+    """Add langchain Document objects to the vector store (e.g., chat memory)"""
+    try:
+        append_to_vectorstore(
+            vector_store,
+            [doc.page_content for doc in docs],
+            metadatas=[doc.metadata for doc in docs],
+            batch_size=batch_size
+        )
         return vector_store
     except Exception as e:
         raise Exception(f"Failed to add Document objects: {str(e)}")
@@ -54,6 +416,10 @@ def get_retriever(
     """Create retriever from the vector store"""
     if search_kwargs is None:
         search_kwargs = {"k": 4}
+    if search_type == "hybrid":
+        return HybridRetriever(vector_store=vector_store, **search_kwargs)
+    if search_type == "similarity_score_threshold":
+        search_kwargs = {"score_threshold": SCORE_THRESHOLD, **search_kwargs}
     return vector_store.as_retriever(
         search_type=search_type,
         search_kwargs=search_kwargs